@@ -0,0 +1,116 @@
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from captcha.helpers import noise_functions, filter_functions, makeimg
+
+# Distance of the drawn text from the top of the captcha image
+DISTANCE_FROM_TOP = 4
+
+
+def getsize(font, text):
+    if hasattr(font, "getbbox"):
+        _top, _left, _right, _bottom = font.getbbox(text)
+        return _right - _left, _bottom - _top
+    elif hasattr(font, "getoffset"):
+        return tuple([x + y for x, y in zip(font.getsize(text), font.getoffset(text))])
+    else:
+        return font.getsize(text)
+
+
+def render_image(text, key, scale=1):
+    """
+    绘制验证码图片，返回 PNG 数据
+    """
+    random.seed(key)  # Do not generate different images for the same key
+
+    if isinstance(settings.CAPTCHA_FONT_PATH, str):
+        fontpath = settings.CAPTCHA_FONT_PATH
+    elif isinstance(settings.CAPTCHA_FONT_PATH, (list, tuple)):
+        fontpath = random.choice(settings.CAPTCHA_FONT_PATH)
+    else:
+        raise ImproperlyConfigured(
+            "settings.CAPTCHA_FONT_PATH needs to be a path to a font or list of paths to fonts"
+        )
+
+    if fontpath.lower().strip().endswith("ttf"):
+        font = ImageFont.truetype(fontpath, settings.CAPTCHA_FONT_SIZE * scale)
+    else:
+        font = ImageFont.load(fontpath)
+
+    if settings.CAPTCHA_IMAGE_SIZE:
+        size = settings.CAPTCHA_IMAGE_SIZE
+    else:
+        size = getsize(font, text)
+        size = (size[0] * 2, int(size[1] * 1.4))
+
+    image = makeimg(size, settings.CAPTCHA_BACKGROUND_COLOR)
+    xpos = 2
+
+    charlist = []
+    for char in text:
+        if char in settings.CAPTCHA_PUNCTUATION and len(charlist) >= 1:
+            charlist[-1] += char
+        else:
+            charlist.append(char)
+    for char in charlist:
+        fgimage = makeimg(size, settings.CAPTCHA_FOREGROUND_COLOR)
+        charimage = Image.new("L", getsize(font, " %s " % char), "#000000")
+        chardraw = ImageDraw.Draw(charimage)
+        chardraw.text((0, 0), " %s " % char, font=font, fill="#ffffff")
+        if settings.CAPTCHA_LETTER_ROTATION:
+            charimage = charimage.rotate(
+                random.randrange(*settings.CAPTCHA_LETTER_ROTATION),
+                expand=0,
+                resample=Image.BICUBIC,
+            )
+        charimage = charimage.crop(charimage.getbbox())
+        maskimage = Image.new("L", size)
+
+        maskimage.paste(
+            charimage,
+            (
+                xpos,
+                DISTANCE_FROM_TOP,
+                xpos + charimage.size[0],
+                DISTANCE_FROM_TOP + charimage.size[1],
+            ),
+        )
+        size = maskimage.size
+        image = Image.composite(fgimage, image, maskimage)
+        xpos = xpos + 2 + charimage.size[0]
+
+    if settings.CAPTCHA_IMAGE_SIZE:
+        # centering captcha on the image
+        tmpimg = makeimg(size, settings.CAPTCHA_BACKGROUND_COLOR)
+        tmpimg.paste(
+            image,
+            (
+                int((size[0] - xpos) / 2),
+                int((size[1] - charimage.size[1]) / 2 - DISTANCE_FROM_TOP),
+            ),
+        )
+        image = tmpimg.crop((0, 0, size[0], size[1]))
+    else:
+        image = image.crop((0, 0, xpos + 1, size[1]))
+    draw = ImageDraw.Draw(image)
+
+    for f in noise_functions():
+        draw = f(draw, image)
+    for f in filter_functions():
+        image = f(image)
+
+    out = BytesIO()
+    image.save(out, "PNG")
+
+    # At line :50 above we fixed the random seed so that we always generate the
+    # same image, see: https://github.com/mbi/django-simple-captcha/pull/194
+    # This is a problem though, because knowledge of the seed will let an attacker
+    # predict the next random (globally). We therefore reset the random here.
+    # Reported in https://github.com/mbi/django-simple-captcha/pull/221
+    random.seed()
+
+    return out.getvalue()
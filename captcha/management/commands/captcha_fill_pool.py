@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from captcha.pool import CaptchaPool
+
+
+class Command(BaseCommand):
+    help = "Fill the redis pool of pre-rendered captchas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pool-size",
+            type=int,
+            default=settings.CAPTCHA_POOL_SIZE,
+            help="Number of captchas to keep in pool, default=settings.CAPTCHA_POOL_SIZE",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            default=False,
+            help="Clear the pool before filling",
+        )
+
+    def handle(self, **options):
+        verbose = int(options.get("verbosity"))
+        options.get("clear") and CaptchaPool.clear()
+        count = CaptchaPool.fill(options.get("pool_size"))
+        verbose and self.stdout.write("Filled %d new captchas\n" % count)
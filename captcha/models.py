@@ -75,9 +75,13 @@ class CaptchaStore(models.Model):
         minimum_expiration = timezone.now() + datetime.timedelta(
             minutes=int(settings.CAPTCHA_GET_FROM_POOL_TIMEOUT)
         )
-        store = (
-            cls.objects.filter(expiration__gt=minimum_expiration).order_by("?").first()
-        )
+        # 避免 order_by("?") 全表随机排序，在主键范围内随机取值
+        queryset = cls.objects.filter(expiration__gt=minimum_expiration)
+        bounds = queryset.aggregate(min_id=models.Min("id"), max_id=models.Max("id"))
+        store = None
+        if bounds["min_id"] is not None:
+            pk = randrange(bounds["min_id"], bounds["max_id"] + 1)
+            store = queryset.filter(id__gte=pk).order_by("id").first()
 
         return (store and store.hashkey) or fallback()
 
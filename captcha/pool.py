@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : pool
+# author : ly_13
+# date : 10/18/2026
+import base64
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+
+from captcha.helpers import get_challenge
+from captcha.image import render_image
+from common.cache.redis import CacheSet, format_return
+from common.cache.storage import CaptchaStoreCache
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class CaptchaPool(object):
+    """
+    验证码池，后台任务预先生成验证码图片和答案，存放在 redis set 中，请求时通过 SPOP 直接取出
+    取出的验证码存放在 CaptchaStoreCache 中，超时时间为 CAPTCHA_TIMEOUT，低于 CAPTCHA_POOL_LOW_WATER 时异步补充
+    store = CaptchaPool.pick()
+    if store is None:  # 验证码池为空，使用数据库生成
+        ...
+    """
+    batch_size = 100
+
+    @staticmethod
+    def get_pool():
+        return CacheSet(settings.CACHE_KEY_TEMPLATE.get('captcha_pool_key'))
+
+    @staticmethod
+    def generate(generator=None):
+        challenge, response = get_challenge(generator)()
+        hashkey = secrets.token_hex(20)
+        return {
+            "hashkey": hashkey,
+            "challenge": challenge,
+            "response": response.lower(),
+            "image": base64.b64encode(render_image(challenge, hashkey)).decode('utf-8'),
+        }
+
+    @classmethod
+    def fill(cls, size=None):
+        """补充验证码池至 size 个，返回新增数量"""
+        size = size or settings.CAPTCHA_POOL_SIZE
+        pool = cls.get_pool()
+        lock = pool.lock(timeout=600)
+        if not lock.acquire(blocking=False):
+            return 0
+        count = 0
+        try:
+            need = size - pool.count()
+            while need > 0:
+                batch = min(need, cls.batch_size)
+                pool.push(*[cls.generate() for _ in range(batch)])
+                count += batch
+                need -= batch
+        finally:
+            lock.release()
+        logger.info(f"captcha pool filled {count}")
+        return count
+
+    @classmethod
+    def refill_async(cls):
+        # 多个请求同时低于水位时，只触发一次补充任务
+        if cache.add(f"{settings.CACHE_KEY_TEMPLATE.get('captcha_pool_key')}_refill", 1, 60):
+            from captcha.tasks import refill_captcha_pool_job
+            refill_captcha_pool_job.delay()
+
+    @classmethod
+    def pick(cls):
+        """从验证码池中取出一个验证码，验证码池为空或未开启时返回 None"""
+        if not settings.CAPTCHA_POOL_ENABLED:
+            return None
+        try:
+            pool = cls.get_pool()
+            pipe = pool.connect.pipeline(transaction=False)
+            pipe.spop(pool.key)
+            pipe.scard(pool.key)
+            data, count = pipe.execute()
+            if count < settings.CAPTCHA_POOL_LOW_WATER:
+                cls.refill_async()
+        except Exception as e:
+            logger.warning(f"pick captcha from pool failed. {e}")
+            return None
+        if not data:
+            return None
+        store = format_return(data)
+        CaptchaStoreCache(store["hashkey"]).set_storage_cache(store, timeout=int(settings.CAPTCHA_TIMEOUT) * 60)
+        return store
+
+    @staticmethod
+    def get_store(hashkey):
+        return CaptchaStoreCache(hashkey).get_storage_cache()
+
+    @staticmethod
+    def valid(hashkey, verify_code):
+        """
+        :return: 不在验证码池中返回 None, 验证成功返回 True
+        """
+        store_cache = CaptchaStoreCache(hashkey)
+        store = store_cache.get_storage_cache()
+        if not store:
+            return None
+        if store["response"] != verify_code.strip(" ").lower():
+            return False
+        # 删除成功才算验证通过，防止同一个验证码被并发重复使用
+        return bool(store_cache.del_storage_cache())
+
+    @staticmethod
+    def clear():
+        CaptchaPool.get_pool().delete()
@@ -9,6 +9,7 @@ from django.utils import timezone
 
 from captcha.helpers import captcha_image_url
 from captcha.models import CaptchaStore
+from captcha.pool import CaptchaPool
 from common.utils import get_logger
 
 logger = get_logger(__name__)
@@ -23,17 +24,25 @@ class CaptchaAuth(object):
         return CaptchaStore.objects.filter(hashkey=self.captcha_key).first()
 
     def generate(self):
-        self.captcha_key = CaptchaStore.generate_key()
+        store = CaptchaPool.pick()
+        if store:
+            self.captcha_key = store["hashkey"]
+            code_length = len(store["response"])
+        else:
+            self.captcha_key = CaptchaStore.generate_key()
+            captcha_obj = self.__get_captcha_obj()
+            code_length = 0
+            if captcha_obj:
+                code_length = len(captcha_obj.response)
         captcha_image = captcha_image_url(self.captcha_key)
         if self.request:
             captcha_image = self.request.build_absolute_uri(captcha_image)
-        captcha_obj = self.__get_captcha_obj()
-        code_length = 0
-        if captcha_obj:
-            code_length = len(captcha_obj.response)
         return {"captcha_image": captcha_image, "captcha_key": self.captcha_key, "length": code_length}
 
     def valid(self, verify_code):
+        result = CaptchaPool.valid(self.captcha_key, verify_code)
+        if result is not None:
+            return result
         try:
             CaptchaStore.objects.get(
                 response=verify_code.strip(" ").lower(), hashkey=self.captcha_key, expiration__gt=timezone.now()
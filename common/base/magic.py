@@ -6,15 +6,22 @@
 # date : 6/2/2023
 
 
+import hashlib
+import threading
 import time
 from functools import wraps, WRAPPER_ASSIGNMENTS
 from importlib import import_module
 
 from django.core.cache import cache
 from django.db import close_old_connections, connection
-from django.http.response import HttpResponse
+from django.http.response import HttpResponse, HttpResponseNotModified
+from django.utils.functional import LazyObject
+from django.utils.http import parse_etags
+from django_redis import get_redis_connection
 
+from common.cache.local import LocalLRUCache, SingleFlight
 from common.utils import get_logger
+from common.utils.connection import RedisPubSub
 
 logger = get_logger(__name__)
 
@@ -143,14 +150,158 @@ def magic_call_in_times(call_time=24 * 3600, call_limit=6, key=None):
     return decorator
 
 
+class MagicCacheSubPub(LazyObject):
+    def _setup(self):
+        self._wrapped = RedisPubSub('common.MagicCacheInvalid')
+
+
+magic_cache_pub_sub = MagicCacheSubPub()
+
+
+class MagicCacheTagSubPub(LazyObject):
+    def _setup(self):
+        self._wrapped = RedisPubSub('common.MagicCacheTagInvalid')
+
+
+magic_cache_tag_pub_sub = MagicCacheTagSubPub()
+
+
+class MagicCacheTag(object):
+    """
+    缓存标签，缓存数据记录所属标签及写入时的版本号，失效时仅增加标签版本号，读取时版本号不一致视为失效，无需遍历 key
+    标签格式为 类型:值，例如 menu, role:1, user:1，命中率按类型统计
+    MagicCacheTag.invalid(['role:1', 'user:2'])
+    """
+    version_key = 'magic_cache_tag_version'
+    stats_key = 'magic_cache_tag_stats'
+    stats_flush_interval = 10
+    # 进程内标签版本号，通过 redis 发布订阅更新，用于校验进程内缓存
+    local_versions = LocalLRUCache(max_size=65536, timeout=3600)
+    _stats = {}
+    _stats_lock = threading.Lock()
+    _stats_flush_time = 0
+
+    @classmethod
+    def get_versions(cls, tags):
+        """
+        :return: {tag: version}
+        """
+        keys = {f"{cls.version_key}_{tag}": tag for tag in set(tags)}
+        if not keys:
+            return {}
+        data = cache.get_many(list(keys.keys()))
+        versions = {tag: int(data.get(key, 0)) for key, tag in keys.items()}
+        cls.update_local_versions(versions)
+        return versions
+
+    @classmethod
+    def update_local_versions(cls, versions):
+        for tag, version in versions.items():
+            cls.local_versions.set(tag, version)
+
+    @classmethod
+    def is_valid(cls, versions, local=False):
+        """
+        :param versions: 缓存写入时的标签版本号
+        :param local: 进程内缓存仅和进程内版本号比较，不请求 redis
+        """
+        if not versions:
+            return True
+        if local:
+            for tag, version in versions.items():
+                current = cls.local_versions.get(tag)
+                if current is not None and current != version:
+                    return False
+            return True
+        return cls.get_versions(versions.keys()) == versions
+
+    @classmethod
+    def invalid(cls, tags):
+        versions = {}
+        for tag in set(tags):
+            versions[tag] = cache.incr(f"{cls.version_key}_{tag}", ignore_key_check=True)
+        if not versions:
+            return
+        cls.update_local_versions(versions)
+        try:
+            magic_cache_tag_pub_sub.publish(versions)
+        except Exception as e:
+            logger.error(f"publish invalid cache tags failed. {e}")
+        logger.debug(f"invalid cache tags:{list(versions.keys())[:5]}... {len(versions)} count")
+
+    @classmethod
+    def record(cls, tags, hit):
+        """命中率先在进程内累计，定时写入 redis，避免每次读取缓存都写 redis"""
+        if not tags:
+            return
+        field = 'hit' if hit else 'miss'
+        with cls._stats_lock:
+            for tag_type in {tag.split(':', 1)[0] for tag in tags}:
+                key = f"{tag_type}:{field}"
+                cls._stats[key] = cls._stats.get(key, 0) + 1
+            if time.time() - cls._stats_flush_time < cls.stats_flush_interval:
+                return
+            stats, cls._stats, cls._stats_flush_time = cls._stats, {}, time.time()
+        try:
+            pipe = get_redis_connection('default').pipeline(transaction=False)
+            for key, count in stats.items():
+                pipe.hincrby(cls.stats_key, key, count)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"flush cache tag stats failed. {e}")
+
+    @classmethod
+    def get_stats(cls):
+        """
+        :return: {tag_type: {'hit': 0, 'miss': 0, 'ratio': 0.0}}
+        """
+        stats = {}
+        for key, count in get_redis_connection('default').hgetall(cls.stats_key).items():
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            tag_type, field = key.rsplit(':', 1)
+            stats.setdefault(tag_type, {'hit': 0, 'miss': 0})[field] = int(count)
+        for item in stats.values():
+            total = item['hit'] + item['miss']
+            item['ratio'] = round(item['hit'] / total, 4) if total else 0.0
+        return stats
+
+    @classmethod
+    def reset_stats(cls):
+        get_redis_connection('default').delete(cls.stats_key)
+
+
 class MagicCacheData(object):
-    @staticmethod
-    def make_cache(timeout=60 * 10, invalid_time=0, key_func=None, timeout_func=None):
+    # 进程内缓存，作为 redis 前面的一级缓存，通过 redis 发布订阅保持一致
+    local_cache = LocalLRUCache(max_size=4096)
+    single_flight = SingleFlight()
+
+    @classmethod
+    def _get_cache(cls, cache_key, expire_time, local_timeout=0):
+        n_time = time.time()
+        if local_timeout:
+            res = cls.local_cache.get(cache_key)
+            if res is not None and MagicCacheTag.is_valid(res.get('tags'), local=True):
+                return res
+        res = cache.get(cache_key)
+        if (res and res.get('status') == 'ok' and n_time - res.get('c_time', n_time) < expire_time
+                and MagicCacheTag.is_valid(res.get('tags'))):
+            if local_timeout:
+                cls.local_cache.set(cache_key, res, min(local_timeout, expire_time - (n_time - res['c_time'])))
+            return res
+        return None
+
+    @classmethod
+    def make_cache(cls, timeout=60 * 10, invalid_time=0, key_func=None, timeout_func=None, local_timeout=0,
+                   tags_func=None, cache_failure=True):
         """
         :param timeout_func:
         :param timeout:  数据缓存的时候，单位秒
         :param invalid_time: 数据缓存提前失效时间，单位秒。该cache有效时间为 cache_time-invalid_time
         :param key_func: cache唯一标识，默认为所装饰函数名称
+        :param local_timeout: 进程内缓存时间，单位秒，0 表示不使用进程内缓存。数据失效时通过发布订阅通知所有进程
+        :param tags_func: 缓存标签，通过 MagicCacheTag.invalid 失效，参考 MagicCacheTag
+        :param cache_failure: 执行异常时是否缓存空数据，False 时不缓存并抛出异常，下次调用重新执行
         :return:
         """
 
@@ -164,22 +315,27 @@ class MagicCacheData(object):
                 cache_time = timeout
                 if timeout_func:
                     cache_time = timeout_func(*args, **kwargs)
-                n_time = time.time()
-                res = cache.get(cache_key)
+                expire_time = cache_time - invalid_time
+                res = cls._get_cache(cache_key, expire_time, local_timeout)
                 if res:
-                    while not res or res.get('status') != 'ok':
-                        time.sleep(0.5)
-                        logger.warning(
-                            f'exec {func} wait. data status is not ok. cache_time:{cache_time} cache_key:{cache_key}  cache data exist result:{res}')
-                        res = cache.get(cache_key)
-                with cache.lock(f"locker_{cache_key}", timeout=cache_time - invalid_time):
-                    if res and n_time - res.get('c_time', n_time) < cache_time - invalid_time:
-                        logger.debug(
-                            f"exec {func} finished. cache_time:{cache_time} cache_key:{cache_key} cache data exist result:{res}")
+                    logger.debug(f"exec {func} finished. cache_time:{cache_time} cache_key:{cache_key} cache data exist")
+                    MagicCacheTag.record(res.get('tags'), True)
+                    return res['data']
+
+                # 同一进程内相同key仅一个线程去获取锁，其他线程等待结果；多进程之间通过 redis 锁等待
+                with cls.single_flight.lock(cache_key):
+                    res = cls._get_cache(cache_key, expire_time, local_timeout)
+                    if res:
                         return res['data']
-                    else:
-                        res = {'c_time': n_time, 'data': '', 'status': 'ready'}
-                        cache.set(cache_key, res, cache_time)
+                    with cache.lock(f"locker_{cache_key}", timeout=min(expire_time, 60 * 5)):
+                        res = cls._get_cache(cache_key, expire_time, local_timeout)
+                        if res:
+                            return res['data']
+                        n_time = time.time()
+                        # 先获取标签版本号再执行，执行期间标签失效，下次读取时也能发现
+                        tags = tags_func(*args, **kwargs) if tags_func else []
+                        res = {'c_time': n_time, 'data': '', 'status': 'ok', 'tags': MagicCacheTag.get_versions(tags)}
+                        MagicCacheTag.record(tags, False)
                         try:
                             res['data'] = func(*args, **kwargs)
                             logger.debug(
@@ -187,40 +343,130 @@ class MagicCacheData(object):
                         except Exception as e:
                             logger.error(
                                 f"exec {func} failed. time:{time.time() - n_time}  cache_time:{cache_time} cache_key:{cache_key} Exception:{e}")
+                            if not cache_failure:
+                                raise
 
-                        res['status'] = 'ok'
                         cache.set(cache_key, res, cache_time)
-
+                        if local_timeout:
+                            cls.local_cache.set(cache_key, res, min(local_timeout, expire_time))
                         return res['data']
 
             return wrapper
 
         return decorator
 
-    @staticmethod
-    def invalid_cache(key):
+    @classmethod
+    def invalid_local_caches(cls, keys):
+        count = cls.local_cache.delete_many(keys)
+        logger.debug(f"invalid_local_cache_data cache_key:{keys[:1]}... {len(keys)} count. delete count:{count}")
+
+    @classmethod
+    def publish_invalid_keys(cls, keys):
+        cls.invalid_local_caches(keys)
+        try:
+            magic_cache_pub_sub.publish(keys)
+        except Exception as e:
+            logger.error(f"publish invalid cache keys failed. {e}")
+
+    @classmethod
+    def invalid_cache(cls, key):
         cache_key = f'magic_cache_data_{key}'
-        count = cache.delete_pattern(cache_key)
+        # 通配符需要遍历 key，批量失效优先使用 MagicCacheTag
+        count = cache.delete_pattern(cache_key) if '*' in cache_key else cache.delete(cache_key)
+        cls.publish_invalid_keys([cache_key])
         logger.warning(f"invalid_cache cache_key:{cache_key} count:{count}")
 
-    @staticmethod
-    def invalid_caches(keys):
+    @classmethod
+    def invalid_caches(cls, keys):
         delete_keys = [f'magic_cache_data_{key}' for key in keys]
         count = cache.delete_many(delete_keys)
+        cls.publish_invalid_keys(delete_keys)
         logger.warning(
             f"invalid_cache_data cache_key:{delete_keys[0]}... {len(delete_keys)} count. delete count:{count}")
 
 
+# 浏览器每次请求都需要携带 If-None-Match 校验，数据未变化时返回 304
+DEFAULT_CACHE_CONTROL = 'private, no-cache'
+
+
+def get_content_etag(content):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def is_etag_matched(request, etag):
+    """If-None-Match 使用弱比较"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not etag or not if_none_match or request.method not in ('GET', 'HEAD'):
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag.removeprefix('W/') in {x.removeprefix('W/') for x in etags}
+
+
+def get_cache_control(view_instance, cache_control=None):
+    if cache_control is None:
+        cache_control = getattr(view_instance, 'cache_control', DEFAULT_CACHE_CONTROL)
+    return cache_control
+
+
+def set_conditional_headers(response, etag, cache_control):
+    if etag:
+        response['ETag'] = etag
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def get_conditional_response(request, response, etag, cache_control):
+    """请求的 ETag 与当前数据一致时返回 304，否则在响应中设置 ETag"""
+    if is_etag_matched(request, etag):
+        response = HttpResponseNotModified()
+    return set_conditional_headers(response, etag, cache_control)
+
+
+def conditional_response(cache_control=None):
+    """
+    未使用接口缓存的 GET 接口，根据响应内容生成 ETag，内容未变化时返回 304，减少数据传输
+    :param cache_control: Cache-Control，为空则使用视图的 cache_control 属性，默认 DEFAULT_CACHE_CONTROL
+    """
+
+    def decorator(func):
+        @wraps(func, assigned=WRAPPER_ASSIGNMENTS)
+        def inner(self, request, *args, **kwargs):
+            response = func(self, request, *args, **kwargs)
+            if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+                return response
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+            return get_conditional_response(request, response, get_content_etag(response.content),
+                                            get_cache_control(self, cache_control))
+
+        return inner
+
+    return decorator
+
+
 class MagicCacheResponse(object):
-    def __init__(self, timeout=60 * 10, invalid_time=0, key_func=None):
+    """
+    接口缓存，缓存渲染后的数据及 ETag，请求携带的 If-None-Match 与缓存一致时直接返回 304，不执行视图
+    :param cache_control: Cache-Control，为空则使用视图的 cache_control 属性，默认 DEFAULT_CACHE_CONTROL
+    """
+    # 所有接口缓存都包含该标签，服务启动时失效
+    global_tag = 'response'
+
+    def __init__(self, timeout=60 * 10, invalid_time=0, key_func=None, tags_func=None, cache_control=None):
         self.timeout = timeout
         self.key_func = key_func
+        self.tags_func = tags_func
         self.invalid_time = invalid_time
+        self.cache_control = cache_control
 
     @staticmethod
     def invalid_cache(key):
         cache_key = f'magic_cache_response_{key}'
-        count = cache.delete_pattern(cache_key)
+        # 通配符需要遍历 key，批量失效优先使用 MagicCacheTag
+        count = cache.delete_pattern(cache_key) if '*' in cache_key else cache.delete(cache_key)
         logger.warning(f"invalid_response_cache cache_key:{cache_key} count:{count}")
 
     @staticmethod
@@ -265,33 +511,53 @@ class MagicCacheResponse(object):
         else:
             cache_key = f'{cache_key}_{func_name}'
         timeout = self.calculate_timeout(view_instance=view_instance)
+        cache_control = get_cache_control(view_instance, self.cache_control)
         n_time = time.time()
         if getattr(request, 'no_cache', False):
             res = None
         else:
             res = cache.get(cache_key)
-        if res and n_time - res.get('c_time', n_time) < timeout - self.invalid_time:
+        if (res and n_time - res.get('c_time', n_time) < timeout - self.invalid_time
+                and MagicCacheTag.is_valid(res.get('tags'))):
             logger.info(f"exec {func_name} finished. cache_key:{cache_key}  cache data exist")
+            MagicCacheTag.record(res.get('tags'), True)
             content, status, headers = res['data']
+            etag = res.get('etag') or get_content_etag(content)
+            if is_etag_matched(request, etag):
+                return set_conditional_headers(HttpResponseNotModified(), etag, cache_control)
             response = HttpResponse(content=content, status=status)
             response.renderer_context = view_instance.get_renderer_context()
             for k, v in headers.values():
                 response[k] = v
+            set_conditional_headers(response, etag, cache_control)
         else:
+            tags = self.calculate_tags(
+                view_instance=view_instance,
+                view_method=view_method,
+                request=request,
+                args=args,
+                kwargs=kwargs
+            )
+            versions = MagicCacheTag.get_versions(tags)
+            MagicCacheTag.record(tags, False)
             response = view_method(view_instance, request, *args, **kwargs)
             response = view_instance.finalize_response(request, response, *args, **kwargs)
             response.render()
 
-            if not response.status_code >= 400 and not getattr(request, 'no_cache', False):
-                data = (
-                    response.rendered_content,
-                    response.status_code,
-                    {k: (k, v) for k, v in response.items()}
-                )
-                res = {'c_time': n_time, 'data': data}
-                cache.set(cache_key, res, timeout)
-                logger.debug(
-                    f"exec {func_name} finished. time:{time.time() - n_time}  cache_key:{cache_key} result:{res}")
+            if not response.status_code >= 400:
+                # 已经渲染完成，直接使用 content，rendered_content 每次访问都会重新渲染
+                etag = get_content_etag(response.content)
+                if not getattr(request, 'no_cache', False):
+                    data = (
+                        response.content,
+                        response.status_code,
+                        {k: (k, v) for k, v in response.items()}
+                    )
+                    res = {'c_time': n_time, 'data': data, 'tags': versions, 'etag': etag}
+                    cache.set(cache_key, res, timeout)
+                    logger.debug(
+                        f"exec {func_name} finished. time:{time.time() - n_time}  cache_key:{cache_key} result:{res}")
+                response = get_conditional_response(request, response, etag, cache_control)
 
         if not hasattr(response, '_closable_objects'):
             response._closable_objects = []
@@ -317,6 +583,28 @@ class MagicCacheResponse(object):
                 kwargs=kwargs,
             )
 
+    def calculate_tags(self,
+                       view_instance,
+                       view_method,
+                       request,
+                       args,
+                       kwargs):
+        if isinstance(self.tags_func, str):
+            tags_func = getattr(view_instance, self.tags_func)
+        else:
+            # 未指定时使用视图的 get_cache_tags，参考 CacheDetailResponseMixin.invalid_cache
+            tags_func = self.tags_func or getattr(view_instance, 'get_cache_tags', None)
+        tags = [self.global_tag]
+        if tags_func:
+            tags.extend(tags_func(
+                view_instance=view_instance,
+                view_method=view_method,
+                request=request,
+                args=args,
+                kwargs=kwargs,
+            ))
+        return tags
+
     def calculate_timeout(self, view_instance, **_):
         if isinstance(self.timeout, str):
             self.timeout = getattr(view_instance, self.timeout)
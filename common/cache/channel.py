@@ -42,7 +42,76 @@ class RedisChannelLayer(_RedisChannelLayer):
         await connection.zadd(key, {channel: time.time()})
         await connection.expire(key, self.group_expiry)
 
+    def _presence_key(self):
+        return f"{self.prefix}:presence".encode("utf8")
+
+    def _presence_connection(self):
+        return self.connection(self.consistent_hash("presence"))
+
+    async def presence_add(self, user_pk, group, channel):
+        """
+        在线用户索引，sorted set 保存 用户 -> 最后心跳时间，用户的连接保存在对应的 group 中
+        连接，心跳时调用
+        """
+        await self.update_active_layers(group, channel)
+        connection = self._presence_connection()
+        await connection.zadd(self._presence_key(), {str(user_pk): time.time()})
+        await connection.expire(self._presence_key(), self.group_expiry)
+
+    async def presence_discard(self, user_pk, group, channel):
+        """断开连接时调用，用户没有有效连接时，从在线用户索引中移除"""
+        connection, key = await self.auto_expire_layers(group)
+        await connection.zrem(key, channel)
+        if not await connection.zcard(key):
+            await self._presence_connection().zrem(self._presence_key(), str(user_pk))
+
+    async def auto_expire_presence(self):
+        connection = self._presence_connection()
+        await connection.zremrangebyscore(self._presence_key(), min=0, max=int(time.time()) - self.layer_expire)
+        return connection, self._presence_key()
+
+    async def get_online_users(self):
+        connection, key = await self.auto_expire_presence()
+        return [x.decode("utf8") for x in await connection.zrange(key, 0, -1)]
+
+    async def get_online_count(self):
+        connection = self._presence_connection()
+        return await connection.zcount(self._presence_key(), min=int(time.time()) - self.layer_expire, max="+inf")
+
+    async def is_online(self, user_pk):
+        score = await self._presence_connection().zscore(self._presence_key(), str(user_pk))
+        return bool(score and score > time.time() - self.layer_expire)
+
+    async def get_layer_count(self, group):
+        connection = self.connection(self.consistent_hash(group))
+        key = self._group_key(group)
+        return await connection.zcount(key, min=int(time.time()) - self.layer_expire, max="+inf")
+
+    async def get_groups_layers(self, groups, count=False):
+        """
+        批量获取多个 group 的有效连接，按 redis 实例分组，每个实例通过 pipeline 一次请求
+        :param count: 为 True 时仅返回连接数量
+        :return: {group: [channel, ...]} 或 {group: count}
+        """
+        min_score = int(time.time()) - self.layer_expire
+        indexes = {}
+        for group in set(groups):
+            indexes.setdefault(self.consistent_hash(group), []).append(group)
+        result = {}
+        for index, items in indexes.items():
+            async with self.connection(index).pipeline(transaction=False) as pipe:
+                for group in items:
+                    if count:
+                        pipe.zcount(self._group_key(group), min=min_score, max="+inf")
+                    else:
+                        pipe.zrangebyscore(self._group_key(group), min=min_score, max="+inf")
+                values = await pipe.execute()
+            for group, value in zip(items, values):
+                result[group] = value if count else [x.decode("utf8") for x in value]
+        return result
+
     async def get_groups(self):
+        """扫描所有 group，数据量大时较慢，在线用户请使用 get_online_users"""
         groups = []
         group = self._group_key("*")
         for index in range(self.ring_size):
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : local
+# author : ly_13
+# date : 10/18/2026
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class LocalLRUCache(object):
+    """
+    进程内 LRU 缓存，带过期时间，线程安全
+    :param max_size: 最大缓存数量，超出后淘汰最久未使用的数据
+    :param timeout: 默认过期时间，单位秒，0 表示不过期
+    """
+
+    def __init__(self, max_size=4096, timeout=0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expire_time = item
+            if expire_time and expire_time < time.time():
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        expire_time = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._data[key] = (value, expire_time)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """支持 * 通配符"""
+        with self._lock:
+            if '*' not in key:
+                return 1 if self._data.pop(key, None) is not None else 0
+            keys = [k for k in self._data if fnmatch.fnmatchcase(k, key)]
+            for k in keys:
+                self._data.pop(k, None)
+            return len(keys)
+
+    def delete_many(self, keys):
+        return sum(self.delete(key) for key in keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def info(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0,
+        }
+
+
+class SingleFlight(object):
+    """
+    同一进程内，相同key的任务只执行一次，其他线程等待执行结果，而不是轮询
+    with single_flight.lock(key):
+        ...
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def lock(self, key):
+        with self._lock:
+            item = self._locks.setdefault(key, [threading.Lock(), 0])
+            item[1] += 1
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self._lock:
+                item[1] -= 1
+                if item[1] <= 0:
+                    self._locks.pop(key, None)
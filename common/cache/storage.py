@@ -109,3 +109,9 @@ class WebSocketMsgResultCache(RedisCacheBase):
     def __init__(self, prefix_key):
         self.cache_key = f"{settings.CACHE_KEY_TEMPLATE.get('websocket_message_result_key')}_{prefix_key}"
         super().__init__(self.cache_key)
+
+
+class CaptchaStoreCache(RedisCacheBase):
+    def __init__(self, hashkey):
+        self.cache_key = f"{settings.CACHE_KEY_TEMPLATE.get('captcha_store_key')}_{hashkey}"
+        super().__init__(self.cache_key)
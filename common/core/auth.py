@@ -6,15 +6,24 @@
 # date : 6/2/2023
 import functools
 import hashlib
+import threading
+import time
 
+from django.conf import settings
 from django.http.cookie import parse_cookie
+from django.utils.functional import LazyObject
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import NotAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import AccessToken
 
+from common.cache.redis import CacheSortedSet
 from common.cache.storage import BlackAccessTokenCache
+from common.utils import get_logger
+from common.utils.connection import RedisPubSub
+
+logger = get_logger(__name__)
 
 
 def auth_required(view_func):
@@ -27,6 +36,101 @@ def auth_required(view_func):
     return wrapper
 
 
+class TokenRevokeSubPub(LazyObject):
+    def _setup(self):
+        self._wrapped = RedisPubSub('common.AccessTokenRevoke')
+
+
+token_revoke_pub_sub = TokenRevokeSubPub()
+
+
+class TokenRevocationFilter(object):
+    """
+    进程内 access token 吊销过滤器，保存已吊销 token 的摘要及过期时间，吊销时通过 redis 发布订阅同步到所有进程
+    不在过滤器中的 token 直接认为未吊销，命中时再查询 redis 确认，避免每次请求都查询 redis
+    发布订阅消息可能丢失，定时从 redis 吊销索引全量同步兜底，未同步成功前全部查询 redis
+    """
+    sync_interval = 60
+
+    def __init__(self):
+        self._revoked = {}
+        self._synced = False
+        self._sync_time = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_index():
+        return CacheSortedSet(settings.CACHE_KEY_TEMPLATE.get('black_access_token_index_key'))
+
+    @staticmethod
+    def get_member(user_id, access_key):
+        return f"{user_id}_{access_key}"
+
+    def add(self, revoked):
+        """
+        :param revoked: {member: 过期时间戳}
+        """
+        now = time.time()
+        for member, exp in revoked.items():
+            if exp > now:
+                self._revoked[member] = exp
+
+    def sync(self):
+        now = time.time()
+        index = self.get_index()
+        pipe = index.connect.pipeline(transaction=False)
+        pipe.zremrangebyscore(index.key, '-inf', now)
+        pipe.zrange(index.key, 0, -1, withscores=True)
+        _, members = pipe.execute()
+        # 吊销不可撤销，合并本地数据，避免覆盖同步期间收到的吊销消息
+        revoked = {k: v for k, v in self._revoked.items() if v > now}
+        for member, exp in members:
+            revoked[member.decode('utf-8') if isinstance(member, bytes) else member] = exp
+        self._revoked = revoked
+
+    def sync_if_need(self):
+        if time.time() - self._sync_time < self.sync_interval:
+            return
+        with self._lock:
+            if time.time() - self._sync_time < self.sync_interval:
+                return
+            try:
+                self.sync()
+                self._synced = True
+            except Exception as e:
+                logger.warning(f"sync revoked access token failed. {e}")
+            self._sync_time = time.time()
+
+    def might_revoked(self, user_id, access_key):
+        self.sync_if_need()
+        if not self._synced:
+            return True
+        member = self.get_member(user_id, access_key)
+        exp = self._revoked.get(member)
+        if exp is None:
+            return False
+        if exp < time.time():
+            self._revoked.pop(member, None)
+            return False
+        return True
+
+    def revoke(self, user_id, access_key, exp):
+        timeout = exp - time.time()
+        if timeout <= 0:
+            return
+        BlackAccessTokenCache(user_id, access_key).set_storage_cache(1, timeout)
+        revoked = {self.get_member(user_id, access_key): exp}
+        self.get_index().push(revoked)
+        self.add(revoked)
+        try:
+            token_revoke_pub_sub.publish(revoked)
+        except Exception as e:
+            logger.error(f"publish revoked access token failed. {e}")
+
+
+token_revocation_filter = TokenRevocationFilter()
+
+
 class ServerAccessToken(AccessToken):
     """
     自定义的token方法是为了登出的时候，将 access token 禁用
@@ -34,7 +138,9 @@ class ServerAccessToken(AccessToken):
 
     def verify(self):
         user_id = self.payload.get('user_id')
-        if BlackAccessTokenCache(user_id, hashlib.md5(self.token).hexdigest()).get_storage_cache():
+        access_key = hashlib.md5(self.token).hexdigest()
+        if (token_revocation_filter.might_revoked(user_id, access_key)
+                and BlackAccessTokenCache(user_id, access_key).get_storage_cache()):
             raise TokenError(_("Token is invalid or expired"))
         super().verify()
 
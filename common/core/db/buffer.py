@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : buffer
+# author : ly_13
+# date : 10/18/2026
+import atexit
+import os
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class BulkCreateBuffer(object):
+    """
+    数据缓冲写入，数据先放入进程内队列，后台线程达到数量或者时间阈值后通过 bulk_create 批量写入
+    operation_log_buffer = BulkCreateBuffer(OperationLog, batch_size=100, interval=2)
+    operation_log_buffer.put(OperationLog(**info))
+    :param model: 模型
+    :param batch_size: 每批写入数量
+    :param interval: 最长等待时间，单位秒
+    :param max_size: 队列最大长度，超出后丢弃数据，防止数据库异常时内存无限增长
+    """
+
+    def __init__(self, model, batch_size=100, interval=2, max_size=10000):
+        self.model = model
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_started(self):
+        # 多进程部署时，fork 后的子进程需要重新创建队列和后台线程
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_size)
+                atexit.register(self.flush)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name=f"bulk_create_buffer_{self.model._meta.label_lower}")
+            self._thread.start()
+
+    def put(self, obj):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(obj)
+        except queue.Full:
+            logger.warning(f"{self.model._meta.label} buffer is full, drop {obj}")
+
+    def _get_batch(self, block=True):
+        objs = []
+        deadline = time.time() + self.interval
+        while len(objs) < self.batch_size:
+            timeout = deadline - time.time()
+            try:
+                if block and timeout > 0:
+                    objs.append(self._queue.get(timeout=timeout))
+                else:
+                    objs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return objs
+
+    def write(self, objs):
+        try:
+            close_old_connections()
+            self.model.objects.bulk_create(objs, batch_size=self.batch_size)
+        except Exception as e:  # sqlite3 数据库因为锁表可能会导致写入失败
+            logger.warning(f"{self.model._meta.label} bulk create {len(objs)} failed, retry one by one. {e}")
+            self.write_one_by_one(objs)
+
+    def write_one_by_one(self, objs):
+        # 批量写入失败时逐条写入，避免一条异常数据导致整批数据丢失
+        failed = 0
+        for obj in objs:
+            try:
+                self.model.objects.bulk_create([obj])
+            except Exception as e:
+                failed += 1
+                logger.error(f"{self.model._meta.label} create failed, drop {obj}. {e}")
+        if failed:
+            logger.error(f"{self.model._meta.label} bulk create {len(objs)}, {failed} failed")
+
+    def _run(self):
+        while True:
+            objs = self._get_batch()
+            if objs:
+                self.write(objs)
+
+    def flush(self):
+        """立即写入队列中的数据，进程退出时自动调用"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        while objs := self._get_batch(block=False):
+            self.write(objs)
@@ -4,6 +4,176 @@
 # filename : router
 # author : ly_13
 # date : 12/18/2023
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from common.local import thread_local
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class ReplicaRouter(object):
+    """
+    读写分离，主库别名为 default，从库通过 DB_READ_REPLICAS 和 DB_ANALYTIC_REPLICAS 配置
+    1.仅安全请求方法(GET, HEAD, OPTIONS)中的读操作使用从库，按权重随机选择，同一个请求使用同一个从库
+    2.写操作，以及 transaction.atomic 中的读操作使用主库
+    3.请求中存在写操作后，该请求后续读操作使用主库，并且该用户在 DB_REPLICA_STICKY_TIME 内的请求都使用主库
+    4.从库连接失败后，在 DB_REPLICA_RETRY_INTERVAL 内不再使用
+    5.导出和面板等分析查询，通过 with use_analytic_db() 使用分析从库
+    """
+    state_attr = 'db_router_state'
+    group_attr = 'db_router_group'
+    pinned_key = 'db_router_pinned'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._unhealthy = {}
+
+    @staticmethod
+    def get_replicas(group=None):
+        if group == 'analytic':
+            return getattr(settings, 'DB_ANALYTIC_REPLICAS', None) or {}
+        return getattr(settings, 'DB_READ_REPLICAS', None) or {}
+
+    @property
+    def enabled(self):
+        return bool(self.get_replicas() or self.get_replicas('analytic'))
+
+    def is_replica(self, db):
+        return db in self.get_replicas() or db in self.get_replicas('analytic')
+
+    @staticmethod
+    def get_state():
+        return getattr(thread_local, ReplicaRouter.state_attr, None)
+
+    def start_request(self, request):
+        state = {'safe': request.method in ('GET', 'HEAD', 'OPTIONS'), 'written': False, 'pinned': None,
+                 'replicas': {}, 'user_pk': None}
+        # ATOMIC_REQUESTS 开启时，视图本身在事务中执行，不作为显式事务处理
+        state['atomic_level'] = 1 if connections[DEFAULT_DB_ALIAS].settings_dict.get('ATOMIC_REQUESTS') else 0
+        setattr(thread_local, self.state_attr, state)
+        return state
+
+    def end_request(self):
+        state = self.get_state()
+        setattr(thread_local, self.state_attr, None)
+        if state and state['written'] and state['user_pk'] is not None:
+            sticky_time = getattr(settings, 'DB_REPLICA_STICKY_TIME', 0)
+            if sticky_time:
+                cache.set(f"{self.pinned_key}_{state['user_pk']}", 1, sticky_time)
+        return state
+
+    @staticmethod
+    def get_request_user_pk():
+        from server.utils import get_current_request
+        request = get_current_request()
+        user = getattr(request, 'user', None) if request else None
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return None
+
+    def is_pinned(self, state):
+        if state['pinned'] is None:
+            user_pk = self.get_request_user_pk()
+            if user_pk is None:
+                # 用户认证前的查询，不缓存结果
+                return False
+            state['user_pk'] = user_pk
+            state['pinned'] = bool(cache.get(f"{self.pinned_key}_{user_pk}"))
+        return state['pinned']
+
+    @staticmethod
+    def in_atomic_block(state):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if not connection.in_atomic_block:
+            return False
+        level = state['atomic_level'] if state else 0
+        return len(connection.atomic_blocks) > level
+
+    def mark_unhealthy(self, db):
+        with self._lock:
+            self._unhealthy[db] = time.time() + getattr(settings, 'DB_REPLICA_RETRY_INTERVAL', 30)
+        logger.warning(f"database replica {db} is unhealthy, evicted")
+
+    def is_healthy(self, db):
+        retry_time = self._unhealthy.get(db)
+        if retry_time is None:
+            return True
+        if retry_time > time.time():
+            return False
+        with self._lock:
+            self._unhealthy.pop(db, None)
+        return True
+
+    def choice_replica(self, group=None):
+        replicas = {db: weight for db, weight in self.get_replicas(group).items() if self.is_healthy(db)}
+        while replicas:
+            db = random.choices(list(replicas.keys()), weights=list(replicas.values()))[0]
+            try:
+                connections[db].ensure_connection()
+                return db
+            except Exception as e:
+                logger.warning(f"connect database replica {db} failed. {e}")
+                self.mark_unhealthy(db)
+                replicas.pop(db)
+        return None
+
+    def get_read_db(self):
+        group = getattr(thread_local, self.group_attr, None)
+        state = self.get_state()
+        if state is None:
+            # 非请求中(定时任务，命令等)，仅显式指定分析从库时使用从库
+            if group != 'analytic':
+                return None
+        elif not state['safe'] or state['written'] or self.is_pinned(state):
+            return None
+        if self.in_atomic_block(state):
+            return None
+        replicas = state['replicas'] if state else {}
+        if group not in replicas:
+            db = self.choice_replica(group)
+            if db is None and group == 'analytic':
+                db = self.choice_replica()
+            replicas[group] = db
+        return replicas[group]
+
+    def mark_written(self):
+        state = self.get_state()
+        if state and not state['written']:
+            state['written'] = True
+            if state['user_pk'] is None:
+                state['user_pk'] = self.get_request_user_pk()
+
+    def get_analytic_db(self):
+        """用于流式导出等在请求结束后才执行的查询，通过 queryset.using 指定"""
+        with use_analytic_db():
+            return self.get_read_db()
+
+
+replica_router = ReplicaRouter()
+
+
+@contextmanager
+def use_analytic_db():
+    """
+    分析查询使用分析从库，未配置时使用普通从库
+    with use_analytic_db():
+        ...
+    """
+    group = getattr(thread_local, ReplicaRouter.group_attr, None)
+    setattr(thread_local, ReplicaRouter.group_attr, 'analytic')
+    try:
+        yield
+    finally:
+        setattr(thread_local, ReplicaRouter.group_attr, group)
+
 
 # https://docs.djangoproject.com/zh-hans/5.0/topics/db/multi-db/#automatic-database-routing
 class DBRouter:
@@ -19,7 +189,9 @@ class DBRouter:
         """
         # if model._meta.app_label == "auth":
         #     return "auth_db"
-        return None
+        if not replica_router.enabled:
+            return None
+        return replica_router.get_read_db()
 
     def db_for_write(self, model, **hints):
         """
@@ -29,7 +201,10 @@ class DBRouter:
         """
         # if model._meta.app_label in ["auth", "contenttypes"]:
         #     return "auth_db"
-        return None
+        if not replica_router.enabled:
+            return None
+        replica_router.mark_written()
+        return DEFAULT_DB_ALIAS
 
     def allow_relation(self, obj1, obj2, **hints):
         """
@@ -37,6 +212,10 @@ class DBRouter:
         这纯粹是一种验证操作，由外键和多对多操作决定是否应该允许关系。
         如果没有路由有意见（比如所有路由返回 None），则只允许同一个数据库内的关系。
         """
+        # 主库和从库数据相同，允许关联
+        dbs = {obj1._state.db or DEFAULT_DB_ALIAS, obj2._state.db or DEFAULT_DB_ALIAS}
+        if all(db == DEFAULT_DB_ALIAS or replica_router.is_replica(db) for db in dbs):
+            return True
         return None
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
@@ -48,4 +227,6 @@ class DBRouter:
         """
         # if model._meta.app_label in ["auth", "contenttypes"]:
         #     return db == "auth_db"
+        if replica_router.is_replica(db):
+            return False
         return None
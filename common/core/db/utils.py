@@ -11,6 +11,11 @@ from contextlib import contextmanager
 from django.db import connections, transaction, connection
 from django.db.models import Q
 
+from common.utils import get_logger
+from common.utils.ip import merge_ip_intervals
+
+logger = get_logger(__name__)
+
 
 class RelatedManager:
     def __init__(self, instance, field):
@@ -23,31 +28,162 @@ class RelatedManager:
         self.instance.__dict__[self.field.name] = value
 
     @staticmethod
-    def get_ip_in_q(name, val):
+    def get_ipv4_block_q(name, network, head=''):
+        """
+        非 inet 类型存储(字符串)的 IPv4 CIDR 转换为前缀匹配条件，每个网段仅生成一个条件
+        :param head: 地址前缀，IPv4 映射的 IPv6 地址存储为 ::ffff:1.2.3.4，head 为 ::ffff:
+        """
+        octets = str(network.network_address).split('.')
+        full, rem = divmod(network.prefixlen, 8)
+        if full == 4:
+            return Q(**{"{}__exact".format(name): head + str(network.network_address)})
+        prefix = '.'.join(octets[:full])
+        prefix = f"{head}{prefix}." if prefix else head
+        if rem == 0:
+            if not prefix:
+                return Q(**{"{}__contains".format(name): '.'})
+            if prefix == head:
+                return Q(**{"{}__startswith".format(name): prefix, "{}__contains".format(name): '.'})
+            return Q(**{"{}__startswith".format(name): prefix})
+        start = int(octets[full])
+        values = '|'.join(str(x) for x in range(start, start + 2 ** (8 - rem)))
+        suffix = '$' if full == 3 else r'\.'
+        return Q(**{"{}__regex".format(name): rf"^{re.escape(prefix)}({values}){suffix}"})
+
+    @staticmethod
+    def get_hex_range_regex(start, end):
+        """
+        生成匹配 [start, end] 范围内不带前导零的十六进制数的正则，用于 IPv6 的一段
+        """
+
+        def char_class(low, high):
+            # 0-9 和 a-f 在 ASCII 中不连续，需要分开
+            chars = '0123456789abcdef'[low:high + 1]
+            ranges = [x for x in [chars.rstrip('abcdef'), chars.lstrip('0123456789')] if x]
+            return '[' + ''.join(x if len(x) == 1 else f"{x[0]}-{x[-1]}" for x in ranges) + ']'
+
+        def range_regex(low, high):
+            if not low:
+                return ''
+            if low[0] == high[0]:
+                return low[0] + range_regex(low[1:], high[1:])
+            size = len(low) - 1
+            first, last = int(low[0], 16), int(high[0], 16)
+            if low[1:] == '0' * size and high[1:] == 'f' * size:
+                return char_class(first, last) + (f"[0-9a-f]{{{size}}}" if size else '')
+            parts = [low[0] + range_regex(low[1:], 'f' * size)]
+            if last - first > 1:
+                parts.append(char_class(first + 1, last - 1) + f"[0-9a-f]{{{size}}}")
+            parts.append(high[0] + range_regex('0' * size, high[1:]))
+            return f"({'|'.join(parts)})"
+
+        parts = []
+        for length in range(1, 5):
+            # 按数字位数拆分区间，每个区间内位数相同
+            low, high = max(start, 16 ** (length - 1) if length > 1 else 0), min(end, 16 ** length - 1)
+            if low <= high:
+                parts.append(range_regex(f"{low:0{length}x}", f"{high:0{length}x}"))
+        return parts[0] if len(parts) == 1 else f"({'|'.join(parts)})"
+
+    @classmethod
+    def get_ipv6_block_q(cls, name, network):
+        """
+        非 inet 类型存储(字符串，压缩格式，例如 2001:db8::1)的 IPv6 CIDR 转换为前缀和正则匹配条件
+        压缩格式中 :: 可能出现在网段前缀中，按 :: 的位置和长度分别生成正则
+        """
+        group = '[0-9a-f]{1,4}'
+        # 不使用字符串格式拆分，IPv4 映射地址在部分 Python 版本中格式为 ::ffff:1.2.3.4
+        address = int(network.network_address)
+        hextets = [(address >> (16 * (7 - i))) & 0xffff for i in range(8)]
+        full, rem = divmod(network.prefixlen, 16)
+        count = full + (1 if rem else 0)  # 需要匹配的段数
+        if count == 0:
+            return Q(**{"{}__contains".format(name): ':'})
+        values = [f"{x:x}" for x in hextets[:full]]
+        zeros = [x == 0 for x in hextets[:full]]
+        if rem:
+            values.append(cls.get_hex_range_regex(hextets[full], hextets[full] + 2 ** (16 - rem) - 1))
+            zeros.append(hextets[full] == 0)
+
+        if rem == 0 and count < 8:
+            q = Q(**{"{}__startswith".format(name): ':'.join(values) + ':'})
+        else:
+            q = Q(**{"{}__regex".format(name): '^' + ':'.join(values) + (':' if count < 8 else '$')})
+        patterns = []
+        for start in range(count):
+            prefix = ':'.join(values[:start])
+            for end in range(start + 2, 9):
+                if not all(zeros[start:min(end, count)]):
+                    break
+                if end >= count:
+                    # :: 覆盖剩余的匹配段，:: 后最多 8-end 段，end 取最小值时包含其他情况
+                    tail = 8 - end
+                    suffix = f"({group}(:{group}){{0,{tail - 1}}})?" if tail > 0 else ''
+                    patterns.append(f"^{prefix}::{suffix}$")
+                    break
+                suffix = ''.join(f":{group}" for _ in range(8 - count))
+                patterns.append(f"^{prefix}::{':'.join(values[end:count])}{suffix}$")
+        if patterns:
+            q |= Q(**{"{}__regex".format(name): '|'.join(f"({x})" for x in patterns)})
+        # IPv4 映射地址存储为 ::ffff:1.2.3.4，需要单独按 IPv4 匹配
+        mapped = ipaddress.IPv6Network('::ffff:0:0/96')
+        if network.overlaps(mapped):
+            if network.prefixlen <= mapped.prefixlen:
+                ipv4_network = ipaddress.IPv4Network('0.0.0.0/0')
+            else:
+                ipv4_network = ipaddress.IPv4Network((network.network_address.ipv4_mapped, network.prefixlen - 96))
+            q |= cls.get_ipv4_block_q(name, ipv4_network, '::ffff:')
+        return q
+
+    @staticmethod
+    def get_ip_values(ip):
+        """IPv4 映射地址存储为 ::ffff:1.2.3.4，部分 Python 版本格式化为 ::ffff:102:304，两种格式都需要匹配"""
+        values = [str(ip)]
+        if ip.version == 6 and ip.ipv4_mapped:
+            values.append(f"::ffff:{ip.ipv4_mapped}")
+        return list(dict.fromkeys(values))
+
+    @classmethod
+    def get_ip_range_q(cls, name, version, start, end, native=False):
+        """
+        :param native: 数据库是否支持 inet 类型，例如 PostgreSQL，支持则直接使用范围查询
+        """
+        # 按版本构造地址，ip_address 会将小于 2**32 的 IPv6 整数转换为 IPv4 地址
+        address_class = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        start_ip, end_ip = address_class(start), address_class(end)
+        if start == end:
+            return Q(**{"{}__in".format(name): cls.get_ip_values(start_ip)})
+        if native:
+            return Q(**{"{}__range".format(name): (str(start_ip), str(end_ip))})
         q = Q()
+        for network in ipaddress.summarize_address_range(start_ip, end_ip):
+            if version == 4:
+                q |= cls.get_ipv4_block_q(name, network)
+            elif network.num_addresses <= 256:
+                q |= Q(**{"{}__in".format(name): [x for ip in network for x in cls.get_ip_values(ip)]})
+            else:
+                q |= cls.get_ipv6_block_q(name, network)
+        return q
+
+    @classmethod
+    def get_ip_in_q(cls, name, val):
+        """
+        支持 单个IP，IP段(10.1.1.1-10.1.1.20)，CIDR，IP前缀(192.168) 的混合列表
+        IP，IP段，CIDR 合并为区间后生成范围条件，条件数量和区间数量相关，和IP数量无关
+        """
         if isinstance(val, str):
             val = [val]
-        if ['*'] in val:
+        if ['*'] in val or '*' in val:
             return Q()
-        for ip in val:
-            if not ip:
-                continue
-            try:
-                if '/' in ip:
-                    network = ipaddress.ip_network(ip)
-                    ips = network.hosts()
-                    q |= Q(**{"{}__in".format(name): ips})
-                elif '-' in ip:
-                    start_ip, end_ip = ip.split('-')
-                    start_ip = ipaddress.ip_address(start_ip)
-                    end_ip = ipaddress.ip_address(end_ip)
-                    q |= Q(**{"{}__range".format(name): (start_ip, end_ip)})
-                elif len(ip.split('.')) == 4:
-                    q |= Q(**{"{}__exact".format(name): ip})
-                else:
-                    q |= Q(**{"{}__startswith".format(name): ip})
-            except ValueError:
-                continue
+        intervals, others = merge_ip_intervals(val)
+        native = connection.vendor == 'postgresql'
+        q = Q()
+        for version, items in intervals.items():
+            for start, end in items:
+                q |= cls.get_ip_range_q(name, version, start, end, native)
+        for ip in others:
+            if ip and '/' not in ip and '-' not in ip:
+                q |= Q(**{"{}__startswith".format(name): ip})
         return q
 
     @classmethod
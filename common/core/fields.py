@@ -8,7 +8,7 @@ from functools import partial
 
 import phonenumbers
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
 from django.db.models import Model
 from django.db.models.fields.files import FieldFile
 from django.utils.translation import gettext_lazy as _
@@ -109,6 +109,7 @@ class BasePrimaryKeyRelatedField(serializers.RelatedField):
     """
     Base class for primary key related fields.
     """
+    prefetched_objects = None  # 批量导入时预先查询的关联数据 {str(pk): obj}
     default_error_messages = {
         "required": _("This field is required."),
         "does_not_exist": _('Invalid pk "{pk_value}" - object does not exist.'),
@@ -134,6 +135,14 @@ class BasePrimaryKeyRelatedField(serializers.RelatedField):
     def use_pk_only_optimization(self):
         return False
 
+    @staticmethod
+    def get_prefetch_key(pk, model):
+        try:
+            pk = model._meta.pk.to_python(pk)
+        except (DjangoValidationError, TypeError, ValueError):
+            return None
+        return str(pk) if pk is not None else None
+
     def __add_request(self):
         if not self.request:
             self.request = get_current_request()
@@ -247,6 +256,13 @@ class BasePrimaryKeyRelatedField(serializers.RelatedField):
         try:
             if isinstance(data, bool):
                 raise TypeError
+            if self.prefetched_objects is not None:
+                # 批量导入时，关联数据已提前批量查询
+                key = self.get_prefetch_key(pk, queryset.model)
+                if key is not None:
+                    if key in self.prefetched_objects:
+                        return self.prefetched_objects[key]
+                    raise ObjectDoesNotExist
             return queryset.get(pk=pk)
         except ObjectDoesNotExist:
             self.fail("does_not_exist", pk_value=pk)
@@ -4,10 +4,12 @@
 # filename : filter
 # author : ly_13
 # date : 6/2/2023
+import copy
 import datetime
 import json
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.models import Q, QuerySet
 from django.forms.utils import from_current_timezone
@@ -19,7 +21,7 @@ from django_filters.fields import MultipleChoiceField
 from rest_framework.exceptions import NotAuthenticated
 from rest_framework.filters import BaseFilterBackend
 
-from common.base.magic import timeit, count_sql_queries
+from common.base.magic import timeit, count_sql_queries, MagicCacheData
 from common.cache.storage import CommonResourceIDsCache
 from common.core.db.utils import RelatedManager
 from common.utils import get_logger
@@ -28,7 +30,8 @@ from system.models import UserInfo, DataPermission, ModeTypeAbstract, DeptInfo,
 logger = get_logger(__name__)
 
 
-def get_filter_q_base(model, permission, user_obj=None, dept_obj=None):
+def get_filter_rules(model, permission):
+    """获取数据权限中和模型相关的规则，该部分仅和规则数据有关，可以缓存"""
     results = []
     for obj in permission:
         rules = []
@@ -45,6 +48,11 @@ def get_filter_q_base(model, permission, user_obj=None, dept_obj=None):
                 rules.append(rule)
         if rules:
             results.append({'mode': obj.mode_type, 'rules': rules})
+    return results
+
+
+def get_filter_q_by_rules(model, results, user_obj=None, dept_obj=None):
+    """将规则转换为Q，规则中的动态数据，例如 本人ID，部门ID，时间等，在此处替换，注意：该方法会修改 results 数据"""
     or_qs = []
     if not results:
         return Q(id=0)
@@ -141,6 +149,52 @@ def get_filter_q_base(model, permission, user_obj=None, dept_obj=None):
     return q1
 
 
+def get_filter_q_base(model, permission, user_obj=None, dept_obj=None):
+    return get_filter_q_by_rules(model, get_filter_rules(model, permission), user_obj, dept_obj)
+
+
+class DataPermissionVersion(object):
+    """
+    数据权限规则版本号，规则，部门，用户变动时增加版本号，数据权限执行计划缓存随之失效
+    """
+    cache_key = 'data_permission_version'
+
+    @classmethod
+    def get_version(cls, user_pk):
+        user_key = f"{cls.cache_key}_{user_pk}"
+        data = cache.get_many([cls.cache_key, user_key])
+        return f"{data.get(cls.cache_key, 0)}.{data.get(user_key, 0)}"
+
+    @classmethod
+    def incr_version(cls, user_pks=None):
+        """
+        :param user_pks: 为空则增加全局版本号
+        """
+        keys = [f"{cls.cache_key}_{pk}" for pk in user_pks] if user_pks is not None else [cls.cache_key]
+        for key in keys:
+            cache.incr(key, ignore_key_check=True)
+
+
+@MagicCacheData.make_cache(timeout=3600, local_timeout=60, cache_failure=False,
+                           key_func=lambda user_obj, model, menu, version: f"{user_obj.pk}_{menu}_{model._meta.label_lower}_{version}")
+def get_data_permission_plan(user_obj: UserInfo, model, menu, version):
+    """
+    用户对某个模型的数据权限执行计划，仅包含规则数据，动态数据在生成Q的时候替换
+    :return: {'depts': [部门及上级部门规则列表], 'user': 个人规则，不存在个人授权则为 None}
+    """
+    dq = Q(menu__isnull=True) | Q(menu__isnull=False, menu__pk=menu)
+    plan = {'depts': [], 'user': None}
+    if user_obj.dept_id:
+        dept_pks = DeptInfo.recursion_dept_info(user_obj.dept_id, is_parent=True)
+        for p_dept_obj in DeptInfo.objects.filter(pk__in=dept_pks, is_active=True):
+            permission = DataPermission.objects.filter(is_active=True).filter(deptinfo=p_dept_obj).filter(dq)
+            plan['depts'].append(get_filter_rules(model, permission))
+    permission = DataPermission.objects.filter(is_active=True).filter(userinfo=user_obj).filter(dq)
+    if permission.exists():
+        plan['user'] = get_filter_rules(model, permission)
+    return plan
+
+
 @timeit
 @count_sql_queries
 def get_filter_queryset(queryset: QuerySet, user_obj: UserInfo):
@@ -153,6 +207,7 @@ def get_filter_queryset(queryset: QuerySet, user_obj: UserInfo):
     b.判断外层规则 【如果规则数量为一个，则模式该规则链为或模式】
         若模式为或模式，并存在全部数据，则直接返回queryset
         若模式为且模式，则 返回queryset.filter(规则)
+    规则数据通过 get_data_permission_plan 缓存，规则变动时通过 DataPermissionVersion 失效
     """
     if not settings.PERMISSION_DATA_ENABLED or queryset is None:
         return queryset
@@ -161,33 +216,39 @@ def get_filter_queryset(queryset: QuerySet, user_obj: UserInfo):
         logger.info(f"superuser: {user_obj.username}. return all queryset {queryset.model._meta.label_lower}")
         return queryset
 
+    # 同一个请求中，版本号仅获取一次
+    version = getattr(user_obj, '_data_permission_version', None)
+    if version is None:
+        version = DataPermissionVersion.get_version(user_obj.pk)
+        user_obj._data_permission_version = version
+    menu = getattr(user_obj, 'menu', None)
+    plan = get_data_permission_plan(user_obj, queryset.model, menu, version)
+    if not isinstance(plan, dict):
+        # 缓存数据异常，跳过缓存重新生成
+        logger.warning(f"get data permission plan from cache failed. {queryset.model._meta.label}")
+        plan = get_data_permission_plan.__wrapped__(user_obj, queryset.model, menu, version)
+
     dept_obj = user_obj.dept
     q = Q()
-    dq = Q(menu__isnull=True) | Q(menu__isnull=False, menu__pk=getattr(user_obj, 'menu', None))
     has_dept = False
     if dept_obj:
         # 存在部门，递归获取部门，类似树结构，部门权限需要且模式，将获取到的所有部门的数据规则通过且操作
-        dept_pks = DeptInfo.recursion_dept_info(dept_obj.pk, is_parent=True)
-        for p_dept_obj in DeptInfo.objects.filter(pk__in=dept_pks, is_active=True):
-            # 获取对应的数据权限
-            permission = DataPermission.objects.filter(is_active=True).filter(deptinfo=p_dept_obj).filter(dq)
+        for results in plan['depts']:
             # 将数据权限且操作
-            q &= get_filter_q_base(queryset.model, permission, user_obj, dept_obj)
+            q &= get_filter_q_by_rules(queryset.model, copy.deepcopy(results), user_obj, dept_obj)
             has_dept = True
         if not has_dept and q == Q():
             q = Q(id=0)
         if has_dept and q == Q():
             return queryset
-    # 获取个人单独授权规则
-    permission = DataPermission.objects.filter(is_active=True).filter(userinfo=user_obj).filter(dq)
     # 不存在个人单独授权，则返回部门规则授权
-    if not permission.count():
+    if plan['user'] is None:
         logger.info(f"get filter end. {queryset.model._meta.label} : {q}")
         if has_dept:
             return queryset.filter(q)
         else:
             return queryset.none()  # 没有任何授权，返回 none
-    q1 = get_filter_q_base(queryset.model, permission, user_obj, dept_obj)
+    q1 = get_filter_q_by_rules(queryset.model, copy.deepcopy(plan['user']), user_obj, dept_obj)
     if q1 == Q():
         q = q1
     else:
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : importer
+# author : ly_13
+# date : 10/18/2026
+import itertools
+
+from django.core.exceptions import ValidationError as DjangoValidationError, FieldDoesNotExist
+from django.db import models, transaction, DatabaseError, connections
+from django.db.models.signals import post_save, pre_save, m2m_changed
+from django.dispatch.dispatcher import _make_id
+from rest_framework import mixins
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import ManyRelatedField
+from rest_framework.utils import model_meta
+
+from common.core.fields import BasePrimaryKeyRelatedField
+from common.core.serializers import BaseModelSerializer
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class BulkImporter(object):
+    """
+    批量导入数据，分批校验，关联数据与待更新数据每批一次查询，通过 bulk_create/bulk_update 写入
+    模型或序列化存在自定义保存逻辑（save, create, update, 为该模型注册的 post_save 信号等）时不支持，需使用逐条导入
+    未指定 sender 的全局信号接收者（例如 imagekit, 消息通知缓存）不影响批量导入，写入后会发送 post_save 和 m2m_changed 信号
+    importer = BulkImporter(view, ignore_error=True)
+    if importer.is_supported('create'):
+        count, errors = importer.run('create', data)
+    """
+
+    def __init__(self, view, ignore_error=False, batch_size=500):
+        self.view = view
+        self.ignore_error = ignore_error
+        self.batch_size = batch_size
+        self.serializer = None
+        self.callable_default_fields = {}
+        self.model = view.get_queryset().model
+        self.field_info = model_meta.get_field_info(self.model)
+
+    def get_m2m_fields(self, field_names):
+        result = {}
+        for name in field_names:
+            relation = self.field_info.relations.get(name)
+            if relation and relation.to_many:
+                result[name] = self.model._meta.get_field(name)
+        return result
+
+    @staticmethod
+    def has_sender_listeners(signal, sender):
+        """是否存在为 sender 单独注册的信号接收者，忽略全局接收者"""
+        sender_id = _make_id(sender)
+        return any(lookup_key[1] == sender_id for lookup_key, *_ in signal.receivers)
+
+    def is_supported(self, act):
+        model = self.model
+        view_class = self.view.__class__
+        serializer_class = self.view.get_serializer_class()
+        opts = model._meta
+        if act == 'create':
+            if view_class.perform_create is not mixins.CreateModelMixin.perform_create:
+                return False
+            if getattr(serializer_class, 'create') is not BaseModelSerializer.create:
+                return False
+            # 自增主键需要数据库支持 bulk_create 返回主键，用于写入多对多数据
+            db = self.view.get_queryset().db
+            if not opts.pk.has_default() and not connections[db].features.can_return_rows_from_bulk_insert:
+                return False
+        elif act == 'update':
+            if view_class.perform_update is not mixins.UpdateModelMixin.perform_update:
+                return False
+            if getattr(serializer_class, 'update') is not BaseModelSerializer.update:
+                return False
+        else:
+            return False
+        if model.save is not models.Model.save or opts.parents or self.has_sender_listeners(post_save, model):
+            return False
+        for field in opts.get_fields():
+            if field.is_relation and field.related_model and field.related_model._meta.label == "system.UploadFile":
+                return False
+            if isinstance(field, models.ManyToManyField):
+                if not field.remote_field.through._meta.auto_created:
+                    return False
+                if self.has_sender_listeners(m2m_changed, field.remote_field.through):
+                    return False
+        return True
+
+    @staticmethod
+    def get_relation_pk(field, value):
+        if isinstance(value, models.Model):
+            return value.pk
+        if isinstance(value, dict):
+            return value.get("id") or value.get("pk") or value.get(field.attrs[0])
+        return value
+
+    def get_related_fields(self):
+        for field in self.serializer.fields.values():
+            if field.read_only:
+                continue
+            if isinstance(field, ManyRelatedField) and isinstance(field.child_relation, BasePrimaryKeyRelatedField):
+                yield field.field_name, field.child_relation, True
+            elif isinstance(field, BasePrimaryKeyRelatedField):
+                yield field.field_name, field, False
+
+    def prefetch_related_objects(self, rows):
+        """每个关联字段一次查询，查询结果缓存在字段上，校验时直接使用"""
+        for field_name, field, many in self.get_related_fields():
+            queryset = field.get_queryset()
+            if queryset is None:
+                continue
+            pks = set()
+            for row in rows:
+                values = row.get(field_name)
+                if values is None:
+                    continue
+                if not many or not isinstance(values, (list, tuple)):
+                    values = [values]
+                for value in values:
+                    pk = field.get_prefetch_key(self.get_relation_pk(field, value), queryset.model)
+                    if pk is not None:
+                        pks.add(pk)
+            field.prefetched_objects = {str(k): v for k, v in queryset.in_bulk(pks).items()} if pks else {}
+
+    def get_pk_key(self, value):
+        try:
+            pk = self.model._meta.pk.to_python(value)
+        except (DjangoValidationError, TypeError, ValueError):
+            return None
+        return str(pk) if pk is not None else None
+
+    def get_instances(self, rows):
+        """待更新数据每批一次查询"""
+        pks = {self.get_pk_key(row.get('pk')) for row in rows}
+        pks.discard(None)
+        queryset = self.view.filter_queryset(self.view.get_queryset())
+        return {str(k): v for k, v in queryset.in_bulk(pks).items()} if pks else {}
+
+    def get_callable_default_fields(self):
+        """
+        序列化字段的默认值在字段初始化时由模型的 default() 生成，复用序列化对象时每行数据的默认值相同(例如 uuid 主键)
+        :return: {序列化字段名: 模型字段名}，数据中未传值时去掉，由模型重新生成默认值
+        """
+        result = {}
+        for field in self.serializer.fields.values():
+            if field.read_only or field.source == '*':
+                continue
+            try:
+                model_field = self.model._meta.pk if field.source == 'pk' else self.model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if callable(getattr(model_field, 'default', None)):
+                result[field.field_name] = field.source
+        return result
+
+    def validate(self, index, row, instance=None):
+        """复用同一个序列化对象校验，避免每行数据都初始化序列化字段"""
+        self.serializer.instance = instance
+        self.serializer.initial_data = row
+        try:
+            validated_data = self.serializer.run_validation(row)
+        except ValidationError as e:
+            if not self.ignore_error:
+                raise
+            return None, {'row': index + 1, 'errors': e.detail}
+        for field_name, source in self.callable_default_fields.items():
+            if field_name not in row:
+                validated_data.pop(source, None)
+        return validated_data, None
+
+    def run(self, act, data):
+        """
+        :return: 导入成功数量，错误信息列表 [{'row': 行号, 'errors': 错误信息}]
+        """
+        self.serializer = self.view.get_serializer(partial=act == 'update')
+        self.callable_default_fields = self.get_callable_default_fields()
+        count, errors = 0, []
+        for batch_index, rows in enumerate(itertools.batched(data, self.batch_size)):
+            offset = batch_index * self.batch_size
+            self.prefetch_related_objects(rows)
+            instances = self.get_instances(rows) if act == 'update' else {}
+            items = []
+            for index, row in enumerate(rows, offset):
+                instance = None
+                if act == 'update':
+                    instance = instances.get(self.get_pk_key(row.get('pk')))
+                    if instance is None:
+                        continue
+                validated_data, error = self.validate(index, row, instance)
+                if error:
+                    errors.append(error)
+                    continue
+                items.append((index, instance, validated_data))
+            if items:
+                count += self.save(act, items, errors)
+        return count, errors
+
+    def save(self, act, items, errors):
+        try:
+            with transaction.atomic():
+                if act == 'create':
+                    self.bulk_create(items)
+                else:
+                    self.bulk_update(items)
+            return len(items)
+        except DatabaseError as e:
+            if not self.ignore_error:
+                raise
+            logger.warning(f"bulk {act} {self.model} failed, retry one by one. {e}")
+        # 批量写入失败，逐条写入定位错误数据
+        count = 0
+        for index, instance, validated_data in items:
+            try:
+                with transaction.atomic():
+                    if act == 'create':
+                        self.serializer.create(validated_data)
+                    else:
+                        self.serializer.update(instance, validated_data)
+                count += 1
+            except DatabaseError as e:
+                errors.append({'row': index + 1, 'errors': [str(e)]})
+        return count
+
+    @staticmethod
+    def send_m2m_changed(through, related_model, items, action, using):
+        """直接写入中间表不会触发信号，手动发送，与 add/clear 一致"""
+        if not m2m_changed.has_listeners(through):
+            return
+        for obj, pk_set in items:
+            if action.endswith('clear'):
+                pk_set = None
+            elif not pk_set:
+                continue
+            m2m_changed.send(sender=through, action=action, instance=obj, reverse=False, model=related_model,
+                             pk_set=pk_set, using=using)
+
+    def set_m2m_data(self, objs_m2m, clear=False):
+        """多对多数据直接写入中间表，每个字段一次删除一次写入"""
+        using = self.view.get_queryset().db
+        relations = {}
+        for obj, m2m_data in objs_m2m:
+            for name, values in m2m_data.items():
+                pk_set = {value.pk if isinstance(value, models.Model) else value for value in values}
+                relations.setdefault(name, []).append((obj, pk_set))
+        for name, items in relations.items():
+            field = self.model._meta.get_field(name)
+            through = field.remote_field.through
+            source_name = f"{field.m2m_field_name()}_id"
+            target_name = f"{field.m2m_reverse_field_name()}_id"
+            if clear:
+                self.send_m2m_changed(through, field.related_model, items, 'pre_clear', using)
+                through.objects.filter(**{f"{source_name}__in": [obj.pk for obj, _ in items]}).delete()
+                self.send_m2m_changed(through, field.related_model, items, 'post_clear', using)
+            self.send_m2m_changed(through, field.related_model, items, 'pre_add', using)
+            through_objs = []
+            for obj, pk_set in items:
+                for pk in pk_set:
+                    through_objs.append(through(**{source_name: obj.pk, target_name: pk}))
+            through.objects.bulk_create(through_objs, batch_size=self.batch_size, ignore_conflicts=True)
+            self.send_m2m_changed(through, field.related_model, items, 'post_add', using)
+
+    def send_post_save(self, objs, created, using):
+        """bulk_create/bulk_update 不会触发 post_save，手动发送给全局接收者"""
+        if not post_save.has_listeners(self.model):
+            return
+        for obj in objs:
+            post_save.send(sender=self.model, instance=obj, created=created, update_fields=None, raw=False,
+                           using=using)
+
+    def split_m2m_data(self, validated_data):
+        m2m_data = {}
+        for name in self.get_m2m_fields(list(validated_data.keys())):
+            m2m_data[name] = validated_data.pop(name)
+        return validated_data, m2m_data
+
+    def bulk_create(self, items):
+        objs, objs_m2m = [], []
+        using = self.view.get_queryset().db
+        for index, instance, validated_data in items:
+            validated_data, m2m_data = self.split_m2m_data(dict(validated_data))
+            obj = self.model(**validated_data)
+            # 保持与 save 一致，设置创建人等信息
+            pre_save.send(sender=self.model, instance=obj, raw=False, using=using, update_fields=None)
+            objs.append(obj)
+            objs_m2m.append((obj, m2m_data))
+        self.model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.send_post_save(objs, True, using)
+        self.set_m2m_data(objs_m2m)
+
+    def bulk_update(self, items):
+        objs, objs_m2m, update_fields = [], [], set()
+        using = self.view.get_queryset().db
+        concrete_fields = {field.name: field for field in self.model._meta.concrete_fields}
+        auto_now_fields = [f for f in concrete_fields.values() if getattr(f, 'auto_now', False)]
+        for index, instance, validated_data in items:
+            validated_data, m2m_data = self.split_m2m_data(dict(validated_data))
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+                if attr in concrete_fields:
+                    update_fields.add(attr)
+            pre_save.send(sender=self.model, instance=instance, raw=False, using=using, update_fields=None)
+            for field in auto_now_fields:
+                field.pre_save(instance, False)
+            objs.append(instance)
+            objs_m2m.append((instance, m2m_data))
+        if 'modifier' in concrete_fields:
+            update_fields.add('modifier')
+        update_fields.update(field.name for field in auto_now_fields)
+        update_fields.discard(self.model._meta.pk.name)
+        if update_fields:
+            self.model.objects.bulk_update(objs, list(update_fields), batch_size=self.batch_size)
+        self.send_post_save(objs, False, using)
+        self.set_m2m_data(objs_m2m, clear=True)
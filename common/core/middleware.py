@@ -13,6 +13,7 @@ from django.contrib.auth.models import AnonymousUser
 from django.utils.deprecation import MiddlewareMixin
 from rest_framework.utils import encoders
 
+from common.core.db.buffer import BulkCreateBuffer
 from common.utils import get_logger
 from common.utils.request import get_request_user, get_request_ip, get_request_data, get_os, \
     get_browser, get_verbose_name
@@ -20,6 +21,9 @@ from system.models import OperationLog
 
 logger = get_logger(__name__)
 
+operation_log_buffer = BulkCreateBuffer(OperationLog, batch_size=getattr(settings, 'API_LOG_BATCH_SIZE', 100),
+                                        interval=getattr(settings, 'API_LOG_FLUSH_INTERVAL', 2))
+
 
 class ApiLoggingMiddleware(MiddlewareMixin):
 
@@ -28,7 +32,7 @@ class ApiLoggingMiddleware(MiddlewareMixin):
         self.enable = getattr(settings, 'API_LOG_ENABLE', None) or False
         self.methods = getattr(settings, 'API_LOG_METHODS', None) or set()
         self.ignores = getattr(settings, 'API_LOG_IGNORE', None) or {}
-        self.operation_log_id = '__operation_log_id'
+        self.operation_log_flag = '__operation_log'
 
     @classmethod
     def __handle_request(cls, request):
@@ -43,23 +47,18 @@ class ApiLoggingMiddleware(MiddlewareMixin):
         if exec_time > 1:
             logger.warning(
                 f"exec time {exec_time} over 1s. {request.method} {request.path} {getattr(request, 'request_data', {})}")
-        # 判断有无log_id属性，使用All记录时，会出现此情况
-        operation_log_id = getattr(request, self.operation_log_id, None)
-        if operation_log_id is None:
+        # 判断有无日志标记，使用All记录时，会出现此情况
+        if not getattr(request, self.operation_log_flag, False):
             return
 
         body = getattr(request, 'request_data', {})
         # 请求含有password则用*替换掉(暂时先用于所有接口的password请求参数)
         if isinstance(body, dict) and body.get('password', ''):
             body['password'] = '*' * len(body['password'])
-        if not hasattr(response, 'data') or not isinstance(response.data, dict):
-            response.data = {}
-        try:
-            if not response.data and response.content:
-                content = json.loads(response.content.decode().replace('\\', ''))
-                response.data = content if isinstance(content, dict) else {}
-        except Exception:
-            return
+        # 直接使用 DRF 响应数据，不再解析响应内容
+        data = getattr(response, 'data', None)
+        if not isinstance(data, dict):
+            data = {}
         user = get_request_user(request)
         request_module = getattr(request, 'request_module', '')
         if hasattr(response, 'renderer_context'):
@@ -73,27 +72,28 @@ class ApiLoggingMiddleware(MiddlewareMixin):
                 action_doc = request_module
         else:
             action_doc = request_module
+        user = user if not isinstance(user, AnonymousUser) else None
+        # bulk_create 不会触发 pre_save 信号，需要手动设置 modifier，字段长度按模型定义截断
         info = {
-            'module': action_doc,
-            'creator': user if not isinstance(user, AnonymousUser) else None,
+            'module': str(action_doc)[:64] if action_doc else action_doc,
+            'creator': user,
+            'modifier': user,
             'dept_belong_id': getattr(request.user, 'dept_id', None),
             'ipaddress': getattr(request, 'request_ip'),
-            'method': request.method,
-            'path': request.path,
+            'method': request.method[:8],
+            'path': request.path[:400],
             'body': json.dumps(body) if isinstance(body, dict) else body,
             'response_code': response.status_code,
-            'system': get_os(request),
-            'browser': get_browser(request),
-            'status_code': response.data.get('code'),
+            'system': get_os(request)[:64],
+            'browser': get_browser(request)[:64],
+            'status_code': data.get('code'),
             'request_uuid': getattr(request, 'request_uuid', None),
             'exec_time': time.time() - request_start_time,
-            'response_result': json.dumps({"code": response.data.get('code'), "data": response.data.get('data'),
-                                           "detail": response.data.get('detail')}, cls=encoders.JSONEncoder),
+            'response_result': json.dumps({"code": data.get('code'), "data": data.get('data'),
+                                           "detail": data.get('detail')}, cls=encoders.JSONEncoder),
         }
-        try:
-            OperationLog.objects.update_or_create(defaults=info, id=operation_log_id)
-        except Exception:  # sqlite3 数据库因为锁表可能会导致日志记录失败
-            pass
+        # 放入缓冲队列，后台线程批量写入
+        operation_log_buffer.put(OperationLog(**info))
         del info['request_uuid']
         logger.debug(f"request end. {request.method} {request.path} {getattr(request, 'request_data', {})} log:{info}")
         return True
@@ -110,9 +110,7 @@ class ApiLoggingMiddleware(MiddlewareMixin):
                         v = settings.API_MODEL_MAP.get(request.path, v)
                         if not v and model:
                             v = model._meta.label
-                    log = OperationLog(module=v)
-                    log.save()
-                    setattr(request, self.operation_log_id, log.id)
+                    setattr(request, self.operation_log_flag, True)
                     setattr(request, 'request_module', v)
 
         return
@@ -4,6 +4,7 @@
 # filename : modelset
 # author : ly_13
 # date : 6/2/2023
+import copy
 import itertools
 import json
 import math
@@ -12,9 +13,12 @@ from hashlib import md5
 from typing import Callable
 
 from django.conf import settings
-from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction, models
+from django.db.models import Q, Case, When, Value, IntegerField
 from django.forms.widgets import SelectMultiple, DateTimeInput
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, get_language
+from django_filters.filters import QuerySetRequestMixin
 from django_filters.utils import get_model_field
 from django_filters.widgets import DateRangeWidget
 from drf_spectacular.plumbing import build_object_type, build_basic_type, build_array_type
@@ -27,14 +31,19 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.utils import encoders
 from rest_framework.viewsets import GenericViewSet
 
-from common.base.magic import cache_response
+from common.base.magic import MagicCacheTag, DEFAULT_CACHE_CONTROL
 from common.base.utils import get_choices_dict
+from common.cache.local import LocalLRUCache
 from common.core.config import SysConfig
+from common.core.db.router import replica_router
+from common.core.importer import BulkImporter
+from common.core.pagination import PageNumber
 from common.core.response import ApiResponse
 from common.core.serializers import BasePrimaryKeyRelatedField
 from common.core.utils import has_self_fields, topological_sort
 from common.drf.renders.csv import CSVFileRenderer
 from common.drf.renders.excel import ExcelFileRenderer
+from common.drf.renders.stream import CSVFileStreamRenderer, ExcelFileStreamRenderer
 from common.swagger.utils import get_default_response_schema
 from common.tasks import background_task_view_set_job
 from common.utils import get_logger
@@ -106,29 +115,37 @@ def run_view_by_celery_task(view, request, kwargs, data, batch_length=100):
 
 
 class CacheDetailResponseMixin(object):
+    cache_control = DEFAULT_CACHE_CONTROL
+
     def get_cache_key(self, view_instance, view_method, request, args, kwargs):
         func_name = f'{view_instance.__class__.__name__}_{view_method.__name__}'
         return f"{func_name}_{request.user.pk}"
 
+    def get_cache_tags(self, view_instance, view_method, request, args, kwargs):
+        return [f"{view_instance.__class__.__name__}_{view_method.__name__}:{request.user.pk}"]
+
     @classmethod
     def invalid_cache(cls, pk, methods=None):
         if methods is None:
             methods = ['retrieve', 'get']
-        for method in methods:
-            cache_response.invalid_cache(f'{cls.__name__}_{method}_{pk}')
+        MagicCacheTag.invalid([f'{cls.__name__}_{method}:{pk}' for method in methods])
 
 
 class CacheListResponseMixin(object):
+    cache_control = DEFAULT_CACHE_CONTROL
+
     def get_cache_key(self, view_instance, view_method, request, args, kwargs):
         func_name = f'{view_instance.__class__.__name__}_{view_method.__name__}'
         return f"{func_name}_{request.user.pk}_{md5(json.dumps(request.query_params, sort_keys=True).encode('utf-8')).hexdigest()}"
 
+    def get_cache_tags(self, view_instance, view_method, request, args, kwargs):
+        return [f"{view_instance.__class__.__name__}_{view_method.__name__}:{request.user.pk}"]
+
     @classmethod
     def invalid_cache(cls, pk, methods=None):
         if methods is None:
             methods = ['list']
-        for method in methods:
-            cache_response.invalid_cache(f'{cls.__name__}_{method}_{pk}')
+        MagicCacheTag.invalid([f'{cls.__name__}_{method}:{pk}' for method in methods])
 
 
 class UploadFileAction(object):
@@ -169,20 +186,105 @@ class UploadFileAction(object):
 
 
 class RankAction(object):
+    """
+    排序，支持两种请求数据
+    1.全部排序 [pk1, pk2, ...]，通过一条 CASE WHEN 语句更新
+    2.移动单条数据 {"pk": pk, "prev": 移动后上一条数据pk, "next": 移动后下一条数据pk}，使用间隔排序，
+      新的排序值取前后数据的中间值，仅更新一条数据，没有间隔时将数据插入到目标位置并按 rank_gap 重新排序
+      prev 和 next 可只传一个，另一侧取实际相邻的数据
+    """
     filter_queryset: Callable
     get_queryset: Callable
+    rank_field = 'rank'
+    rank_gap = 1  # 排序间隔，默认为连续排序，大于 1 时移动单条数据只需更新一条数据
+
+    def get_rank_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def set_ranks(self, pks, start=1):
+        """按 pks 顺序批量设置排序值，一条 update 语句"""
+        if not pks:
+            return 0
+        whens = [When(pk=pk, then=Value(rank * self.rank_gap)) for rank, pk in enumerate(pks, start)]
+        return self.get_rank_queryset().filter(pk__in=pks).update(
+            **{self.rank_field: Case(*whens, output_field=IntegerField())})
+
+    def get_neighbour_rank(self, queryset, pk, rank, after):
+        """获取 pk 前一条或后一条数据的排序值，与排序规则 (rank_field, pk) 一致"""
+        lookup, ordering = ('gt', (self.rank_field, 'pk')) if after else ('lt', (f"-{self.rank_field}", '-pk'))
+        queryset = queryset.filter(Q(**{f"{self.rank_field}__{lookup}": rank}) | Q(
+            **{self.rank_field: rank, f"pk__{lookup}": pk})).order_by(*ordering)
+        return queryset.values_list(self.rank_field, flat=True).first()
+
+    def get_move_rank(self, pk, prev_pk, next_pk):
+        """
+        :return: 移动后的排序值，前后数据之间没有间隔时返回 None，前后数据不存在时抛出 ValueError
+        """
+        queryset = self.get_rank_queryset().exclude(pk=pk)
+        ranks = dict(queryset.filter(pk__in=[x for x in [prev_pk, next_pk] if x is not None]).values_list(
+            'pk', self.rank_field))
+        ranks = {str(k): v for k, v in ranks.items()}
+        prev_rank, next_rank = ranks.get(str(prev_pk)), ranks.get(str(next_pk))
+        if (prev_pk is not None and prev_rank is None) or (next_pk is not None and next_rank is None) or (
+                prev_rank is None and next_rank is None):
+            raise ValueError
+        # 仅传了一侧时，另一侧取实际相邻的数据，避免与其排序值相同
+        if next_pk is None:
+            next_rank = self.get_neighbour_rank(queryset, prev_pk, prev_rank, True)
+        elif prev_pk is None:
+            prev_rank = self.get_neighbour_rank(queryset, next_pk, next_rank, False)
+        if next_rank is None:
+            return prev_rank + self.rank_gap
+        if prev_rank is None:
+            return next_rank - self.rank_gap
+        if next_rank - prev_rank > 1:
+            return (prev_rank + next_rank) // 2
+        return None
+
+    def insert_rank(self, pk, prev_pk, next_pk):
+        """没有间隔时，将数据插入到指定位置，并按 rank_gap 重新排序"""
+        pks = list(self.get_rank_queryset().exclude(pk=pk).order_by(self.rank_field, 'pk').values_list(
+            'pk', flat=True))
+        str_pks = [str(x) for x in pks]
+        index = str_pks.index(str(prev_pk)) + 1 if prev_pk is not None else str_pks.index(str(next_pk))
+        pks.insert(index, pk)
+        return self.set_ranks(pks)
+
+    def move_rank(self, pk, prev_pk=None, next_pk=None):
+        if not self.get_rank_queryset().filter(pk=pk).exists():
+            return False
+        try:
+            rank = self.get_move_rank(pk, prev_pk, next_pk)
+        except ValueError:
+            return False
+        if rank is None:
+            self.insert_rank(pk, prev_pk, next_pk)
+        else:
+            self.get_rank_queryset().filter(pk=pk).update(**{self.rank_field: rank})
+        return True
+
+    def perform_rank(self, data):
+        if isinstance(data, dict):
+            return self.move_rank(data.get('pk'), data.get('prev'), data.get('next'))
+        self.set_ranks(list(data))
+        return True
 
     @extend_schema(
-        request=OpenApiRequest(build_array_type(build_basic_type(OpenApiTypes.STR))),
+        request=OpenApiRequest({'oneOf': [
+            build_array_type(build_basic_type(OpenApiTypes.STR)),
+            build_object_type(properties={
+                'pk': build_basic_type(OpenApiTypes.STR),
+                'prev': build_basic_type(OpenApiTypes.STR),
+                'next': build_basic_type(OpenApiTypes.STR),
+            }),
+        ]}),
         responses=get_default_response_schema()
     )
     @action(methods=['post'], detail=False, url_path='rank')
     def rank(self, request, *args, **kwargs):
         """{cls}排序"""
-        rank = 1
-        for pk in request.data:
-            self.filter_queryset(self.get_queryset()).filter(pk=pk).update(rank=rank)
-            rank += 1
+        if not self.perform_rank(request.data):
+            return ApiResponse(code=1001, detail=_("Operation failed. Abnormal data"))
         return ApiResponse(detail=_("Sorting saved successfully"))
 
 
@@ -222,7 +324,52 @@ class ChoicesAction(object):
         return ApiResponse(choices_dict=result)
 
 
-class SearchFieldsAction(object):
+def get_field_permission_version(request):
+    """字段权限标识，字段权限相同的用户共享查询字段和展示字段元数据缓存"""
+    if hasattr(request, "ignore_field_permission") or not settings.PERMISSION_FIELD_ENABLED:
+        return 'all'
+    if request.user and request.user.is_superuser:
+        return 'all'
+    fields = getattr(request, 'fields', None)
+    if not fields or not isinstance(fields, dict):
+        return 'none'
+    data = json.dumps({key: sorted(value) for key, value in fields.items()}, sort_keys=True)
+    return md5(data.encode('utf-8')).hexdigest()
+
+
+class SearchMetaCacheMixin(object):
+    """
+    查询字段和展示字段元数据缓存，按 (视图, 序列化, 字段权限, 语言) 缓存在进程内
+    关联字段可选项最多返回 search_choices_limit 条，超出时 choices_more 为 True，通过 search-related 接口分页查询
+    """
+    search_choices_limit = 100
+    search_meta_cache = LocalLRUCache(max_size=1024, timeout=3600)
+
+    def get_search_meta(self, name, func):
+        key = (f"{self.__class__.__module__}.{self.__class__.__name__}_{name}_{self.get_serializer_class().__name__}"
+               f"_{get_field_permission_version(self.request)}_{get_language()}")
+        data = self.search_meta_cache.get(key)
+        if data is None:
+            data = json.loads(json.dumps(func(), cls=encoders.JSONEncoder))
+            self.search_meta_cache.set(key, data)
+        return copy.deepcopy(data)
+
+    @staticmethod
+    def get_related_field(field):
+        relation = getattr(field, 'child_relation', field)
+        if isinstance(relation, BasePrimaryKeyRelatedField):
+            setattr(relation, 'is_column', True)
+            return relation
+        return None
+
+    def set_related_choices(self, info, choices):
+        if len(choices) > self.search_choices_limit:
+            choices = choices[:self.search_choices_limit]
+            info['choices_more'] = True
+        info['choices'] = choices
+
+
+class SearchFieldsAction(SearchMetaCacheMixin):
     filterset_class: Callable
 
     @extend_schema(
@@ -254,7 +401,23 @@ class SearchFieldsAction(object):
     @action(methods=['get'], detail=False, url_path='search-fields')
     def search_fields(self, request, *args, **kwargs):
         """获取{cls}的查询字段"""
+        data = self.get_search_meta('search_fields', self.get_search_fields_meta)
+        results = data['results']
+        filters = self.filterset_class.get_filters()
+        for index, field_name in data['related']:
+            value = filters[field_name]
+            queryset = value.get_queryset(request)
+            if queryset is None:
+                continue
+            choices = [(str(value.field.prepare_value(obj)), value.field.label_from_instance(obj)) for obj in
+                       queryset.all()[:self.search_choices_limit + 1]]
+            self.set_related_choices(results[index], get_choices_dict(choices))
+        return ApiResponse(data=results)
+
+    def get_search_fields_meta(self):
+        """查询字段元数据，关联字段的可选项每次请求单独查询"""
         results = []
+        related = []
         try:
             filterset_class = self.filterset_class.get_filters()
             filter_fields = self.filterset_class.get_fields().keys()
@@ -271,7 +434,12 @@ class SearchFieldsAction(object):
                 #     widget.input_type = 'text'
                 #     widget.choices = []
                 widget.input_type = get_format_intput_type(value, widget.input_type)
-                choices = list(getattr(widget, 'choices', []))
+                if isinstance(value, QuerySetRequestMixin):
+                    # 关联字段可选项需要查询数据库，不缓存，每次请求限制数量单独查询
+                    choices = []
+                    related.append((len(results), field_name))
+                else:
+                    choices = list(getattr(widget, 'choices', []))
                 if choices and len(choices) > 0 and choices[0][0] == "":
                     choices.pop(0)
                 field = get_model_field(self.filterset_class._meta.model, value.field_name)
@@ -310,10 +478,10 @@ class SearchFieldsAction(object):
                 })
         except Exception as e:
             logger.error(f"get search-field failed {e}")
-        return ApiResponse(data=results)
+        return {'results': results, 'related': related}
 
 
-class SearchColumnsAction(object):
+class SearchColumnsAction(SearchMetaCacheMixin):
     filterset_class: Callable
 
     @extend_schema(
@@ -351,7 +519,23 @@ class SearchColumnsAction(object):
     @action(methods=['get'], detail=False, url_path='search-columns')
     def search_columns(self, request, *args, **kwargs):
         """获取{cls}的展示字段"""
+        data = self.get_search_meta('search_columns', self.get_search_columns_meta)
+        results = data['results']
+        if data['related']:
+            fields = self.get_serializer().fields
+            for index, key in data['related']:
+                relation = self.get_related_field(fields.get(key))
+                if relation is None:
+                    continue
+                choices = json.loads(json.dumps(relation.get_choices(cutoff=self.search_choices_limit + 1),
+                                                cls=encoders.JSONEncoder))
+                self.set_related_choices(results[index], choices)
+        return ApiResponse(data=results)
+
+    def get_search_columns_meta(self):
+        """展示字段元数据，关联字段的可选项每次请求单独查询"""
         results = []
+        related = []
 
         # def check_upload_tp(value, tp):
         #     if hasattr(value, 'child_relation'):
@@ -374,7 +558,8 @@ class SearchColumnsAction(object):
                 tp = get_format_intput_type(value, info['type'])
             if tp and tp.endswith('related_field'):
                 setattr(value, 'is_column', True)
-                info['choices'] = json.loads(json.dumps(value.choices, cls=encoders.JSONEncoder))
+                info['choices'] = []
+                related.append((len(results), value.field_name))
                 # info['choices'] = [{'value': k, 'label': v} for k, v in value.choices.items()]
             return tp
 
@@ -420,7 +605,60 @@ class SearchColumnsAction(object):
                 info['tabs_index'] = tabs_info.get(key, 0)
                 info['tabs_label'] = tabs_label[info['tabs_index']]
             results.append(info)
-        return ApiResponse(data=results)
+        return {'results': results, 'related': related}
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='field', required=True, description='related field key'),
+            OpenApiParameter(name='search', required=False),
+        ],
+        responses=get_default_response_schema(
+            {
+                'data': build_object_type(
+                    properties={
+                        'total': build_basic_type(OpenApiTypes.NUMBER),
+                        'results': build_array_type(build_object_type()),
+                    }
+                )
+            }
+        )
+    )
+    @action(methods=['get'], detail=False, url_path='search-related')
+    def search_related(self, request, *args, **kwargs):
+        """分页查询{cls}关联字段的可选项"""
+        relation = self.get_related_field(self.get_serializer().fields.get(request.query_params.get('field', '')))
+        if relation is None:
+            return ApiResponse(code=1001, detail=_("Related field does not exist"))
+        queryset = relation.get_queryset()
+        if queryset is None:
+            return ApiResponse(data={'total': 0, 'results': []})
+        search = request.query_params.get('search', '').strip()
+        if search:
+            q = Q()
+            opts = queryset.model._meta
+            for attr in relation.attrs if isinstance(relation.attrs, (list, set)) else []:
+                field = get_model_field(queryset.model, attr)
+                if isinstance(field, (models.CharField, models.TextField)):
+                    q |= Q(**{f"{attr}__icontains": search})
+            try:
+                q |= Q(pk=opts.pk.to_python(search))
+            except (DjangoValidationError, TypeError, ValueError):
+                pass
+            queryset = queryset.filter(q)
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        paginator = PageNumber()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        results = []
+        for item in page:
+            data = relation.to_representation(item)
+            if isinstance(data, dict):
+                if "pk" in data:
+                    data['value'] = data.get("pk")
+            else:
+                data = {"value": data, "label": data}
+            results.append(data)
+        return paginator.get_paginated_response(results)
 
 
 class BaseViewSet(object):
@@ -538,6 +776,15 @@ class OnlyExportDataAction(ListAction):
         """导出{cls}数据"""
         self.format_kwarg = request.query_params.get('type', 'xlsx')
         request.no_cache = True  # 防止自定义缓存数据
+        # 导出数据时使用流式导出，导入、更新模板仍使用原有方式
+        if getattr(self, 'export_streaming', settings.EXPORT_STREAM_ENABLED) and request.query_params.get(
+                'template', 'export') == 'export':
+            renderer = {'csv': CSVFileStreamRenderer}.get(self.format_kwarg, ExcelFileStreamRenderer)()
+            queryset = self.filter_queryset(self.get_queryset())
+            # 流式导出在请求结束后查询，需要直接指定分析从库
+            if db := replica_router.get_analytic_db():
+                queryset = queryset.using(db)
+            return renderer.stream(queryset, request, self)
         self.renderer_classes = [ExcelFileRenderer, CSVFileRenderer]
         request.accepted_renderer = None
         data = self.list(request, *args, **kwargs)
@@ -548,6 +795,8 @@ class ImportExportDataAction(CreateAction, UpdateAction, OnlyExportDataAction):
     filter_queryset: Callable
     get_queryset: Callable
     get_serializer: Callable
+    import_bulk = True  # 批量导入，不支持时自动使用逐条导入
+    import_batch_size = 500
 
     @extend_schema(
         parameters=[
@@ -590,6 +839,12 @@ class ImportExportDataAction(CreateAction, UpdateAction, OnlyExportDataAction):
         act = request.query_params.get('action')
         ignore_error = request.query_params.get('ignore_error', 'false') == 'true'
         if act and data:
+            if self.import_bulk and not self_field:
+                importer = BulkImporter(self, ignore_error=ignore_error, batch_size=self.import_batch_size)
+                if importer.is_supported(act):
+                    count, errors = importer.run(act, data)
+                    return ApiResponse(detail=_("Operation successful. Import {} data").format(count),
+                                       data={'count': count, 'errors': errors})
             count = 0
             if act == 'create':
                 for item in data:
@@ -7,12 +7,26 @@
 # -*- coding: utf-8 -*-
 
 
+import base64
+import json
 from collections import OrderedDict
 
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator, Page, EmptyPage
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from drf_spectacular.plumbing import build_object_type, build_basic_type
 from drf_spectacular.types import OpenApiTypes
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+from common.utils import get_logger
+
+logger = get_logger(__name__)
 
 
 class PageNumber(PageNumberPagination):
@@ -54,3 +68,297 @@ class DynamicPageNumber(object):
         instance.max_page_size = self.max_page_size
         instance.page_size = self.page_size
         return instance
+
+
+class CountStrategy(object):
+    """
+    分页总数统计方式
+    exact: 精确统计 COUNT(*)
+    capped: 最多统计 count_cap 条，超出时返回 count_cap
+    estimated: 无过滤条件时使用数据库统计信息估算，有过滤条件时同 capped
+    """
+    EXACT = 'exact'
+    CAPPED = 'capped'
+    ESTIMATED = 'estimated'
+
+    def __init__(self, strategy=EXACT, cap=10000):
+        self.strategy = strategy
+        self.cap = cap
+        self.exact = True
+
+    def get_estimated_count(self, queryset):
+        model = queryset.model
+        connection = connections[queryset.db]
+        table = model._meta.db_table
+        sql = None
+        if connection.vendor == 'postgresql':
+            sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+        elif connection.vendor == 'mysql':
+            sql = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+        if sql is None:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [table])
+                row = cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"get estimated count of {table} failed. {e}")
+            return None
+        return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+    def get_capped_count(self, queryset):
+        count = queryset[:self.cap + 1].count()
+        if count > self.cap:
+            self.exact = False
+            return self.cap
+        return count
+
+    def count(self, queryset):
+        self.exact = True
+        if self.strategy == self.ESTIMATED and not queryset.query.where:
+            count = self.get_estimated_count(queryset)
+            # 数据量较小时，统计信息误差较大，使用精确统计
+            if count is not None and count > self.cap:
+                self.exact = False
+                return count
+        if self.strategy in (self.CAPPED, self.ESTIMATED):
+            return self.get_capped_count(queryset)
+        return queryset.count()
+
+
+class CountStrategyPage(Page):
+
+    def has_next(self):
+        if self.paginator.count_strategy.exact:
+            return super().has_next()
+        # 总数不精确时，当前页数据已满即认为还有下一页
+        return len(self) >= self.paginator.per_page
+
+
+class CountStrategyPaginator(Paginator):
+    """
+    总数不精确(capped/estimated)时，总数仅用于展示，允许访问超出总数的页码，数据为空即表示没有更多
+    """
+
+    def __init__(self, *args, count_strategy=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy or CountStrategy()
+
+    @cached_property
+    def count(self):
+        return self.count_strategy.count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.count_strategy.exact or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_strategy.exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return CountStrategyPage(*args, **kwargs)
+
+
+class KeysetPagination(PageNumber):
+    """
+    游标分页，通过 (排序字段, 主键) 定位数据，避免 OFFSET 深度翻页和 COUNT(*) 全表统计
+    1.携带 cursor 参数时，使用游标分页，响应中 next 和 previous 为下一页和上一页的游标
+    2.未携带 cursor 参数时，使用页码分页，兼容原有请求方式
+    3.排序字段和主键需要有索引，例如 created_time
+    响应格式 {'total': 总数, 'results': 数据, 'next': 游标, 'previous': 游标, 'total_exact': 总数是否精确}
+    """
+    cursor_query_param = 'cursor'
+    count_strategy = CountStrategy.EXACT
+    count_cap = 10000
+    default_ordering = '-pk'
+
+    def __init__(self):
+        self.strategy = CountStrategy(self.count_strategy, self.count_cap)
+        self.cursor = None
+        self.total = None
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def django_paginator_class(self, *args, **kwargs):
+        return CountStrategyPaginator(*args, count_strategy=self.strategy, **kwargs)
+
+    @staticmethod
+    def encode_cursor(data):
+        value = json.dumps(data, cls=encoders.JSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(value.encode('utf-8')).decode('utf-8').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            data = json.loads(value)
+            if not isinstance(data, dict) or not {'f', 'v', 'pk', 'r'} <= set(data.keys()):
+                raise ValueError
+            return data
+        except (TypeError, ValueError):
+            raise NotFound(_("Invalid cursor"))
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering or [])
+        if ordering and isinstance(ordering[0], str) and '__' not in ordering[0]:
+            name = ordering[0].lstrip('-')
+            try:
+                name == 'pk' or queryset.model._meta.get_field(name)
+                return ordering[0]
+            except FieldDoesNotExist:
+                pass
+        return self.default_ordering
+
+    @staticmethod
+    def get_order_by(field_name, reverse):
+        desc = field_name.startswith('-') != reverse
+        name = field_name.lstrip('-')
+        prefix = '-' if desc else ''
+        return [f"{prefix}{name}", f"{prefix}pk"]
+
+    @staticmethod
+    def get_keyset_q(queryset, field_name, value, pk, reverse):
+        """
+        使用数据库默认的空值排序，不指定 nulls_first/nulls_last，保证可以使用索引排序
+        """
+        desc = field_name.startswith('-') != reverse
+        name = field_name.lstrip('-')
+        lookup = 'lt' if desc else 'gt'
+        field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        if not field.null:
+            return Q(**{f"{name}__{lookup}": value}) | Q(**{name: value, f"pk__{lookup}": pk})
+        nulls_largest = connections[queryset.db].features.nulls_order_largest
+        # 空值是否排在非空值之后
+        nulls_after = nulls_largest != desc
+        if value is None:
+            q = Q(**{f"{name}__isnull": True, f"pk__{lookup}": pk})
+            return q if nulls_after else q | Q(**{f"{name}__isnull": False})
+        q = Q(**{f"{name}__{lookup}": value}) | Q(**{name: value, f"pk__{lookup}": pk})
+        return q | Q(**{f"{name}__isnull": True}) if nulls_after else q
+
+    @staticmethod
+    def get_field_value(instance, field_name):
+        name = field_name.lstrip('-')
+        return instance.pk if name == 'pk' else getattr(instance, name)
+
+    def to_python(self, queryset, field_name, value):
+        name = field_name.lstrip('-')
+        if value is None:
+            return None
+        field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        try:
+            return field.to_python(value)
+        except Exception:
+            raise NotFound(_("Invalid cursor"))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            # 增加主键排序，保证页码分页和游标分页的数据顺序一致
+            queryset = queryset.order_by(*self.get_order_by(self.get_ordering(queryset), False))
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page = None
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        data = self.decode_cursor(cursor)
+        field_name = self.get_ordering(queryset)
+        if data['f'] != field_name:
+            raise NotFound(_("Invalid cursor"))
+        self.total = self.strategy.count(queryset)
+
+        reverse = bool(data['r'])
+        value = self.to_python(queryset, field_name, data['v'])
+        pk = self.to_python(queryset, 'pk', data['pk'])
+        queryset = queryset.filter(self.get_keyset_q(queryset, field_name, value, pk, reverse))
+        results = list(queryset.order_by(*self.get_order_by(field_name, reverse))[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if results:
+            first, last = results[0], results[-1]
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(
+                    {'f': field_name, 'v': self.get_field_value(last, field_name), 'pk': last.pk, 'r': 0})
+            if has_more or not reverse:
+                self.previous_cursor = self.encode_cursor(
+                    {'f': field_name, 'v': self.get_field_value(first, field_name), 'pk': first.pk, 'r': 1})
+        return results
+
+    def get_page_cursors(self):
+        """页码分页时，返回下一页游标，后续可以使用游标分页"""
+        results = list(self.page.object_list)
+        if not results or not self.page.has_next():
+            return None, None
+        field_name = self.get_ordering(self.page.paginator.object_list)
+        last = results[-1]
+        return self.encode_cursor({'f': field_name, 'v': self.get_field_value(last, field_name), 'pk': last.pk,
+                                   'r': 0}), None
+
+    def get_paginated_response(self, data):
+        if self.page is not None:
+            total = self.page.paginator.count
+            try:
+                next_cursor, previous_cursor = self.get_page_cursors()
+            except Exception as e:
+                logger.debug(f"get page cursor failed. {e}")
+                next_cursor, previous_cursor = None, None
+        else:
+            total, next_cursor, previous_cursor = self.total, self.next_cursor, self.previous_cursor
+        return Response(OrderedDict([
+            ('total', total),
+            ('total_exact', self.strategy.exact),
+            ('next', next_cursor),
+            ('previous', previous_cursor),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return build_object_type(
+            properties={
+                'code': build_basic_type(OpenApiTypes.NUMBER),
+                'detail': build_basic_type(OpenApiTypes.STR),
+                'data': build_object_type(
+                    properties={
+                        'total': build_basic_type(OpenApiTypes.NUMBER),
+                        'total_exact': build_basic_type(OpenApiTypes.BOOL),
+                        'next': build_basic_type(OpenApiTypes.STR),
+                        'previous': build_basic_type(OpenApiTypes.STR),
+                        'results': schema
+                    }
+                ),
+            }
+        )
+
+
+class DynamicKeysetPagination(object):
+    """
+    pagination_class = DynamicKeysetPagination(count_strategy=CountStrategy.ESTIMATED)
+    """
+
+    def __init__(self, max_page_size=100, page_size=20, count_strategy=CountStrategy.EXACT, count_cap=10000):
+        self.max_page_size = max_page_size
+        self.page_size = page_size
+        self.count_strategy = count_strategy
+        self.count_cap = count_cap
+
+    def __call__(self, *args, **kwargs):
+        instance = KeysetPagination()
+        instance.max_page_size = self.max_page_size
+        instance.page_size = self.page_size
+        instance.strategy = CountStrategy(self.count_strategy, self.count_cap)
+        return instance
@@ -4,6 +4,7 @@
 # filename : permission
 # author : ly_13
 # date : 6/6/2023
+import hashlib
 import re
 import uuid
 
@@ -14,40 +15,63 @@ from rest_framework.exceptions import PermissionDenied, NotAuthenticated
 from rest_framework.permissions import BasePermission
 
 from common.base.magic import MagicCacheData
+from common.core.route import LazyRouteIndex
 from server.utils import get_current_request, set_current_request
-from system.models import Menu, FieldPermission
+from system.models import Menu, FieldPermission, UserRole
 
 
-def get_user_menu_queryset(user_obj):
-    q = Q()
-    has_role = False
-    if user_obj.roles.exists():
-        q |= (Q(userrole__in=user_obj.roles.all()) & Q(userrole__is_active=True))
-        has_role = True
-    if user_obj.dept:
-        q |= (Q(userrole__deptinfo=user_obj.dept) & Q(userrole__deptinfo__is_active=True))
-        has_role = True
-    if has_role:
-        # return get_filter_queryset(Menu.objects.filter(is_active=True).filter(q), user_obj)
+@MagicCacheData.make_cache(timeout=3600 * 24, local_timeout=300, key_func=lambda x: x.pk,
+                           tags_func=lambda x: get_user_cache_tags(x))
+def get_user_role_set(user_obj):
+    """
+    用户生效的角色集合，包含用户已启用的角色及已启用部门的角色
+    菜单，路由，权限缓存按角色集合共享，相同角色组合的用户只需要生成一次
+    :return: (角色集合标识, (角色主键,))
+    """
+    q = Q(userinfo=user_obj, is_active=True)
+    if user_obj.dept_id:
+        q |= Q(deptinfo=user_obj.dept_id, deptinfo__is_active=True)
+    pks = tuple(sorted({str(pk) for pk in UserRole.objects.filter(q).values_list('pk', flat=True)}))
+    return hashlib.md5(','.join(pks).encode('utf-8')).hexdigest(), pks
+
+
+def get_user_cache_tags(user_obj):
+    """
+    用户角色集合缓存标签，用户，部门，角色变动时通过 MagicCacheTag 失效
+    """
+    tags = [f"user:{user_obj.pk}"]
+    q = Q(userinfo=user_obj)
+    if user_obj.dept_id:
+        tags.append(f"dept:{user_obj.dept_id}")
+        q |= Q(deptinfo=user_obj.dept_id)
+    tags.extend(f"role:{pk}" for pk in UserRole.objects.filter(q).values_list('pk', flat=True).distinct())
+    return tags
+
+
+def get_role_cache_tags(role_pks):
+    """
+    角色集合权限相关缓存标签，菜单，角色变动时通过 MagicCacheTag 失效
+    """
+    return ['menu'] + [f"role:{pk}" for pk in role_pks]
+
+
+def get_role_menu_queryset(role_pks):
+    if role_pks:
         # 菜单通过角色控制，就不用再次通过数据权限过滤了，要不然还得两个地方都得配置
-        return Menu.objects.filter(is_active=True).filter(q)
+        return Menu.objects.filter(is_active=True, userrole__in=role_pks)
     return None
 
 
-@MagicCacheData.make_cache(timeout=10, key_func=lambda *args: f"{args[0].pk}_{args[1]}")
-def get_user_field_queryset(user_obj, menu):
-    q = Q()
+def get_user_menu_queryset(user_obj):
+    return get_role_menu_queryset(get_user_role_set(user_obj)[1])
+
+
+@MagicCacheData.make_cache(timeout=10, local_timeout=10, key_func=lambda key, pks, menu: f"{key}_{menu}")
+def get_role_field_queryset(role_key, role_pks, menu):
     data = {}
-    has_q = False
-    if user_obj.roles.count():
-        q |= (Q(role__in=user_obj.roles.all()) & Q(role__is_active=True))
-        has_q = True
-    if user_obj.dept:
-        q |= (Q(role__deptinfo=user_obj.dept) & Q(role__deptinfo__is_active=True))
-        has_q = True
-    if has_q:
-        # queryset = get_filter_queryset(FieldPermission.objects.filter(q), user_obj).filter(menu=menu)
-        queryset = FieldPermission.objects.filter(q).filter(menu=menu)  # 用户查询用户权限，无需使用权限过滤
+    if role_pks:
+        # 用户查询用户权限，无需使用权限过滤
+        queryset = FieldPermission.objects.filter(role__in=role_pks, menu=menu)
         for val in queryset.values_list('field__parent__name', 'field__name').distinct():
             info = data.get(val[0], set())
             if info:
@@ -57,19 +81,51 @@ def get_user_field_queryset(user_obj, menu):
     return data
 
 
-@MagicCacheData.make_cache(timeout=3600 * 24, key_func=lambda x, y: f"{x.pk}_{y}")
-def get_user_permission(user_obj, method):
+def get_user_field_queryset(user_obj, menu):
+    return get_role_field_queryset(*get_user_role_set(user_obj), menu)
+
+
+@MagicCacheData.make_cache(timeout=3600 * 24, local_timeout=300, key_func=lambda key, pks, method: f"{key}_{method}",
+                           tags_func=lambda key, pks, method: get_role_cache_tags(pks))
+def get_role_permission(role_key, role_pks, method):
     menus = []
-    menu_queryset = get_user_menu_queryset(user_obj)
+    menu_queryset = get_role_menu_queryset(role_pks)
     if menu_queryset:
         filter_kwargs = {"menu_type": Menu.MenuChoices.PERMISSION, "method": method}
         menus = menu_queryset.filter(**filter_kwargs).values_list('path', 'pk', 'model').distinct()
     return dict([(menu[0], menu[1:]) for menu in menus])
 
-def get_menu_pk(permission_data, url):
+
+def get_user_permission(user_obj, method):
+    return get_role_permission(*get_user_role_set(user_obj), method)
+
+
+def get_permission_routes():
+    queryset = Menu.objects.filter(is_active=True, menu_type=Menu.MenuChoices.PERMISSION).order_by('-created_time')
+    for path, method in queryset.values_list('path', 'method'):
+        if path and method:
+            yield method, f"/{path}", path
+
+
+def get_white_routes():
+    for w_url, methods in settings.PERMISSION_WHITE_URL.items():
+        for method in (['*'] if '*' in methods else methods):
+            yield method, w_url, True
+
+
+# 菜单路由索引，菜单变动时通过 system.signal_handler 失效
+permission_route_index = LazyRouteIndex(get_permission_routes, timeout=600)
+white_route_index = LazyRouteIndex(get_white_routes)
+
+
+def get_menu_pk(permission_data, url, method=None):
     # 1.直接get api/system/permission$   /api/system/config/system
     p_data = permission_data.get(f"{url[1:]}$")
     if not p_data:
+        if method:
+            # 2.通过路由索引匹配，仅匹配和url静态前缀一致的路由
+            p_path = permission_route_index.match(method, url, lambda path: path in permission_data)
+            return permission_data.get(p_path) if p_path else None
         for p_path, permission_item in permission_data.items():
             if re.match(f"/{p_path}", url):
                 return permission_item
@@ -91,23 +147,22 @@ class IsAuthenticated(BasePermission):
                 request.ignore_field_permission = True
                 return True
             url = request.path_info
-            for w_url, method in settings.PERMISSION_WHITE_URL.items():
-                if re.match(w_url, url) and ('*' in method or request.method in method):
-                    request.ignore_field_permission = True
-                    return True
+            if white_route_index.match(request.method, url):
+                request.ignore_field_permission = True
+                return True
             permission_data = get_user_permission(request.user, request.method)
-            # 处理search-columns字段权限和list权限一致
-            match_group = re.match("(?P<url>.*)/search-columns$", url)
+            # 处理search-columns，search-related字段权限和list权限一致
+            match_group = re.match("(?P<url>.*)/(search-columns|search-related)$", url)
             if match_group:
                 url = match_group.group('url')
-            p_data = p_data_new = get_menu_pk(permission_data, url)
+            p_data = p_data_new = get_menu_pk(permission_data, url, request.method)
 
             if p_data:
                 # 导入导出功能，若未绑定模型，则使用list, create菜单
                 match_group = re.match("(?P<url>.*)/(export|import)-data$", url)
                 if match_group and p_data[1] is None:
                     url = match_group.group('url')
-                    p_data_new = get_menu_pk(permission_data, url)
+                    p_data_new = get_menu_pk(permission_data, url, request.method)
                 if not p_data_new:
                     p_data_new = p_data
 
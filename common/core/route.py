@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : route
+# author : ly_13
+# date : 10/18/2026
+import itertools
+import re
+import threading
+import time
+
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+META_CHARS = set('.^$*+?{}[]\\|()')
+QUANTIFIER_CHARS = set('?*{')
+NAMED_GROUP = re.compile(r'\(\?P<\w+>')
+
+
+def get_static_segments(pattern):
+    """
+    获取正则路由开头的静态路径片段，仅返回完整的路径片段
+    ^/api/system/user/(?P<pk>[^/.]+)$ -> ['api', 'system', 'user']
+    /api/system/user$ -> ['api', 'system']
+    """
+    pattern = pattern.lstrip('^')
+    if '|' in pattern or not pattern.startswith('/'):
+        return []
+    literal = []
+    for char in pattern[1:]:
+        if char in META_CHARS:
+            if char in QUANTIFIER_CHARS and literal:
+                literal.pop()  # 量词修饰的字符不确定，需要丢弃
+            break
+        literal.append(char)
+    return ''.join(literal).split('/')[:-1]
+
+
+class RouteNode(object):
+    def __init__(self):
+        self.children = {}
+        self.routes = []  # [(index, regex, value)]
+        self.regex = None
+
+    def add(self, index, pattern, value):
+        self.routes.append((index, re.compile(pattern), value))
+
+    def compile(self):
+        """将叶子节点上的所有路由合并为一个正则，匹配顺序和添加顺序一致"""
+        if not self.routes:
+            return
+        parts = [f'(?P<r{i}>{NAMED_GROUP.sub("(?:", r[1].pattern)})' for i, r in enumerate(self.routes)]
+        try:
+            self.regex = re.compile('|'.join(parts))
+        except re.error as e:
+            logger.warning(f"compile route node failed, fallback to match one by one. {e}")
+            self.regex = None
+
+    def first_match(self, url):
+        if not self.routes:
+            return None
+        if self.regex is None:
+            for route in self.routes:
+                if route[1].match(url):
+                    return route
+            return None
+        match = self.regex.match(url)
+        if match:
+            return self.routes[int(match.lastgroup[1:])]
+        return None
+
+
+class RouteIndex(object):
+    """
+    路由索引，按照请求方式和静态路径前缀构建前缀树，每个节点上的路由合并为一个正则
+    查找的时候仅需匹配url路径上的节点，和路由总数量无关
+    """
+
+    def __init__(self, routes):
+        """
+        :param routes: [(method, pattern, value)] method 为 * 表示全部请求方式，顺序即为匹配优先级
+        """
+        self.trees = {}
+        self.count = 0
+        for index, (method, pattern, value) in enumerate(routes):
+            node = self.trees.setdefault(method, RouteNode())
+            for segment in get_static_segments(pattern):
+                node = node.children.setdefault(segment, RouteNode())
+            node.add(index, pattern, value)
+            self.count += 1
+        for tree in self.trees.values():
+            self._compile(tree)
+
+    def _compile(self, node):
+        node.compile()
+        for child in node.children.values():
+            self._compile(child)
+
+    def get_nodes(self, method, url):
+        segments = url.lstrip('/').split('/')
+        for key in {method, '*'}:
+            node = self.trees.get(key)
+            if node is None:
+                continue
+            yield node
+            for segment in segments:
+                node = node.children.get(segment)
+                if node is None:
+                    break
+                yield node
+
+    def match(self, method, url, check=None):
+        """
+        :param method: 请求方式
+        :param url: 请求路径
+        :param check: 路由值校验函数，返回 False 则继续匹配下一个路由
+        :return: 第一个匹配且通过校验的路由值
+        """
+        nodes = list(self.get_nodes(method, url))
+        best = None
+        for node in nodes:
+            route = node.first_match(url)
+            if route and (best is None or route[0] < best[0]):
+                best = route
+        if best is None:
+            return None
+        if check is None or check(best[2]):
+            return best[2]
+
+        # 最先匹配的路由未通过校验，按照顺序依次匹配剩下的候选路由
+        routes = sorted(itertools.chain.from_iterable(node.routes for node in nodes), key=lambda x: x[0])
+        for index, regex, value in routes:
+            if index > best[0] and check(value) and regex.match(url):
+                return value
+        return None
+
+
+class LazyRouteIndex(object):
+    """
+    进程内路由索引缓存，调用 invalid 之后，下次查找时重新构建
+    :param routes_func: 返回 [(method, pattern, value)] 的函数
+    :param timeout: 索引最长有效时间，单位秒，防止失效通知丢失，0 表示不过期
+    """
+
+    def __init__(self, routes_func, timeout=0):
+        self.routes_func = routes_func
+        self.timeout = timeout
+        self._index = None
+        self._c_time = 0
+        self._lock = threading.Lock()
+
+    def invalid(self):
+        self._index = None
+
+    def get_index(self):
+        index = self._index
+        if index is not None and (not self.timeout or time.time() - self._c_time < self.timeout):
+            return index
+        with self._lock:
+            if self._index is None or index is self._index:
+                n_time = time.time()
+                self._index = RouteIndex(self.routes_func())
+                self._c_time = n_time
+                logger.info(f"build route index {self.routes_func.__name__} count:{self._index.count}"
+                            f" time:{time.time() - n_time}")
+            return self._index
+
+    def match(self, method, url, check=None):
+        return self.get_index().match(method, url, check)
@@ -8,20 +8,66 @@ from inspect import isfunction
 from typing import List
 
 from django.conf import settings
-from django.db.models import QuerySet
+from django.db.models import QuerySet, Model
+from django.db.models.manager import BaseManager
 from django.db.models.fields import NOT_PROVIDED
 from rest_framework.fields import empty
 from rest_framework.request import Request
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, ListSerializer, LIST_SERIALIZER_KWARGS, \
+    LIST_SERIALIZER_KWARGS_REMOVE
 
 from common.core.fields import BasePrimaryKeyRelatedField, LabeledChoiceField
 from server.utils import get_current_request
 
 
+class BaseListSerializer(ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, BaseManager) else data
+        if isinstance(iterable, QuerySet):
+            iterable = list(iterable)
+        # 序列化前批量加载当前页数据，避免方法字段逐条查询
+        if iterable and isinstance(iterable[0], Model) and hasattr(self.child, 'batch_load'):
+            self.child.batch_load(iterable)
+        return [self.child.to_representation(item) for item in iterable]
+
+
 class BaseModelSerializer(ModelSerializer):
     serializer_related_field = BasePrimaryKeyRelatedField
     serializer_choice_field = LabeledChoiceField
     ignore_field_permission = False  # 忽略字段权限
+    batch_values = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        """Meta 中未指定 list_serializer_class 时，使用 BaseListSerializer，不修改类属性"""
+        if hasattr(getattr(cls, 'Meta', None), 'list_serializer_class'):
+            return super().many_init(*args, **kwargs)
+        list_kwargs = {}
+        for key in LIST_SERIALIZER_KWARGS_REMOVE:
+            value = kwargs.pop(key, None)
+            if value is not None:
+                list_kwargs[key] = value
+        list_kwargs['child'] = cls(*args, **kwargs)
+        list_kwargs.update({key: value for key, value in kwargs.items() if key in LIST_SERIALIZER_KWARGS})
+        return BaseListSerializer(*args, **list_kwargs)
+
+    def batch_load(self, instances):
+        """
+        列表序列化时，方法字段可定义 batch_<method_name>(instances) 一次加载当前页所有数据，返回 {pk: value}
+        方法字段中通过 self.get_batch_values(method_name) 获取，非列表序列化时返回 None
+        """
+        self.batch_values = {}
+        for field in self.fields.values():
+            method_name = getattr(field, 'method_name', None)
+            batch_method = getattr(self, f"batch_{method_name}", None) if method_name else None
+            if batch_method:
+                self.batch_values[method_name] = batch_method(instances)
+
+    def get_batch_values(self, method_name):
+        if self.batch_values is None:
+            return None
+        return self.batch_values.get(method_name)
 
     class Meta:
         model = None
@@ -5,32 +5,109 @@
 # author : ly_13
 # date : 6/2/2023
 
-
+from django.core.cache import cache
+from django_redis import get_redis_connection
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+# GCRA 算法，KEYS[1] 保存下一次请求的理论到达时间(TAT)
+# ARGV[1] 当前时间，ARGV[2] 请求间隔(duration/num_requests)，ARGV[3] 周期(duration)，允许突发 num_requests 次
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local period = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local wait = new_tat - period - now
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, '0'}
+"""
+
+
+class RedisRateThrottleMixin(object):
+    """
+    基于 GCRA 算法的速率限制，每个 key 仅保存一个时间戳，通过 lua 脚本一次调用完成判断和更新
+    SimpleRateThrottle 每次请求需要读写整个请求时间列表，并发时存在覆盖问题
+    与 SimpleRateThrottle 使用相同的 scope 和 DEFAULT_THROTTLE_RATES 配置
+    """
+    _script = None
+
+    @classmethod
+    def get_script(cls):
+        if RedisRateThrottleMixin._script is None:
+            RedisRateThrottleMixin._script = get_redis_connection("default").register_script(GCRA_SCRIPT)
+        return RedisRateThrottleMixin._script
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        if self.num_requests <= 0:
+            return self.throttle_failure()
+
+        try:
+            allowed, wait = self.get_script()(keys=[cache.make_key(self.key)],
+                                              args=[self.timer(), self.duration / self.num_requests, self.duration])
+        except Exception as e:
+            # redis 异常时不限制请求
+            logger.warning(f"{self.__class__.__name__} throttle failed. {e}")
+            return True
+        if int(allowed):
+            return self.throttle_success()
+        self.wait_time = float(wait)
+        return self.throttle_failure()
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class RedisAnonRateThrottle(RedisRateThrottleMixin, AnonRateThrottle):
+    pass
+
+
+class RedisUserRateThrottle(RedisRateThrottleMixin, UserRateThrottle):
+    pass
+
 
-class RegisterThrottle(AnonRateThrottle):
+class RegisterThrottle(RedisAnonRateThrottle):
     scope = "register"
 
 
-class ResetPasswordThrottle(AnonRateThrottle):
+class ResetPasswordThrottle(RedisAnonRateThrottle):
     scope = "reset_password"
 
 
-class LoginThrottle(AnonRateThrottle):
+class LoginThrottle(RedisAnonRateThrottle):
     scope = "login"
 
 
-class UploadThrottle(UserRateThrottle):
+class UploadThrottle(RedisUserRateThrottle):
     """上传速率限制"""
     scope = "upload"
 
 
-class Download1Throttle(UserRateThrottle):
+class Download1Throttle(RedisUserRateThrottle):
     """下载速率限制"""
     scope = "download1"
 
 
-class Download2Throttle(UserRateThrottle):
+class Download2Throttle(RedisUserRateThrottle):
     """下载速率限制"""
     scope = "download2"
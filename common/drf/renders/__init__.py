@@ -2,6 +2,7 @@ from rest_framework import renderers
 
 from .csv import *
 from .excel import *
+from .stream import CSVFileStreamRenderer, ExcelFileStreamRenderer
 
 
 class PassthroughRenderer(renderers.BaseRenderer):
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : stream
+# author : ly_13
+# date : 10/18/2026
+import abc
+import itertools
+import warnings
+from tempfile import TemporaryFile
+
+import pyzipper
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.table import Table, TableStyleInfo, TableColumn
+from rest_framework.utils import encoders, json
+
+from common.utils import get_logger
+from .csv import CSVFileRenderer
+from .excel import ExcelFileRenderer
+
+logger = get_logger(__name__)
+
+
+class StreamBuffer(object):
+    """
+    不可 seek 的写缓冲区，写入的数据通过 pop 取出，用于边生成边发送
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        value = bytes(self._buffer)
+        self._buffer.clear()
+        return value
+
+
+class StreamFileRendererMixin(object):
+    """
+    流式导出，分批从数据库读取数据，序列化后逐行写入 StreamingHttpResponse，内存占用与数据量无关
+    response = CSVFileStreamRenderer().stream(queryset, request, view)
+    """
+    chunk_size = 1000
+    file_chunk_size = 64 * 1024
+
+    def get_chunk_size(self):
+        return getattr(settings, 'EXPORT_STREAM_CHUNK_SIZE', self.chunk_size) or self.chunk_size
+
+    def iter_data(self, queryset, view):
+        """分批读取并序列化，每批数据会将一些 UUID 字段转化为 string"""
+        chunk_size = self.get_chunk_size()
+        queryset = queryset[:settings.EXPORT_MAX_LIMIT]
+        for chunk in itertools.batched(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            data = view.get_serializer(chunk, many=True).data
+            yield json.loads(json.dumps(data, cls=encoders.JSONEncoder))
+
+    @abc.abstractmethod
+    def flush_buffer(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def get_error_row(count):
+        return [_("Export interrupted, only {} rows have been exported, please try again").format(count)]
+
+    def iter_content(self, queryset, view, rendered_fields):
+        self.export_count = 0
+        self.initial_writer()
+        self.write_column_titles(self.get_column_titles(rendered_fields))
+        yield self.flush_buffer()
+        try:
+            for data in self.iter_data(queryset, view):
+                self.write_rows(self.generate_rows(data, rendered_fields))
+                self.export_count += len(data)
+                yield self.flush_buffer()
+        except Exception as e:
+            # 响应头已经发送，写入错误标记行后正常结束文件，避免导出结果被静默截断
+            logger.error(f"stream export failed after {self.export_count} rows. {e}", exc_info=True)
+            self.write_row(self.get_error_row(self.export_count))
+            yield self.flush_buffer()
+        self.after_render()
+        yield from self.iter_rendered_value()
+
+    def iter_rendered_value(self):
+        yield self.flush_buffer()
+
+    def iter_zip_content(self, content, filename, secret_key):
+        buffer = StreamBuffer()
+        with pyzipper.AESZipFile(
+                buffer, 'w', compression=pyzipper.ZIP_LZMA, encryption=pyzipper.WZ_AES
+        ) as zf:
+            zf.setpassword(secret_key.encode('utf8'))
+            with zf.open(filename, 'w') as f:
+                for value in content:
+                    f.write(value)
+                    yield buffer.pop()
+        yield buffer.pop()
+
+    def iter_safe(self, content):
+        # 生成文件阶段出现异常只能中断输出，记录已导出的行数
+        try:
+            for value in content:
+                if value:
+                    yield value
+        except Exception as e:
+            logger.error(f"stream export failed after {getattr(self, 'export_count', 0)} rows. {e}", exc_info=True)
+
+    def stream(self, queryset, request, view):
+        response = StreamingHttpResponse(content_type=self.media_type)
+        try:
+            self.template = 'export'
+            self.serializer = view.get_serializer()
+            self.set_response_disposition(response)
+            rendered_fields = self.get_rendered_fields()
+        except Exception as e:
+            logger.debug(e, exc_info=True)
+            response.streaming_content = [f'The resource not support export! error:{e}'.encode('utf-8')]
+            return response
+
+        content = self.iter_content(queryset, view, rendered_fields)
+        if getattr(view, 'export_as_zip', False):
+            content_disposition = response['Content-Disposition']
+            filename = content_disposition.split('filename="')[-1].rstrip('"')
+            secret_key = request.user.username  # 默认密码是用户名，后期可配置
+            if not secret_key:
+                content = [_("{} - The encryption password has not been set - "
+                             "please go to personal information -> file encryption password "
+                             "to set the encryption password").format(request.user.nickname).encode('utf-8')]
+                response['Content-Disposition'] = content_disposition.replace(self.format, 'txt')
+            else:
+                content = self.iter_zip_content(content, filename, secret_key)
+                response['Content-Disposition'] = content_disposition.replace(self.format, 'zip')
+                response['Content-Type'] = 'application/zip'
+        response.streaming_content = self.iter_safe(content)
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class CSVFileStreamRenderer(StreamFileRendererMixin, CSVFileRenderer):
+
+    def flush_buffer(self):
+        value = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return value
+
+
+class ExcelFileStreamRenderer(StreamFileRendererMixin, ExcelFileRenderer):
+    """
+    xlsx 为 zip 格式，只能在全部数据写入后生成文件，write_only 模式下行数据会写入临时文件，内存占用恒定
+    """
+    column_titles = None
+
+    def initial_writer(self):
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+
+    def write_column_titles(self, column_titles):
+        # write_only 模式下，列宽需要在写入数据前设置
+        for index, title in enumerate(column_titles):
+            width = min(max(len(str(title)) + 2, 30), 300)
+            self.ws.column_dimensions[get_column_letter(index + 1)].width = width
+        self.column_titles = [ILLEGAL_CHARACTERS_RE.sub(r'', str(title)) for title in column_titles]
+        self.write_row(column_titles)
+
+    def write_row(self, row):
+        self.row_count += 1
+        cells = []
+        for cell_value in row:
+            # 处理非法字符
+            cell = WriteOnlyCell(self.ws, value=ILLEGAL_CHARACTERS_RE.sub(r'', str(cell_value)))
+            # 设置单元格格式为纯文本, 防止执行公式
+            cell.data_type = 's'
+            cells.append(cell)
+        self.ws.append(cells)
+
+    def after_render(self):
+        if self.column_titles:
+            tab = Table(displayName="Table", ref=f"A1:{get_column_letter(len(self.column_titles))}{self.row_count}")
+            # write_only 模式下，表格列需要手动添加
+            for index, title in enumerate(self.column_titles):
+                tab.tableColumns.append(TableColumn(id=index + 1, name=title))
+            tab.tableStyleInfo = TableStyleInfo(
+                name="TableStyleLight13",
+                showFirstColumn=True,
+                showLastColumn=True,
+                showRowStripes=True,
+                showColumnStripes=True,
+            )
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                self.ws.add_table(tab)
+
+    def flush_buffer(self):
+        return b''
+
+    def iter_rendered_value(self):
+        with TemporaryFile() as tmp:
+            self.wb.save(tmp)
+            tmp.seek(0)
+            while True:
+                value = tmp.read(self.file_chunk_size)
+                if not value:
+                    break
+                yield value
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : cache_tag_stats
+# author : ly_13
+# date : 10/18/2026
+
+from django.core.management.base import BaseCommand
+
+from common.base.magic import MagicCacheTag
+
+
+class Command(BaseCommand):
+    help = 'show cache hit ratio per tag'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', default=False, help='reset cache tag stats')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            MagicCacheTag.reset_stats()
+            self.stdout.write(self.style.SUCCESS("reset cache tag stats success"))
+            return
+        stats = MagicCacheTag.get_stats()
+        if not stats:
+            self.stdout.write("no cache tag stats")
+            return
+        self.stdout.write(f"{'tag':<40}{'hit':>12}{'miss':>12}{'ratio':>10}")
+        for tag, item in sorted(stats.items(), key=lambda x: x[1]['hit'] + x[1]['miss'], reverse=True):
+            self.stdout.write(f"{tag:<40}{item['hit']:>12}{item['miss']:>12}{item['ratio']:>10.2%}")
@@ -19,10 +19,13 @@ from django.dispatch import receiver
 from django_celery_beat.models import PeriodicTask
 from django_celery_results.models import TaskResult
 
+from common.base.magic import MagicCacheData, magic_cache_pub_sub, MagicCacheTag, magic_cache_tag_pub_sub, \
+    MagicCacheResponse
 from common.base.utils import remove_file
 from common.celery.decorator import get_after_app_ready_tasks, get_after_app_shutdown_clean_tasks
 from common.celery.logger import CeleryThreadTaskFileHandler
 from common.celery.utils import get_celery_task_log_path
+from common.core.auth import token_revocation_filter, token_revoke_pub_sub
 from common.signals import django_ready
 from common.utils import get_logger
 from server.utils import get_current_request
@@ -167,4 +170,26 @@ if settings.DEBUG_DEV:
 
 @receiver(django_ready)
 def clear_response_cache(sender, **kwargs):
-    cache.delete_pattern('magic_cache_response_*')
+    # 增加接口缓存公共标签版本号，使所有接口缓存失效，无需遍历 key
+    MagicCacheTag.invalid([MagicCacheResponse.global_tag])
+
+
+@receiver(django_ready)
+def subscribe_magic_cache_invalid(sender, **kwargs):
+    logger.debug("Start subscribe magic cache invalid")
+
+    magic_cache_pub_sub.subscribe(lambda keys: MagicCacheData.invalid_local_caches(keys))
+
+
+@receiver(django_ready)
+def subscribe_magic_cache_tag_invalid(sender, **kwargs):
+    logger.debug("Start subscribe magic cache tag invalid")
+
+    magic_cache_tag_pub_sub.subscribe(lambda versions: MagicCacheTag.update_local_versions(versions))
+
+
+@receiver(django_ready)
+def subscribe_access_token_revoke(sender, **kwargs):
+    logger.debug("Start subscribe access token revoke")
+
+    token_revoke_pub_sub.subscribe(lambda revoked: token_revocation_filter.add(revoked))
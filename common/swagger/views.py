@@ -58,6 +58,9 @@ class ApiLogout(GenericAPIView):
 
 
 class SchemaMixin:
+    # 接口文档变化较少，浏览器缓存 5 分钟
+    cache_control = 'private, max-age=300'
+
     @xframe_options_exempt
     @cache_response(timeout=60 * 5, key_func='get_cache_key')
     def get(self, *args, **kwargs):
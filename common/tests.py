@@ -0,0 +1,206 @@
+import copy
+import datetime
+import ipaddress
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import GenericAPIView
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from common.base.magic import cache_response
+from common.core.db.utils import RelatedManager
+from common.core.importer import BulkImporter
+from common.core.modelset import CacheDetailResponseMixin
+from common.core.pagination import KeysetPagination, CountStrategy
+from common.core.response import ApiResponse
+from system.models import OperationLog, ModelLabelField, UserInfo
+from system.views.admin.modelfield import ModelLabelFieldViewSet
+
+
+def get_test_caches():
+    """优先使用 fakeredis，未安装时使用配置中的 redis"""
+    caches = copy.deepcopy(settings.CACHES)
+    try:
+        from fakeredis import FakeRedisConnection
+    except ImportError:
+        return caches
+    # 连接池按 LOCATION 全局缓存，更换地址避免复用真实 redis 的连接池
+    caches['default']['LOCATION'] = 'redis://fakeredis:6379/0'
+    caches['default']['OPTIONS']['CONNECTION_POOL_KWARGS'] = {'connection_class': FakeRedisConnection}
+    return caches
+
+
+class KeysetPaginationTestCase(TestCase):
+    page_size = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        OperationLog.objects.bulk_create([OperationLog(module=f"m{i}") for i in range(95)])
+        now = timezone.now()
+        for index, pk in enumerate(OperationLog.objects.order_by('pk').values_list('pk', flat=True)):
+            # 部分数据时间为空，部分数据时间相同，用于校验空值排序和主键排序
+            created_time = None if index % 7 == 0 else now - datetime.timedelta(minutes=index % 5)
+            OperationLog.objects.filter(pk=pk).update(created_time=created_time)
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def paginate(self, ordering, params, count_strategy=CountStrategy.EXACT, count_cap=10000):
+        paginator = KeysetPagination()
+        paginator.page_size = self.page_size
+        paginator.strategy = CountStrategy(count_strategy, count_cap)
+        queryset = OperationLog.objects.order_by(ordering)
+        results = paginator.paginate_queryset(queryset, Request(self.factory.get('/', params)))
+        return paginator.get_paginated_response([obj.pk for obj in results]).data
+
+    def walk(self, ordering):
+        data = self.paginate(ordering, {'page': 1})
+        pages = [data['results']]
+        while data['next']:
+            data = self.paginate(ordering, {'cursor': data['next']})
+            pages.append(data['results'])
+        return pages, data
+
+    def test_cursor_round_trip(self):
+        for ordering in ['created_time', '-created_time', 'pk', '-pk']:
+            expected = list(OperationLog.objects.order_by(ordering, ordering.replace('created_time', 'pk')).values_list(
+                'pk', flat=True))
+            pages, data = self.walk(ordering)
+            self.assertEqual(sum(pages, []), expected, ordering)
+            self.assertEqual(len(pages), 10)
+
+            # 通过 previous 游标反向翻页，与正向结果一致
+            back = []
+            cursor = data['previous']
+            while cursor:
+                data = self.paginate(ordering, {'cursor': cursor})
+                back.insert(0, data['results'])
+                cursor = data['previous']
+            self.assertEqual(back, pages[:-1], ordering)
+
+    def test_nullable_ordering(self):
+        for ordering in ['created_time', '-created_time']:
+            pages, _ = self.walk(ordering)
+            results = sum(pages, [])
+            self.assertEqual(len(results), len(set(results)))
+            self.assertEqual(set(results), set(OperationLog.objects.values_list('pk', flat=True)))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(NotFound):
+            self.paginate('created_time', {'cursor': 'invalid'})
+        cursor = self.paginate('created_time', {'page': 1})['next']
+        with self.assertRaises(NotFound):
+            self.paginate('-pk', {'cursor': cursor})
+
+    def test_capped_count(self):
+        data = self.paginate('-pk', {'page': 1}, CountStrategy.CAPPED, 30)
+        self.assertEqual(data['total'], 30)
+        self.assertFalse(data['total_exact'])
+
+        # 总数不精确时，允许访问超出总数的页码
+        data = self.paginate('-pk', {'page': 5}, CountStrategy.CAPPED, 30)
+        self.assertEqual(len(data['results']), self.page_size)
+        self.assertIsNotNone(data['next'])
+        data = self.paginate('-pk', {'page': 10}, CountStrategy.CAPPED, 30)
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+        data = self.paginate('-pk', {'page': 11}, CountStrategy.CAPPED, 30)
+        self.assertEqual(data['results'], [])
+
+        # 总数精确时，超出页码仍返回 404
+        data = self.paginate('-pk', {'page': 1}, CountStrategy.CAPPED, 1000)
+        self.assertEqual(data['total'], 95)
+        self.assertTrue(data['total_exact'])
+        with self.assertRaises(NotFound):
+            self.paginate('-pk', {'page': 11}, CountStrategy.CAPPED, 1000)
+
+
+@override_settings(CACHES=get_test_caches())
+class BulkImporterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserInfo.objects.create_superuser(username='importer', password='importer')
+
+    def import_data(self, act, data):
+        request = APIRequestFactory().post(f'/?action={act}&task=false', data, format='json')
+        force_authenticate(request, user=self.user)
+        view = ModelLabelFieldViewSet.as_view({'post': 'import_data'})
+        with mock.patch.object(BulkImporter, 'run', autospec=True, side_effect=BulkImporter.run) as run:
+            response = view(request)
+        return response.data, run
+
+    def test_import_by_bulk(self):
+        rows = [{'name': f'import_{i}', 'label': f'label {i}', 'field_type': 1} for i in range(20)]
+        data, run = self.import_data('create', rows)
+        self.assertTrue(run.called)
+        self.assertEqual(data['data']['count'], 20)
+        objs = ModelLabelField.objects.filter(name__startswith='import_')
+        self.assertEqual(objs.count(), 20)
+        self.assertEqual({obj.creator_id for obj in objs}, {self.user.pk})
+
+        rows = [{'pk': str(obj.pk), 'label': f'{obj.label} updated'} for obj in objs]
+        data, run = self.import_data('update', rows)
+        self.assertTrue(run.called)
+        self.assertEqual(data['data']['count'], 20)
+        self.assertEqual(ModelLabelField.objects.filter(label__endswith=' updated').count(), 20)
+
+
+class IpInQueryTestCase(TestCase):
+    ips = ['::1', '::2', '::ffff:1.2.3.4', '::ffff:10.0.0.1', '2001:db8::1', 'fe80::1', '1.2.3.4', '10.0.0.1']
+
+    @classmethod
+    def setUpTestData(cls):
+        OperationLog.objects.bulk_create([OperationLog(module='ip', ipaddress=ip) for ip in cls.ips])
+
+    def filter_ips(self, val):
+        queryset = OperationLog.objects.filter(RelatedManager.get_ip_in_q('ipaddress', val))
+        return set(queryset.values_list('ipaddress', flat=True))
+
+    def expected(self, network):
+        network = ipaddress.ip_network(network)
+        return {ip for ip in self.ips if ipaddress.ip_address(ip) in network}
+
+    def test_ipv6_rules(self):
+        for rule in ['::/0', '::1', '::/100', '::ffff:0:0/96', '::ffff:10.0.0.0/104', '2001:db8::/32']:
+            self.assertEqual(self.filter_ips([rule]), self.expected(rule), rule)
+        self.assertEqual(self.filter_ips(['::ffff:1.2.3.4']), {'::ffff:1.2.3.4'})
+
+
+class CachedDetailView(CacheDetailResponseMixin, GenericAPIView):
+    permission_classes = []
+    calls = 0
+
+    @cache_response(timeout=60, key_func='get_cache_key')
+    def get(self, request):
+        CachedDetailView.calls += 1
+        return ApiResponse(data={'calls': CachedDetailView.calls})
+
+
+@override_settings(CACHES=get_test_caches())
+class CacheResponseTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserInfo.objects.create_user(username='cached', password='cached')
+
+    def get_calls(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.user)
+        # 命中缓存时返回渲染后的 HttpResponse
+        response = CachedDetailView.as_view()(request)
+        return json.loads(response.content)['data']['calls']
+
+    def test_invalid_cache(self):
+        CachedDetailView.invalid_cache(self.user.pk)
+        calls = self.get_calls()
+        self.assertEqual(self.get_calls(), calls)
+
+        CachedDetailView.invalid_cache(self.user.pk)
+        self.assertEqual(self.get_calls(), calls + 1)
+        self.assertEqual(self.get_calls(), calls + 1)
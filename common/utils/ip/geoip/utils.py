@@ -7,9 +7,17 @@ import geoip2.database
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from geoip2.errors import GeoIP2Error
+from maxminddb import MODE_AUTO, MODE_MMAP_EXT, MODE_MMAP, MODE_FILE, MODE_MEMORY
 
 __all__ = ['get_ip_city_by_geoip']
 reader = None
+READER_MODES = {
+    'auto': MODE_AUTO,
+    'mmap_ext': MODE_MMAP_EXT,
+    'mmap': MODE_MMAP,
+    'file': MODE_FILE,
+    'memory': MODE_MEMORY,
+}
 
 
 def init_ip_reader():
@@ -23,7 +31,9 @@ def init_ip_reader():
     if not os.path.exists(path):
         raise FileNotFoundError(f"IP Database not found, please run `python manage.py download_ip_db`")
 
-    reader = geoip2.database.Reader(path)
+    # 默认 auto, 优先使用 C 扩展, 其次使用 mmap 方式读取, 多进程共享系统页缓存
+    mode = READER_MODES.get(getattr(settings, 'GEOIP_READER_MODE', 'auto'), MODE_AUTO)
+    reader = geoip2.database.Reader(path, mode=mode)
 
 
 def get_ip_city_by_geoip(ip):
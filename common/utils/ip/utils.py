@@ -1,10 +1,14 @@
+import bisect
 import ipaddress
 import socket
 from ipaddress import ip_network, ip_address
 
 from django.conf import settings
+from django.utils.functional import LazyObject
 from django.utils.translation import gettext_lazy as _
 
+from common.cache.local import LocalLRUCache
+
 from .geoip import get_ip_city_by_geoip
 from .ipip import get_ip_city_by_ipip
 
@@ -45,35 +49,121 @@ def in_ip_segment(ip, ip_segment):
     return min(ip1, ip2) <= ip <= max(ip1, ip2)
 
 
+def parse_ip_interval(ip):
+    """
+    将单个IP，IP段，CIDR 转换为整数区间
+    192.168.1.1 -> (4, start, end)
+    192.168.1.0/24 -> (4, start, end)
+    10.1.1.1-10.1.1.20 -> (4, start, end)
+    无法解析返回 None
+    """
+    try:
+        if '/' in ip:
+            network = ip_network(ip, strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        if '-' in ip:
+            start_ip, end_ip = [ip_address(x.strip()) for x in ip.split('-', 1)]
+            if start_ip.version != end_ip.version:
+                return None
+            start, end = sorted([int(start_ip), int(end_ip)])
+            return start_ip.version, start, end
+        address = ip_address(ip.strip())
+        return address.version, int(address), int(address)
+    except ValueError:
+        return None
+
+
+def merge_ip_intervals(ip_group):
+    """
+    将 IP，IP段，CIDR 混合列表转换为合并后的有序整数区间
+    :return: ({4: [(start, end)], 6: [(start, end)]}, [无法解析的值])
+    """
+    intervals = {4: [], 6: []}
+    others = []
+    for ip in ip_group:
+        if not ip or not isinstance(ip, str):
+            continue
+        interval = parse_ip_interval(ip)
+        if interval is None:
+            others.append(ip)
+            continue
+        intervals[interval[0]].append(interval[1:])
+
+    for version, items in intervals.items():
+        merged = []
+        for start, end in sorted(items):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        intervals[version] = merged
+    return intervals, others
+
+
+class IPMatcher(object):
+    """
+    编译后的 IP 匹配器，IP，IP段，CIDR 合并为有序整数区间，通过二分查找匹配
+    matcher = IPMatcher(['192.168.1.0/24', '10.1.1.1-10.1.1.20'])
+    matcher.contains('192.168.1.10')
+    """
+
+    def __init__(self, ip_group):
+        self.match_all = '*' in ip_group
+        intervals, others = merge_ip_intervals(ip_group)
+        self.starts = {version: [start for start, _ in items] for version, items in intervals.items()}
+        self.ends = {version: [end for _, end in items] for version, items in intervals.items()}
+        # address / host 等无法解析的值，直接比较字符串
+        self.others = set(others)
+
+    def contains(self, ip):
+        if self.match_all:
+            return True
+        if ip in self.others:
+            return True
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            return False
+        value = int(address)
+        starts = self.starts[address.version]
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= self.ends[address.version][index]
+
+
+class IPMatcherCache(LazyObject):
+    def _setup(self):
+        self._wrapped = LocalLRUCache(max_size=128)
+
+
+ip_matcher_cache = IPMatcherCache()
+
+
+def get_ip_matcher(ip_group):
+    """
+    获取编译后的匹配器，以 ip_group 内容为键缓存在进程内，配置变更后内容不同会自动重新编译
+    """
+    key = tuple(ip_group)
+    matcher = ip_matcher_cache.get(key)
+    if matcher is None:
+        matcher = IPMatcher(key)
+        ip_matcher_cache.set(key, matcher)
+    return matcher
+
+
+def clear_ip_matcher_cache():
+    ip_matcher_cache.clear()
+
+
 def contains_ip(ip, ip_group):
     """
     ip_group:
     [192.168.10.1, 192.168.1.0/24, 10.1.1.1-10.1.1.20, 2001:db8:2de::e13, 2001:db8:1a:1110::/64.]
 
     """
-
-    if '*' in ip_group:
-        return True
-
-    for _ip in ip_group:
-        if is_ip_address(_ip):
-            # 192.168.10.1
-            if ip == _ip:
-                return True
-        elif is_ip_network(_ip) and is_ip_address(ip):
-            # 192.168.1.0/24
-            if ip_address(ip) in ip_network(_ip):
-                return True
-        elif is_ip_segment(_ip) and is_ip_address(ip):
-            # 10.1.1.1-10.1.1.20
-            if in_ip_segment(ip, _ip):
-                return True
-        else:
-            # address / host
-            if ip == _ip:
-                return True
-
-    return False
+    if not ip_group:
+        return False
+    return get_ip_matcher(ip_group).contains(ip)
 
 
 def is_ip(ip, rule_value):
@@ -93,7 +183,36 @@ def is_ip(ip, rule_value):
         return ip.startswith(rule_value)
 
 
+class IPCityCache(LazyObject):
+    def _setup(self):
+        self._wrapped = LocalLRUCache(settings.IP_CITY_CACHE_SIZE, settings.IP_CITY_CACHE_TIMEOUT)
+
+
+ip_city_cache = IPCityCache()
+
+
 def get_ip_city(ip):
+    """
+    查询 ip 所在城市，查询结果缓存在进程内，避免日志等场景重复查询 ip 数据库
+    """
+    if not ip or not isinstance(ip, str):
+        return _("Invalid address")
+    city = ip_city_cache.get(ip)
+    if city is None:
+        city = _get_ip_city(ip)
+        ip_city_cache.set(ip, city)
+    return city
+
+
+def get_ip_cities(ips):
+    """
+    批量查询 ip 所在城市，相同 ip 只查询一次
+    :return: {ip: city}
+    """
+    return {ip: get_ip_city(ip) for ip in set(ips)}
+
+
+def _get_ip_city(ip):
     if not ip or not isinstance(ip, str):
         return _("Invalid address")
     if ':' in ip:
@@ -15,7 +15,8 @@ from common.celery.utils import get_celery_task_log_path
 from common.core.config import UserConfig
 from common.utils import get_logger
 from message.base import AsyncJsonWebsocket
-from message.utils import async_push_message, get_user_layer_group_name
+from message.utils import async_push_message, get_user_layer_group_name, async_presence_add, \
+    async_presence_discard
 from server.utils import get_current_request
 from system.models import UserInfo, UserLoginLog
 from system.views.auth.login import login_success
@@ -92,11 +93,19 @@ class MessageNotify(AsyncJsonWebsocket):
             self.disconnected = False
             # Join room group
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            if self.is_user_group:
+                await async_presence_add(self.user.pk, self.channel_name)
             await self.accept()
 
+    @property
+    def is_user_group(self):
+        return self.user and self.group_name == get_user_layer_group_name(self.user.pk)
+
     async def disconnect(self, close_code):
         self.disconnected = True
-        if self.group_name:
+        if self.is_user_group:
+            await async_presence_discard(self.user.pk, self.channel_name)
+        elif self.group_name:
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
         logger.info(f"{self.user} disconnect")
@@ -118,6 +127,14 @@ class MessageNotify(AsyncJsonWebsocket):
                 await asyncio.sleep(3)
                 await self.close()
 
+    async def ping(self, event):
+        if not self.is_user_group:
+            return await super().ping(event)
+        # 心跳时更新在线用户索引
+        await async_presence_add(self.user.pk, self.channel_name)
+        event['data'] = 'pong'
+        await self._send_base(event)
+
     # 下面查看文件方法忽略
     async def task_log(self, event):
         task_id = event.get("data", {}).get('task_id')
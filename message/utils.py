@@ -22,9 +22,9 @@ channel_layer = get_channel_layer()
 async def get_online_info():
     online_user_pks = []
     online_user_sockets = []
-    for group in await channel_layer.get_groups():
-        online_user_pks.append(int(group.split('_')[-1]))
-        online_user_sockets.extend(await get_layers_form_group(group))
+    for user_pk in await channel_layer.get_online_users():
+        online_user_pks.append(int(user_pk))
+        online_user_sockets.extend(await get_layers_form_group(get_user_layer_group_name(user_pk)))
     return online_user_pks, online_user_sockets
 
 
@@ -47,7 +47,38 @@ async def get_online_user_layers(user_pk):
 
 @async_to_sync
 async def get_online_users():
-    return [int(group.split('_')[-1]) for group in await channel_layer.get_groups()]
+    return [int(user_pk) for user_pk in await channel_layer.get_online_users()]
+
+
+@async_to_sync
+async def get_online_count():
+    return await channel_layer.get_online_count()
+
+
+@async_to_sync
+async def is_user_online(user_pk):
+    return await channel_layer.is_online(user_pk)
+
+
+@async_to_sync
+async def get_online_user_layer_count(user_pk):
+    return await channel_layer.get_layer_count(get_user_layer_group_name(user_pk))
+
+
+@async_to_sync
+async def get_online_users_layers(user_pks, count=False):
+    """批量获取用户的有效连接，返回 {user_pk: [channel, ...]}，count 为 True 时返回 {user_pk: count}"""
+    groups = {get_user_layer_group_name(pk): pk for pk in user_pks}
+    result = await channel_layer.get_groups_layers(groups.keys(), count=count)
+    return {groups[group]: value for group, value in result.items()}
+
+
+async def async_presence_add(user_pk, channel_name):
+    await channel_layer.presence_add(user_pk, get_user_layer_group_name(user_pk), channel_name)
+
+
+async def async_presence_discard(user_pk, channel_name):
+    await channel_layer.presence_discard(user_pk, get_user_layer_group_name(user_pk), channel_name)
 
 
 async def async_push_layer_message(channel_name: str, message: Dict, message_type='push_message'):
@@ -62,7 +93,7 @@ async def send_logout_msg(user_pk: str | int, channel_names: List[str] = None):
     if channel_names:
         for channel_name in channel_names:
             await async_push_layer_message(channel_name, {"message_type": "logout"})
-            await channel_layer.group_discard(group_name, channel_name)
+            await async_presence_discard(user_pk, channel_name)
 
 
 @async_to_sync
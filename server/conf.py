@@ -60,6 +60,11 @@ class Config(dict):
         'DB_DATABASE': 'xadmin',
         'DB_USER': 'server',
         'DB_PASSWORD': '',
+        # 读写分离从库，未配置的参数使用主库参数 [{'HOST': 'mariadb-replica', 'PORT': 3306, 'WEIGHT': 1}]
+        'DB_READ_REPLICAS': [],
+        'DB_ANALYTIC_REPLICAS': [],  # 导出和面板等分析查询使用的从库
+        'DB_REPLICA_STICKY_TIME': 10,  # Unit: second
+        'DB_REPLICA_RETRY_INTERVAL': 30,  # Unit: second
         'LANGUAGE_CODE': 'zh-hans',
         'TIME_ZONE': 'Asia/Shanghai',
         # 服务配置
@@ -91,6 +96,10 @@ class Config(dict):
         'SECURITY_LOGIN_LIMIT_COUNT': 7,
         'SECURITY_LOGIN_LIMIT_TIME': 30,  # Unit: minute
         'SECURITY_CHECK_DIFFERENT_CITY_LOGIN': True,
+        # ip 归属地查询缓存
+        'IP_CITY_CACHE_SIZE': 10000,
+        'IP_CITY_CACHE_TIMEOUT': 24 * 3600,  # Unit: second
+        'GEOIP_READER_MODE': 'auto',  # auto, mmap_ext, mmap, file, memory
         # 登录IP限制的规则
         'SECURITY_LOGIN_IP_BLACK_LIST': [],
         'SECURITY_LOGIN_IP_WHITE_LIST': [],
@@ -136,6 +145,8 @@ class Config(dict):
         'PERMISSION_DATA_ENABLED': True,  # 数据权限控制
         'REFERER_CHECK_ENABLED': False,  # referer 校验
         'EXPORT_MAX_LIMIT': 20000,  # 限制导出数据数量
+        'EXPORT_STREAM_ENABLED': True,  # 流式导出，分批读取数据，边生成边下载
+        'EXPORT_STREAM_CHUNK_SIZE': 1000,  # 流式导出每批读取数据数量
         # 验证码配置
         'VERIFY_CODE_TTL': 5 * 60,  # Unit: second
         'VERIFY_CODE_LIMIT': 60,
@@ -172,6 +183,10 @@ class Config(dict):
         'CAPTCHA_BACKGROUND_COLOR': "#ffffff",
         'CAPTCHA_FOREGROUND_COLOR': "#001100",
         'CAPTCHA_NOISE_FUNCTIONS': ("captcha.helpers.noise_arcs", "captcha.helpers.noise_dots"),
+        # 验证码池，预先生成验证码图片存放在 redis 中，请求时直接取出
+        'CAPTCHA_POOL_ENABLED': True,
+        'CAPTCHA_POOL_SIZE': 1000,  # 验证码池大小
+        'CAPTCHA_POOL_LOW_WATER': 200,  # 低于该数量时异步补充
     }
 
     defaults = {
@@ -182,6 +197,10 @@ class Config(dict):
             '/api/common/api/health': ['GET'],
         },
         'API_LOG_METHODS': ["POST", "DELETE", "PUT", "PATCH"],
+        'API_LOG_BATCH_SIZE': 100,  # 操作日志批量写入数量
+        'API_LOG_FLUSH_INTERVAL': 2,  # 操作日志最长写入间隔，Unit: second
+        'LOGIN_LOG_BATCH_SIZE': 100,  # 登录日志批量写入数量
+        'LOGIN_LOG_FLUSH_INTERVAL': 1,  # 登录日志最长写入间隔，Unit: second
         'API_MODEL_MAP': {
             "/api/system/refresh": "Token刷新",
             "/api/flower": "定时任务",
@@ -74,6 +74,25 @@ class RequestMiddleware:
         return response
 
 
+class DBRouterMiddleware:
+    """读写分离请求状态，未配置从库时不启用"""
+
+    def __init__(self, get_response):
+        from common.core.db.router import replica_router
+        if not replica_router.enabled:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.router = replica_router
+
+    def __call__(self, request):
+        self.router.start_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.router.end_request()
+        return response
+
+
 class RefererCheckMiddleware:
     def __init__(self, get_response):
         if not settings.REFERER_CHECK_ENABLED:
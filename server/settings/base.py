@@ -84,6 +84,7 @@ if DEBUG or DEBUG_DEV:
 MIDDLEWARE = [
     'server.middleware.StartMiddleware',
     'server.middleware.RequestMiddleware',
+    'server.middleware.DBRouterMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -195,6 +196,27 @@ if DB_ENGINE == 'mysql':
 
 DATABASE_ROUTERS = ['common.core.db.router.DBRouter']
 
+
+def get_replica_databases(prefix, replicas):
+    """
+    从库配置，未配置的参数使用主库参数
+    [{'HOST': 'mariadb-replica', 'PORT': 3306, 'WEIGHT': 1}]
+    :return: {别名: 权重}
+    """
+    result = {}
+    for index, replica in enumerate(replicas or []):
+        replica = dict(replica)
+        alias = f"{prefix}_{index}"
+        result[alias] = replica.pop('WEIGHT', 1)
+        DATABASES[alias] = {**DATABASES['default'], 'ATOMIC_REQUESTS': False, **replica, 'TEST': {'MIRROR': 'default'}}
+    return result
+
+
+DB_READ_REPLICAS = get_replica_databases('replica', CONFIG.DB_READ_REPLICAS)
+DB_ANALYTIC_REPLICAS = get_replica_databases('analytic', CONFIG.DB_ANALYTIC_REPLICAS)
+DB_REPLICA_STICKY_TIME = CONFIG.DB_REPLICA_STICKY_TIME  # 写操作后使用主库的时间，Unit: second
+DB_REPLICA_RETRY_INTERVAL = CONFIG.DB_REPLICA_RETRY_INTERVAL  # 从库异常后重试间隔，Unit: second
+
 # websocket 消息需要用到redis的消息发布订阅
 CHANNEL_LAYERS = {
     "default": {
@@ -275,12 +297,15 @@ LOCALE_PATHS = [
 
 CACHE_KEY_TEMPLATE = {
     'config_key': 'config',
+    'captcha_pool_key': 'captcha_pool',
+    'captcha_store_key': 'captcha_store',
     'make_token_key': 'make_token',
     'download_url_key': 'download_url',
     'pending_state_key': 'pending_state',
     'websocket_group_key': 'websocket_group',
     'upload_part_info_key': 'upload_part_info',
     'black_access_token_key': 'black_access_token',
+    'black_access_token_index_key': 'black_access_token_index',
     'common_resource_ids_key': 'common_resource_ids',
     'websocket_message_result_key': 'websocket_message_result'
 }
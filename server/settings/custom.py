@@ -26,6 +26,7 @@ ROUTE_IGNORE_URL = [
     "^/api/.*search-fields$",  # 每个方法都有该路由，则忽略即可
     "^/api/.*search-columns$",  # 该路由使用list权限字段，无需重新配置
     "^/api/settings/.*search-columns$",  # 该路由使用list权限字段，无需重新配置
+    "^/api/.*search-related$",  # 该路由使用list权限字段，无需重新配置
     "^/api/system/dashboard/",  # 忽略dashboard路由
     "^/api/system/captcha",  # 忽略图片验证码路由
 ]
@@ -47,6 +48,10 @@ PERMISSION_DATA_AUTH_APPS = [
 
 API_LOG_ENABLE = CONFIG.API_LOG_ENABLE
 API_LOG_METHODS = CONFIG.API_LOG_METHODS  # 'ALL'
+API_LOG_BATCH_SIZE = CONFIG.API_LOG_BATCH_SIZE  # 操作日志批量写入数量
+API_LOG_FLUSH_INTERVAL = CONFIG.API_LOG_FLUSH_INTERVAL  # 操作日志最长写入间隔，Unit: second
+LOGIN_LOG_BATCH_SIZE = CONFIG.LOGIN_LOG_BATCH_SIZE  # 登录日志批量写入数量
+LOGIN_LOG_FLUSH_INTERVAL = CONFIG.LOGIN_LOG_FLUSH_INTERVAL  # 登录日志最长写入间隔，Unit: second
 
 # 忽略日志记录, 支持model 或者 request_path, 不支持正则
 API_LOG_IGNORE = CONFIG.API_LOG_IGNORE
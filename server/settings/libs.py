@@ -32,7 +32,7 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'common.core.exception.common_exception_handler',
     'DEFAULT_METADATA_CLASS': 'common.drf.metadata.SimpleMetadataWithFilters',
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
+        'common.core.throttle.RedisAnonRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {  # {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
         'anon': '60/m',
@@ -123,7 +123,13 @@ CORS_ALLOW_HEADERS = (
     "user-agent",
     "x-csrftoken",
     "x-requested-with",
-    "x-token"
+    "x-token",
+    "if-none-match",
+)
+
+# 前端轮询接口时可以读取 ETag，通过 If-None-Match 获取 304 响应
+CORS_EXPOSE_HEADERS = (
+    "etag",
 )
 
 # Celery Configuration Options
@@ -27,6 +27,9 @@ SECURITY_PASSWORD_RULES = [
 SECURITY_LOGIN_LIMIT_COUNT = CONFIG.SECURITY_LOGIN_LIMIT_COUNT
 SECURITY_LOGIN_LIMIT_TIME = CONFIG.SECURITY_LOGIN_LIMIT_TIME  # Unit: minute
 SECURITY_CHECK_DIFFERENT_CITY_LOGIN = CONFIG.SECURITY_CHECK_DIFFERENT_CITY_LOGIN
+IP_CITY_CACHE_SIZE = CONFIG.IP_CITY_CACHE_SIZE
+IP_CITY_CACHE_TIMEOUT = CONFIG.IP_CITY_CACHE_TIMEOUT
+GEOIP_READER_MODE = CONFIG.GEOIP_READER_MODE
 # 登录IP限制的规则
 SECURITY_LOGIN_IP_BLACK_LIST = CONFIG.SECURITY_LOGIN_IP_BLACK_LIST
 SECURITY_LOGIN_IP_WHITE_LIST = CONFIG.SECURITY_LOGIN_IP_WHITE_LIST
@@ -77,6 +80,8 @@ PERMISSION_FIELD_ENABLED = CONFIG.PERMISSION_FIELD_ENABLED  # 字段权限控制
 PERMISSION_DATA_ENABLED = CONFIG.PERMISSION_DATA_ENABLED  # 数据权限控制
 REFERER_CHECK_ENABLED = CONFIG.REFERER_CHECK_ENABLED  # referer 校验
 EXPORT_MAX_LIMIT = CONFIG.EXPORT_MAX_LIMIT  # 限制导出数据数量
+EXPORT_STREAM_ENABLED = CONFIG.EXPORT_STREAM_ENABLED  # 流式导出
+EXPORT_STREAM_CHUNK_SIZE = CONFIG.EXPORT_STREAM_CHUNK_SIZE  # 流式导出每批读取数据数量
 
 # 验证码配置
 VERIFY_CODE_TTL = CONFIG.VERIFY_CODE_TTL  # Unit: second
@@ -118,6 +123,9 @@ CAPTCHA_FONT_SIZE = CONFIG.CAPTCHA_FONT_SIZE
 CAPTCHA_BACKGROUND_COLOR = CONFIG.CAPTCHA_BACKGROUND_COLOR
 CAPTCHA_FOREGROUND_COLOR = CONFIG.CAPTCHA_FOREGROUND_COLOR
 CAPTCHA_NOISE_FUNCTIONS = CONFIG.CAPTCHA_NOISE_FUNCTIONS
+CAPTCHA_POOL_ENABLED = CONFIG.CAPTCHA_POOL_ENABLED
+CAPTCHA_POOL_SIZE = CONFIG.CAPTCHA_POOL_SIZE
+CAPTCHA_POOL_LOW_WATER = CONFIG.CAPTCHA_POOL_LOW_WATER
 
 # 下面图片验证码 默认配置
 CAPTCHA_OUTPUT_FORMAT = '%(image)s %(text_field)s %(hidden_field)s '
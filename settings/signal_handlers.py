@@ -12,6 +12,7 @@ from django.utils.functional import LazyObject
 from common.signals import django_ready
 from common.utils import get_logger
 from common.utils.connection import RedisPubSub
+from common.utils.ip import clear_ip_matcher_cache
 from settings.models import Setting
 
 logger = get_logger(__name__)
@@ -41,4 +42,11 @@ def on_django_ready_add_db_config(sender, **kwargs):
 def subscribe_settings_change(sender, **kwargs):
     logger.debug("Start subscribe setting change")
 
-    setting_pub_sub.subscribe(lambda name: Setting.refresh_item(name))
+    setting_pub_sub.subscribe(on_setting_changed)
+
+
+def on_setting_changed(data):
+    Setting.refresh_item(data)
+    # IP 黑白名单变更后，清理编译后的 IP 匹配器
+    if data[0].startswith('SECURITY_LOGIN_IP_'):
+        clear_ip_matcher_cache()
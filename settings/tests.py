@@ -1 +1,91 @@
-# Create your tests here.
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase, override_settings
+
+from common.tests import get_test_caches
+from settings.utils.security import BlockIndexMixin, LoginBlockUtil, LoginIpBlockUtil
+
+
+@override_settings(CACHES=get_test_caches(), SECURITY_LOGIN_LIMIT_COUNT=5, SECURITY_LOGIN_LIMIT_TIME=30,
+                   SECURITY_LOGIN_IP_LIMIT_COUNT=5, SECURITY_LOGIN_IP_LIMIT_TIME=30,
+                   SECURITY_LOGIN_IP_WHITE_LIST=[], SECURITY_LOGIN_IP_BLACK_LIST=[])
+class SecurityBlockTestCase(SimpleTestCase):
+    workers = 20
+
+    def setUp(self):
+        try:
+            BlockIndexMixin.get_connection().ping()
+        except Exception as e:
+            self.skipTest(f"redis unavailable: {e}")
+        # 脚本绑定在连接上，切换缓存配置后需要重新注册
+        BlockIndexMixin._script = None
+        self.suffix = uuid.uuid4().hex[:8]
+        self.usernames = [f"user_{self.suffix}_{i}" for i in range(3)]
+        self.ips = [f"10.{i}.{int(self.suffix[:2], 16)}.{int(self.suffix[2:4], 16)}" for i in range(3)]
+
+    def tearDown(self):
+        LoginBlockUtil.unblock_users(self.usernames)
+        LoginIpBlockUtil.unblock_ips(self.ips)
+        BlockIndexMixin._script = None
+
+    def concurrent_run(self, func, args):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(func, args))
+
+    def test_concurrent_incr_user(self):
+        username = self.usernames[0]
+        ips = [self.ips[i % len(self.ips)] for i in range(self.workers)]
+        self.concurrent_run(lambda x: LoginBlockUtil(username, x).incr_failed_count(), ips)
+
+        counts = [LoginBlockUtil(username, x).get_failed_count() for x in self.ips]
+        self.assertEqual(sum(int(count) for count in counts), self.workers)
+        self.assertTrue(LoginBlockUtil.is_user_block(username))
+        self.assertIn(username, LoginBlockUtil.get_block_members())
+
+    def test_concurrent_incr_ip(self):
+        self.concurrent_run(lambda x: LoginIpBlockUtil(x).set_block_if_need(), self.ips[:2] * self.workers)
+
+        members = LoginIpBlockUtil.get_block_members()
+        for value in self.ips[:2]:
+            self.assertIn(value, members)
+            self.assertTrue(LoginIpBlockUtil(value).is_block())
+        self.assertNotIn(self.ips[2], members)
+
+    def test_list_block_ips(self):
+        from settings.views.block_ip import IpUtils, SecurityBlockIpViewSet
+
+        self.concurrent_run(lambda x: LoginIpBlockUtil(x).set_block_if_need(), self.ips * 5)
+
+        view = SecurityBlockIpViewSet()
+        queryset = view.filter_queryset(view.get_queryset())
+        data = {obj['ip']: obj for obj in queryset if obj['ip'] in self.ips}
+        self.assertEqual(set(data.keys()), set(self.ips))
+        for value, obj in data.items():
+            self.assertEqual(IpUtils(obj['pk']()).int_to_ip(), value)
+            self.assertNotEqual(obj['created_time'](), "N/A")
+
+        pks = [data[value]['pk']() for value in self.ips[:2]]
+        LoginIpBlockUtil.unblock_ips(queryset.filter(pk__in=pks))
+        members = LoginIpBlockUtil.get_block_members()
+        self.assertNotIn(self.ips[0], members)
+        self.assertNotIn(self.ips[1], members)
+        self.assertIn(self.ips[2], members)
+
+    def test_bulk_unblock_users(self):
+        args = [(username, value) for username in self.usernames for value in self.ips for _ in range(5)]
+        self.concurrent_run(lambda x: LoginBlockUtil(*x).incr_failed_count(), args)
+        for username in self.usernames:
+            self.assertTrue(LoginBlockUtil.is_user_block(username))
+
+        LoginBlockUtil.unblock_users(self.usernames[:2])
+
+        members = LoginBlockUtil.get_block_members()
+        for username in self.usernames[:2]:
+            self.assertFalse(LoginBlockUtil.is_user_block(username))
+            self.assertNotIn(username, members)
+            for value in self.ips:
+                self.assertEqual(LoginBlockUtil(username, value).get_failed_count(), 0)
+            self.assertFalse(BlockIndexMixin.get_connection().exists(LoginBlockUtil.get_ips_key(username)))
+        self.assertTrue(LoginBlockUtil.is_user_block(self.usernames[2]))
+        self.assertIn(self.usernames[2], members)
@@ -4,12 +4,12 @@
 # filename : security
 # author : ly_13
 # date : 8/10/2024
-
+import datetime
+import time
 
 from django.conf import settings
 from django.core.cache import cache
-from django.utils import timezone
-from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
 
 from common.utils import ip
 
@@ -28,7 +28,74 @@ class BlockUtil:
         return bool(cache.get(self.block_key))
 
 
-class BlockUtilBase:
+# 失败次数加一并刷新过期时间，达到限制次数后锁定，并加入锁定索引，score 为锁定时间
+INCR_AND_BLOCK_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if KEYS[4] then
+    redis.call('SADD', KEYS[4], ARGV[5])
+    redis.call('EXPIRE', KEYS[4], ARGV[1])
+end
+if count >= tonumber(ARGV[2]) then
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[1])
+    redis.call('ZADD', KEYS[3], ARGV[3], ARGV[4])
+end
+return count
+"""
+
+
+class BlockIndexMixin:
+    """
+    锁定数据维护在 sorted set 索引中，用于列表展示和批量解锁，避免使用 KEYS 和通配删除
+    """
+    BLOCK_KEY_TMPL: str
+    _script = None
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection("default")
+
+    @classmethod
+    def get_script(cls):
+        if BlockIndexMixin._script is None:
+            BlockIndexMixin._script = cls.get_connection().register_script(INCR_AND_BLOCK_SCRIPT)
+        return BlockIndexMixin._script
+
+    @classmethod
+    def get_index_key(cls):
+        return cache.make_key(f"block_index:{cls.BLOCK_KEY_TMPL}")
+
+    @classmethod
+    def get_key_ttl(cls):
+        raise NotImplementedError
+
+    @staticmethod
+    def decode(value):
+        # 原生连接未开启 decode_responses，返回的是 bytes
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    @classmethod
+    def get_block_members(cls):
+        """
+        :return: {锁定对象: 锁定时间}
+        """
+        index_key = cls.get_index_key()
+        now = int(time.time())
+        pipe = cls.get_connection().pipeline(transaction=False)
+        pipe.zremrangebyscore(index_key, '-inf', now - cls.get_key_ttl())
+        pipe.zrange(index_key, 0, -1, withscores=True)
+        members = pipe.execute()[1]
+        return {cls.decode(member): datetime.datetime.fromtimestamp(score, tz=datetime.timezone.utc) for member, score in
+                members}
+
+    def incr_and_block(self, limit_count, member, ips_key=None, ip=''):
+        keys = [cache.make_key(self.limit_key), cache.make_key(self.block_key), self.get_index_key()]
+        if ips_key:
+            keys.append(ips_key)
+        return int(self.get_script()(keys=keys, args=[self.key_ttl, limit_count, int(time.time()), member, ip]))
+
+
+class BlockUtilBase(BlockIndexMixin):
     LIMIT_KEY_TMPL: str
     BLOCK_KEY_TMPL: str
 
@@ -37,7 +104,16 @@ class BlockUtilBase:
         self.ip = ip
         self.limit_key = self.LIMIT_KEY_TMPL.format(username, ip)
         self.block_key = self.BLOCK_KEY_TMPL.format(username)
-        self.key_ttl = int(settings.SECURITY_LOGIN_LIMIT_TIME) * 60
+        self.key_ttl = self.get_key_ttl()
+
+    @classmethod
+    def get_key_ttl(cls):
+        return int(settings.SECURITY_LOGIN_LIMIT_TIME) * 60
+
+    @classmethod
+    def get_ips_key(cls, username):
+        # 记录用户失败的ip，解锁时删除对应的失败次数
+        return cache.make_key(f"block_ips:{cls.LIMIT_KEY_TMPL.format(username, '')}")
 
     def get_remainder_times(self):
         times_up = settings.SECURITY_LOGIN_LIMIT_COUNT
@@ -46,14 +122,8 @@ class BlockUtilBase:
         return times_remainder
 
     def incr_failed_count(self) -> int:
-        limit_key = self.limit_key
-        count = cache.get(limit_key, 0)
-        count += 1
-        cache.set(limit_key, count, self.key_ttl)
-
         limit_count = settings.SECURITY_LOGIN_LIMIT_COUNT
-        if count >= limit_count:
-            cache.set(self.block_key, True, self.key_ttl)
+        count = self.incr_and_block(limit_count, self.username, self.get_ips_key(self.username), self.ip)
         return limit_count - count
 
     def get_failed_count(self):
@@ -61,27 +131,52 @@ class BlockUtilBase:
         return count
 
     def clean_failed_count(self):
-        cache.delete(self.limit_key)
-        cache.delete(self.block_key)
+        cache.delete_many([self.limit_key, self.block_key])
+        pipe = self.get_connection().pipeline(transaction=False)
+        pipe.srem(self.get_ips_key(self.username), self.ip)
+        pipe.zrem(self.get_index_key(), self.username)
+        pipe.execute()
+
+    @classmethod
+    def unblock_users(cls, usernames):
+        """批量解锁用户，删除锁定状态和所有ip的失败次数"""
+        if not usernames:
+            return
+        connection = cls.get_connection()
+        pipe = connection.pipeline(transaction=False)
+        for username in usernames:
+            pipe.smembers(cls.get_ips_key(username))
+        keys = []
+        for username, ips in zip(usernames, pipe.execute()):
+            keys.append(cls.BLOCK_KEY_TMPL.format(username))
+            keys.extend(cls.LIMIT_KEY_TMPL.format(username, cls.decode(ip)) for ip in ips)
+        cache.delete_many(keys)
+        pipe = connection.pipeline(transaction=False)
+        pipe.delete(*[cls.get_ips_key(username) for username in usernames])
+        pipe.zrem(cls.get_index_key(), *usernames)
+        pipe.execute()
 
     @classmethod
     def unblock_user(cls, username):
-        key_limit = cls.LIMIT_KEY_TMPL.format(username, '*')
-        key_block = cls.BLOCK_KEY_TMPL.format(username)
-        # Redis 尽量不要用通配
-        cache.delete_pattern(key_limit)
-        cache.delete(key_block)
+        cls.unblock_users([username])
 
     @classmethod
     def is_user_block(cls, username):
         block_key = cls.BLOCK_KEY_TMPL.format(username)
         return bool(cache.get(block_key))
 
+    @classmethod
+    def get_users_block(cls, usernames):
+        """批量获取用户锁定状态，一次 MGET，返回 {username: bool}"""
+        keys = {cls.BLOCK_KEY_TMPL.format(username): username for username in usernames}
+        values = cache.get_many(list(keys.keys()))
+        return {username: bool(values.get(key)) for key, username in keys.items()}
+
     def is_block(self):
         return bool(cache.get(self.block_key))
 
 
-class BlockGlobalIpUtilBase:
+class BlockGlobalIpUtilBase(BlockIndexMixin):
     LIMIT_KEY_TMPL: str
     BLOCK_KEY_TMPL: str
 
@@ -89,7 +184,11 @@ class BlockGlobalIpUtilBase:
         self.ip = ip
         self.limit_key = self.LIMIT_KEY_TMPL.format(ip)
         self.block_key = self.BLOCK_KEY_TMPL.format(ip)
-        self.key_ttl = int(settings.SECURITY_LOGIN_IP_LIMIT_TIME) * 60
+        self.key_ttl = self.get_key_ttl()
+
+    @classmethod
+    def get_key_ttl(cls):
+        return int(settings.SECURITY_LOGIN_IP_LIMIT_TIME) * 60
 
     @property
     def ip_in_black_list(self):
@@ -102,18 +201,20 @@ class BlockGlobalIpUtilBase:
     def set_block_if_need(self):
         if self.ip_in_white_list or self.ip_in_black_list:
             return
-        count = cache.get(self.limit_key, 0)
-        count += 1
-        cache.set(self.limit_key, count, self.key_ttl)
-
-        limit_count = settings.SECURITY_LOGIN_IP_LIMIT_COUNT
-        if count < limit_count:
-            return
-        cache.set(self.block_key, timezone.now().isoformat(), self.key_ttl)
+        self.incr_and_block(settings.SECURITY_LOGIN_IP_LIMIT_COUNT, self.ip)
 
     def clean_block_if_need(self):
-        cache.delete(self.limit_key)
-        cache.delete(self.block_key)
+        self.unblock_ips([self.ip])
+
+    @classmethod
+    def unblock_ips(cls, ips):
+        if not ips:
+            return
+        keys = []
+        for value in ips:
+            keys.extend([cls.LIMIT_KEY_TMPL.format(value), cls.BLOCK_KEY_TMPL.format(value)])
+        cache.delete_many(keys)
+        cls.get_connection().zrem(cls.get_index_key(), *ips)
 
     def is_block(self):
         if self.ip_in_white_list:
@@ -126,7 +227,7 @@ class BlockGlobalIpUtilBase:
         try:
             data = cache.get(self.block_key)
             if data:
-                return parse_datetime(data)
+                return datetime.datetime.fromtimestamp(int(data), tz=datetime.timezone.utc)
             return "N/A"
         except:
             return "N/A"
@@ -6,11 +6,18 @@
 # date : 8/12/2024
 import socket
 import struct
+from functools import partial
 
 from django.conf import settings
-from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.plumbing import build_basic_type, build_array_type
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiRequest
+from rest_framework.decorators import action
 
 from common.core.modelset import ListDeleteModelSet
+from common.core.response import ApiResponse
+from common.swagger.utils import get_default_response_schema
 from settings.models import Setting
 from settings.serializers.security import SecurityBlockIPSerializer
 from settings.utils.security import LoginIpBlockUtil
@@ -42,25 +49,34 @@ class SecurityBlockIpViewSet(ListDeleteModelSet):
 
     def filter_queryset(self, obj):
         # 为啥写函数，去没有加(), 因为只有在序列化的时候，才会判断，如果是方法就执行，减少资源浪费
-        data = [{'ip': ip, 'pk': IpUtils(ip).ip_to_int, 'created_time': LoginIpBlockUtil(ip).get_block_info} for ip in
-                obj]
+        block_members = getattr(self, 'block_members', {})
+        data = [{'ip': ip, 'pk': IpUtils(ip).ip_to_int, 'created_time': partial(block_members.get, ip, "N/A")} for
+                ip in obj]
         return FilterIps(data)
 
     def get_queryset(self):
-        ips = []
-        prefix = LoginIpBlockUtil.BLOCK_KEY_TMPL.replace('{}', '')
-        keys = cache.keys(f'{prefix}*')
-        for key in keys:
-            ips.append(key.replace(prefix, ''))
+        # 从锁定索引中获取，避免使用 KEYS 扫描
+        self.block_members = LoginIpBlockUtil.get_block_members()
 
         white_list = settings.SECURITY_LOGIN_IP_WHITE_LIST
-        ips = list(set(ips) - set(white_list))
+        ips = list(set(self.block_members.keys()) - set(white_list))
         ips = [ip for ip in ips if ip != '*']
         return ips
 
     def get_object(self):
         return IpUtils(self.kwargs.get("pk")).int_to_ip()
 
+    @extend_schema(
+        request=OpenApiRequest(build_array_type(build_basic_type(OpenApiTypes.STR))),
+        responses=get_default_response_schema()
+    )
+    @action(methods=['post'], detail=False, url_path='batch-destroy')
+    def batch_destroy(self, request, *args, **kwargs):
+        """批量删除{cls}"""
+        ips = self.filter_queryset(self.get_queryset()).filter(pk__in=request.data)
+        LoginIpBlockUtil.unblock_ips(ips)
+        return ApiResponse(detail=_("Operation successful. Batch deleted {} data").format(len(ips)))
+
     def perform_destroy(self, ip):
         LoginIpBlockUtil(ip).clean_block_if_need()
         return 1, 1
@@ -37,3 +37,4 @@ class Command(LoadCommand):
         options["exclude"] = []
         options["format"] = "json"
         super(Command, self).handle(*fixture_labels, **options)
+        DeptClosure.rebuild()  # 信号已忽略，需要重建部门闭包表
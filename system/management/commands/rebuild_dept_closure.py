@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : rebuild_dept_closure
+# author : ly_13
+# date : 10/18/2026
+
+from django.core.management.base import BaseCommand
+
+from system.models import DeptClosure
+
+
+class Command(BaseCommand):
+    help = 'rebuild department closure table, run it after loaddata department data'
+
+    def handle(self, *args, **options):
+        count = DeptClosure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"rebuild department closure success. count:{count}"))
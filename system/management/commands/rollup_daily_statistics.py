@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : rollup_daily_statistics
+# author : ly_13
+# date : 10/18/2026
+
+from django.core.management.base import BaseCommand
+
+from system.models import DailyStatistics
+
+
+class Command(BaseCommand):
+    help = 'rollup dashboard daily statistics, used to backfill history data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='rollup recent days, default 365')
+
+    def handle(self, *args, **options):
+        count = DailyStatistics.rollup(max(options['days'], 1))
+        self.stdout.write(self.style.SUCCESS(f"rollup daily statistics success. count:{count}"))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rebuild_dept_closure(apps, schema_editor):
+    dept_info = apps.get_model('system', 'DeptInfo')
+    dept_closure = apps.get_model('system', 'DeptClosure')
+    parents = dict(dept_info.objects.values_list('pk', 'parent_id'))
+    nodes = []
+    for dept_id in parents:
+        ancestor_id, depth = dept_id, 0
+        visited = set()
+        while ancestor_id in parents and ancestor_id not in visited:
+            visited.add(ancestor_id)
+            nodes.append(dept_closure(ancestor_id=ancestor_id, descendant_id=dept_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    dept_closure.objects.bulk_create(nodes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('system', '0003_userloginlog_channel_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeptClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(default=0, verbose_name='Depth')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                               to='system.deptinfo', verbose_name='Ancestor department')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                                 to='system.deptinfo', verbose_name='Descendant department')),
+            ],
+            options={
+                'verbose_name': 'Department closure',
+                'verbose_name_plural': 'Department closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='system_deptclosure_desc_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(rebuild_dept_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('system', '0004_deptclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('metric', models.CharField(
+                    choices=[('login', 'Login count'), ('register', 'Register count'),
+                             ('operation', 'Operation count'), ('login_total', 'Login total'),
+                             ('user_total', 'User total'), ('operation_total', 'Operation total'),
+                             ('active_1', 'Active users in 1 day'), ('active_3', 'Active users in 3 days'),
+                             ('active_7', 'Active users in 7 days'), ('active_30', 'Active users in 30 days')],
+                    max_length=32, verbose_name='Metric')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Count')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='Updated time')),
+            ],
+            options={
+                'verbose_name': 'Daily statistics',
+                'verbose_name_plural': 'Daily statistics',
+                'unique_together': {('date', 'metric')},
+            },
+        ),
+    ]
@@ -7,7 +7,7 @@
 
 import json
 
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework.utils import encoders
 
@@ -29,21 +29,18 @@ class DeptInfo(DbAuditModel, ModeTypeAbstract, DbUuidModel):
     is_active = models.BooleanField(verbose_name=_("Is active"), default=True)
 
     @classmethod
-    def recursion_dept_info(cls, dept_id: int, dept_all_list=None, dept_list=None, is_parent=False):
-        parent = 'parent'
-        pk = 'pk'
+    def recursion_dept_info(cls, dept_id, dept_all_list=None, dept_list=None, is_parent=False):
+        """
+        获取部门及下级部门ID，is_parent 为 True 时获取部门及上级部门ID，通过部门闭包表单次查询
+        dept_all_list, dept_list 参数已废弃，仅为兼容保留
+        """
         if is_parent:
-            parent, pk = pk, parent
-        if not dept_all_list:
-            dept_all_list = DeptInfo.objects.values("pk", "parent")
-        if dept_list is None:
-            dept_list = [dept_id]
-        for dept in dept_all_list:
-            if dept.get(parent) == dept_id:
-                if dept.get(pk):
-                    dept_list.append(dept.get(pk))
-                    cls.recursion_dept_info(dept.get(pk), dept_all_list, dept_list, is_parent)
-        return json.loads(json.dumps(list(set(dept_list)), cls=encoders.JSONEncoder))
+            pks = DeptClosure.get_ancestor_ids(dept_id)
+        else:
+            pks = DeptClosure.get_descendant_ids(dept_id)
+        if not pks and dept_id:
+            pks = dept_id if isinstance(dept_id, (list, tuple, set)) else [dept_id]
+        return json.loads(json.dumps(list(set(pks)), cls=encoders.JSONEncoder))
 
     class Meta:
         verbose_name = _("Department")
@@ -52,3 +49,95 @@ class DeptInfo(DbAuditModel, ModeTypeAbstract, DbUuidModel):
 
     def __str__(self):
         return f"{self.name}({self.pk})"
+
+
+class DeptClosure(models.Model):
+    """
+    部门闭包表，保存所有 上级部门-下级部门 关系，包含部门自身(depth=0)
+    通过 system.signal_handler 在部门保存时维护，部门删除时级联删除
+    """
+    ancestor = models.ForeignKey('system.DeptInfo', on_delete=models.CASCADE, verbose_name=_("Ancestor department"),
+                                 related_name='+')
+    descendant = models.ForeignKey('system.DeptInfo', on_delete=models.CASCADE,
+                                   verbose_name=_("Descendant department"), related_name='+')
+    depth = models.PositiveIntegerField(verbose_name=_("Depth"), default=0)
+
+    @staticmethod
+    def _get_dept_q(name, dept_id):
+        if isinstance(dept_id, (list, tuple, set)):
+            return models.Q(**{f"{name}__in": dept_id})
+        return models.Q(**{name: dept_id})
+
+    @classmethod
+    def get_descendant_ids(cls, dept_id):
+        """部门及所有下级部门ID，dept_id 支持列表"""
+        return list(cls.objects.filter(cls._get_dept_q('ancestor_id', dept_id)).values_list(
+            'descendant_id', flat=True).distinct())
+
+    @classmethod
+    def get_ancestor_ids(cls, dept_id):
+        """部门及所有上级部门ID，dept_id 支持列表"""
+        return list(cls.objects.filter(cls._get_dept_q('descendant_id', dept_id)).values_list(
+            'ancestor_id', flat=True).distinct())
+
+    @classmethod
+    def insert_node(cls, dept_id, parent_id):
+        """新增部门"""
+        nodes = [cls(ancestor_id=dept_id, descendant_id=dept_id, depth=0)]
+        if parent_id:
+            for ancestor_id, depth in cls.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth'):
+                nodes.append(cls(ancestor_id=ancestor_id, descendant_id=dept_id, depth=depth + 1))
+        cls.objects.bulk_create(nodes, ignore_conflicts=True)
+
+    @classmethod
+    def move_node(cls, dept_id, parent_id):
+        """移动部门及其下级部门到新的上级部门下"""
+        with transaction.atomic():
+            subtree = list(cls.objects.filter(ancestor_id=dept_id).values_list('descendant_id', 'depth'))
+            subtree_ids = [descendant_id for descendant_id, depth in subtree]
+            cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+            if parent_id:
+                ancestors = cls.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+                cls.objects.bulk_create([
+                    cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=a_depth + d_depth + 1)
+                    for ancestor_id, a_depth in ancestors for descendant_id, d_depth in subtree
+                ], batch_size=1000)
+
+    @classmethod
+    def sync_node(cls, instance):
+        """部门保存后同步闭包表，若上级部门闭包数据缺失，则重建整个闭包表"""
+        parent_id = instance.parent_id
+        if parent_id and not cls.objects.filter(descendant_id=parent_id, ancestor_id=parent_id).exists():
+            return cls.rebuild()
+        if not cls.objects.filter(descendant_id=instance.pk, ancestor_id=instance.pk).exists():
+            return cls.insert_node(instance.pk, parent_id)
+        old_parent_id = cls.objects.filter(descendant_id=instance.pk, depth=1).values_list(
+            'ancestor_id', flat=True).first()
+        if old_parent_id != parent_id:
+            cls.move_node(instance.pk, parent_id)
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """根据部门 parent 字段重建闭包表"""
+        parents = dict(DeptInfo.objects.values_list('pk', 'parent_id'))
+        nodes = []
+        for dept_id in parents:
+            ancestor_id, depth = dept_id, 0
+            visited = set()
+            while ancestor_id in parents and ancestor_id not in visited:
+                visited.add(ancestor_id)
+                nodes.append(cls(ancestor_id=ancestor_id, descendant_id=dept_id, depth=depth))
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(nodes, batch_size=batch_size)
+        return len(nodes)
+
+    class Meta:
+        verbose_name = _("Department closure")
+        verbose_name_plural = verbose_name
+        unique_together = ('ancestor', 'descendant')
+        indexes = [models.Index(fields=['descendant', 'depth'], name='system_deptclosure_desc_idx')]
+
+    def __str__(self):
+        return f"{self.ancestor_id}->{self.descendant_id}({self.depth})"
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project : xadmin-server
+# filename : statistics
+# author : ly_13
+# date : 10/18/2026
+
+import datetime
+
+from django.db import models, connections
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from system.models.log import UserLoginLog, OperationLog
+from system.models.user import UserInfo
+
+
+class DailyStatistics(models.Model):
+    """
+    面板每日统计数据，由定时任务增量汇总，面板接口直接读取，避免每次请求扫描日志表
+    """
+
+    class MetricChoices(models.TextChoices):
+        LOGIN = 'login', _("Login count")
+        REGISTER = 'register', _("Register count")
+        OPERATION = 'operation', _("Operation count")
+        LOGIN_TOTAL = 'login_total', _("Login total")
+        USER_TOTAL = 'user_total', _("User total")
+        OPERATION_TOTAL = 'operation_total', _("Operation total")
+        ACTIVE_1 = 'active_1', _("Active users in 1 day")
+        ACTIVE_3 = 'active_3', _("Active users in 3 days")
+        ACTIVE_7 = 'active_7', _("Active users in 7 days")
+        ACTIVE_30 = 'active_30', _("Active users in 30 days")
+
+    date = models.DateField(verbose_name=_("Date"))
+    metric = models.CharField(max_length=32, choices=MetricChoices, verbose_name=_("Metric"))
+    count = models.BigIntegerField(default=0, verbose_name=_("Count"))
+    updated_time = models.DateTimeField(auto_now=True, verbose_name=_("Updated time"))
+
+    class Meta:
+        verbose_name = _("Daily statistics")
+        verbose_name_plural = verbose_name
+        unique_together = (('date', 'metric'),)
+
+    def __str__(self):
+        return f"{self.date}-{self.metric}({self.count})"
+
+    # 每日数量统计，metric: (模型, 时间字段)
+    daily_metrics = {
+        MetricChoices.LOGIN: (UserLoginLog, 'created_time'),
+        MetricChoices.REGISTER: (UserInfo, 'created_time'),
+        MetricChoices.OPERATION: (OperationLog, 'created_time'),
+    }
+    total_metrics = {
+        MetricChoices.LOGIN_TOTAL: UserLoginLog,
+        MetricChoices.USER_TOTAL: UserInfo,
+        MetricChoices.OPERATION_TOTAL: OperationLog,
+    }
+    active_metrics = {
+        MetricChoices.ACTIVE_1: 1,
+        MetricChoices.ACTIVE_3: 3,
+        MetricChoices.ACTIVE_7: 7,
+        MetricChoices.ACTIVE_30: 30,
+    }
+
+    @staticmethod
+    def get_day_start(date):
+        return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+    @classmethod
+    def collect(cls, days=2):
+        """
+        汇总最近 days 天的每日数量，以及当天的总数和活跃用户数
+        :return: {(date, metric): count}
+        """
+        today = timezone.localdate()
+        start_date = today - datetime.timedelta(days=days - 1)
+        start_time = cls.get_day_start(start_date)
+        values = {}
+        for metric, (model, field) in cls.daily_metrics.items():
+            for i in range(days):
+                values[(start_date + datetime.timedelta(days=i), metric)] = 0
+            queryset = model.objects.filter(**{f"{field}__gte": start_time}).annotate(
+                day=TruncDate(field)).order_by().values('day').annotate(count=Count('pk')).values_list('day', 'count')
+            for day, count in queryset:
+                if day:
+                    values[(day, metric)] = count
+        for metric, model in cls.total_metrics.items():
+            values[(today, metric)] = model.objects.count()
+        for metric, day in cls.active_metrics.items():
+            day_start = cls.get_day_start(today - datetime.timedelta(days=day - 1))
+            values[(today, metric)] = UserInfo.objects.filter(last_login__gte=day_start).count()
+        return values
+
+    @classmethod
+    def rollup(cls, days=2):
+        """
+        增量汇总，定时任务默认汇总今天和昨天的数据，历史数据通过 rollup_daily_statistics 命令回填
+        :return: 写入数量
+        """
+        values = cls.collect(days)
+        objs = [cls(date=date, metric=metric, count=count) for (date, metric), count in values.items()]
+        db = cls.objects.db
+        # mysql 不支持指定 unique_fields，通过唯一索引判断冲突
+        unique_fields = ['date', 'metric'] if connections[db].features.supports_update_conflicts_with_target else None
+        cls.objects.bulk_create(objs, batch_size=1000, update_conflicts=True, unique_fields=unique_fields,
+                                update_fields=['count', 'updated_time'])
+        return len(objs)
+
+    @classmethod
+    def get_values(cls, metrics, start_date, end_date=None):
+        """
+        :return: {metric: {date: count}}
+        """
+        end_date = end_date or timezone.localdate()
+        data = {metric: {} for metric in metrics}
+        queryset = cls.objects.filter(metric__in=metrics, date__gte=start_date, date__lte=end_date)
+        for date, metric, count in queryset.values_list('date', 'metric', 'count'):
+            data[metric][date] = count
+        return data
+
+    @classmethod
+    def has_range(cls, metric, start_date, end_date=None):
+        """
+        汇总数据是否覆盖 [start_date, end_date] 的每一天，历史数据未回填或定时任务中断时，面板接口使用实时查询
+        """
+        end_date = end_date or timezone.localdate()
+        count = cls.objects.filter(metric=metric, date__gte=start_date, date__lte=end_date).count()
+        return count == (end_date - start_date).days + 1
+
+    @classmethod
+    def has_today(cls, metric):
+        """当天数据是否已经汇总"""
+        return cls.has_range(metric, timezone.localdate())
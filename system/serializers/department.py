@@ -5,6 +5,7 @@
 # author : ly_13
 # date : 8/10/2024
 
+from django.db.models import Count
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
@@ -12,7 +13,7 @@ from rest_framework.exceptions import ValidationError
 
 from common.core.serializers import BaseModelSerializer
 from common.utils import get_logger
-from system.models import DeptInfo
+from system.models import DeptInfo, UserInfo
 
 logger = get_logger(__name__)
 
@@ -56,6 +57,13 @@ class DeptSerializer(BaseModelSerializer):
             raise ValidationError(_("The superior department cannot be its own subordinate department"))
         return super().update(instance, validated_data)
 
+    def batch_get_user_count(self, instances):
+        queryset = UserInfo.objects.filter(dept__in=[obj.pk for obj in instances]).order_by().values('dept')
+        return dict(queryset.annotate(count=Count('pk')).values_list('dept', 'count'))
+
     @extend_schema_field(serializers.IntegerField)
     def get_user_count(self, obj):
+        values = self.get_batch_values('get_user_count')
+        if values is not None:
+            return values.get(obj.pk, 0)
         return obj.userinfo_set.count()
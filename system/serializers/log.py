@@ -10,7 +10,7 @@ from rest_framework import serializers
 
 from common.core.serializers import BaseModelSerializer
 from common.utils import get_logger
-from message.utils import get_online_user_layers
+from message.utils import get_online_user_layers, get_online_users_layers
 from system.models import UserLoginLog, OperationLog
 
 logger = get_logger(__name__)
@@ -51,9 +51,16 @@ class LoginLogSerializer(BaseModelSerializer):
 
     online = serializers.SerializerMethodField(read_only=True, label=_("Online"))
 
+    def batch_get_online(self, instances):
+        pks = {obj.creator_id for obj in instances if UserLoginLog.LoginTypeChoices.WEBSOCKET == obj.login_type}
+        return get_online_users_layers(pks) if pks else {}
+
     @extend_schema_field(serializers.IntegerField)
     def get_online(self, obj):
         if UserLoginLog.LoginTypeChoices.WEBSOCKET == obj.login_type:
+            values = self.get_batch_values('get_online')
+            if values is not None:
+                return obj.channel_name in values.get(obj.creator_id, [])
             return obj.channel_name in get_online_user_layers(obj.creator.pk)
         return -1
 
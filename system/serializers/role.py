@@ -45,8 +45,19 @@ class RoleSerializer(BaseModelSerializer):
     field = serializers.SerializerMethodField(read_only=True, label=_("Fields"))
     fields = serializers.DictField(write_only=True, label=_("Fields"))
 
+    def batch_get_field(self, instances):
+        queryset = FieldPermission.objects.filter(role__in=instances).prefetch_related('field')
+        results = FieldPermissionSerializer(queryset, many=True, ignore_field_permission=True).data
+        data = {obj.pk: {} for obj in instances}
+        for instance, res in zip(queryset, results):
+            data[instance.role_id][str(res.get('menu'))] = res.get('field', [])
+        return data
+
     @extend_schema_field(OpenApiTypes.OBJECT)
     def get_field(self, obj):
+        values = self.get_batch_values('get_field')
+        if values is not None:
+            return values.get(obj.pk, {})
         results = FieldPermissionSerializer(FieldPermission.objects.filter(role=obj), many=True,
                                             ignore_field_permission=True).data
         data = {}
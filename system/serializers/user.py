@@ -16,7 +16,7 @@ from common.base.utils import AESCipherV2
 from common.core.serializers import BaseModelSerializer
 from common.fields.utils import input_wrapper
 from common.utils import get_logger
-from message.utils import get_online_user_layers
+from message.utils import get_online_user_layers, get_online_users_layers
 from settings.utils.password import check_password_rules
 from settings.utils.security import LoginBlockUtil
 from system.models import UserInfo
@@ -52,12 +52,25 @@ class UserSerializer(BaseModelSerializer):
     online_count = input_wrapper(serializers.SerializerMethodField)(read_only=True, input_type='number',
                                                                     label=_("Online count"))
 
+    def batch_get_block(self, instances):
+        blocks = LoginBlockUtil.get_users_block([obj.username for obj in instances])
+        return {obj.pk: blocks.get(obj.username, False) for obj in instances}
+
     @extend_schema_field(serializers.BooleanField)
     def get_block(self, obj):
+        values = self.get_batch_values('get_block')
+        if values is not None:
+            return values.get(obj.pk, False)
         return LoginBlockUtil.is_user_block(obj.username)
 
+    def batch_get_online_count(self, instances):
+        return get_online_users_layers([obj.pk for obj in instances], count=True)
+
     @extend_schema_field(serializers.IntegerField)
     def get_online_count(self, obj):
+        values = self.get_batch_values('get_online_count')
+        if values is not None:
+            return values.get(obj.pk, 0)
         return len(get_online_user_layers(obj.pk))
 
     def validate(self, attrs):
@@ -4,51 +4,57 @@
 # filename : signal_handler.py
 # author : ly_13
 # date : 12/15/2023
-import itertools
-
 from django.contrib.auth import user_logged_out
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, m2m_changed
 from django.dispatch import receiver
+from django.utils.functional import LazyObject
 
-from common.base.magic import cache_response, MagicCacheData
+from common.base.magic import MagicCacheTag
 from common.core.config import SysConfig
+from common.core.filter import DataPermissionVersion
+from common.core.permission import permission_route_index
+from common.signals import django_ready
 from common.utils import get_logger
-from system.models import Menu, UserRole, UserInfo, DeptInfo, SystemConfig
+from common.utils.connection import RedisPubSub
+from system.models import Menu, UserRole, UserInfo, DeptInfo, SystemConfig, DataPermission, DeptClosure
 from system.signal import invalid_user_cache_signal
 
 logger = get_logger(__name__)
 
 
-def get_cache_data_keys(pks):
-    for pk in pks:
-        for method in ["GET", "PUT", "DELETE", "POST", "PATCH"]:
-            yield f'get_user_permission_{pk}_{method}'
+class MenuChangeSubPub(LazyObject):
+    def _setup(self):
+        self._wrapped = RedisPubSub('system.MenuChange')
+
 
+menu_change_pub_sub = MenuChangeSubPub()
 
-def get_cache_response_keys(pks):
-    for pk in pks:
-        yield f'UserRoutesAPIView_get_{pk}'
 
+# 用户角色集合及权限，路由缓存标签，参考 get_user_cache_tags, get_role_cache_tags
+cache_tag_prefixes = {UserRole: 'role', DeptInfo: 'dept', UserInfo: 'user'}
 
-def batch_invalid_cache(pks, batch_length=1000):
-    cleans = [
-        (MagicCacheData.invalid_caches, get_cache_data_keys(pks)),
-        (cache_response.invalid_caches, get_cache_response_keys(pks))
-    ]
-    for keys in cleans:
-        for data in itertools.batched(keys[1], batch_length):
-            keys[0](data)
+
+def get_cache_tag(model, pk):
+    if model is Menu:
+        return 'menu'
+    return f"{cache_tag_prefixes[model]}:{pk}"
 
 
 @receiver([post_save, pre_delete], sender=Menu)
 def clean_cache_handler(sender, instance, **kwargs):
-    batch_invalid_cache(UserInfo.objects.filter(is_superuser=True).values_list('pk', flat=True))
-    pk1 = UserRole.objects.filter(menu=instance, userinfo__isnull=False).values_list('userinfo', flat=True).distinct()
-    pk2 = DeptInfo.objects.filter(roles__menu=instance).values_list('dept_query', flat=True).distinct()
-    batch_invalid_cache(set(pk1) | set(pk2))
+    MagicCacheTag.invalid([get_cache_tag(Menu, instance.pk)])
+    permission_route_index.invalid()
+    menu_change_pub_sub.publish(str(instance.pk))
     logger.info(f"invalid cache {instance}")
 
 
+@receiver(django_ready)
+def subscribe_menu_change(sender, **kwargs):
+    logger.debug("Start subscribe menu change")
+
+    menu_change_pub_sub.subscribe(lambda pk: permission_route_index.invalid())
+
+
 @receiver([post_save, pre_delete], sender=SystemConfig)
 def invalid_config_cache_handler(sender, instance, **kwargs):
     SysConfig.invalid_config_cache(instance.key)
@@ -57,24 +63,71 @@ def invalid_config_cache_handler(sender, instance, **kwargs):
 
 @receiver([post_save, pre_delete], sender=UserRole)
 def invalid_role_cache_handler(sender, instance, **kwargs):
-    pk1 = instance.userinfo_set.values_list('pk', flat=True).distinct()
-    pk2 = DeptInfo.objects.filter(roles=instance).values_list('dept_query', flat=True).distinct()
-    batch_invalid_cache(set(pk1) | set(pk2))
+    MagicCacheTag.invalid([get_cache_tag(UserRole, instance.pk)])
     logger.info(f"invalid cache {instance}")
 
 
+@receiver(m2m_changed, sender=UserRole.menu.through)
+@receiver(m2m_changed, sender=DeptInfo.roles.through)
+@receiver(m2m_changed, sender=UserInfo.roles.through)
+def invalid_role_relation_cache_handler(sender, instance, action, model, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    tags = {get_cache_tag(instance.__class__, instance.pk)}
+    # 新增关联的用户，部门的缓存不包含当前角色标签，需要单独失效
+    if model is not Menu and pk_set:
+        tags.update(get_cache_tag(model, pk) for pk in pk_set)
+    MagicCacheTag.invalid(tags)
+    logger.info(f"invalid role relation cache {instance}")
+
+
+@receiver(post_save, sender=DeptInfo)
+def sync_dept_closure_handler(sender, instance, raw=False, **kwargs):
+    # 部门删除时，闭包表数据级联删除
+    # loaddata 时数据顺序不确定，且逐条重建开销为 O(n²)，跳过同步，导入完成后执行 python manage.py rebuild_dept_closure 重建
+    if raw:
+        return
+    DeptClosure.sync_node(instance)
+
+
 @receiver([post_save, pre_delete], sender=DeptInfo)
 def invalid_dept_cache_handler(sender, instance, **kwargs):
-    batch_invalid_cache(instance.userinfo_set.values_list('pk', flat=True).distinct())
+    MagicCacheTag.invalid([get_cache_tag(DeptInfo, instance.pk)])
+    DataPermissionVersion.incr_version()
     logger.info(f"invalid cache {instance}")
 
 
 @receiver([post_save, pre_delete], sender=UserInfo)
 def invalid_user_cache_handler(sender, instance, **kwargs):
-    batch_invalid_cache([instance.pk])
+    MagicCacheTag.invalid([get_cache_tag(UserInfo, instance.pk)])
+    DataPermissionVersion.incr_version([instance.pk])
     logger.info(f"invalid cache {instance}")
 
 
+@receiver([post_save, pre_delete], sender=DataPermission)
+def invalid_data_permission_cache_handler(sender, instance, **kwargs):
+    DataPermissionVersion.incr_version()
+    logger.info(f"invalid data permission cache {instance}")
+
+
+@receiver(m2m_changed, sender=DataPermission.menu.through)
+@receiver(m2m_changed, sender=DeptInfo.rules.through)
+def invalid_data_permission_m2m_cache_handler(sender, instance, **kwargs):
+    if kwargs.get('action') in ['post_add', 'post_remove', 'post_clear']:
+        DataPermissionVersion.incr_version()
+        logger.info(f"invalid data permission cache {instance}")
+
+
+@receiver(m2m_changed, sender=UserInfo.rules.through)
+def invalid_user_data_permission_cache_handler(sender, instance, **kwargs):
+    if kwargs.get('action') in ['post_add', 'post_remove', 'post_clear']:
+        if isinstance(instance, UserInfo):
+            DataPermissionVersion.incr_version([instance.pk])
+        else:
+            DataPermissionVersion.incr_version()
+        logger.info(f"invalid user data permission cache {instance}")
+
+
 # 清理用户相关缓存，用户登出会自动清理
 @receiver([invalid_user_cache_signal, user_logged_out])
 def invalid_user_cache(sender, **kwargs):
@@ -85,4 +138,4 @@ def invalid_user_cache(sender, **kwargs):
     if user_pk is None:
         return
 
-    batch_invalid_cache([user_pk])
+    MagicCacheTag.invalid([get_cache_tag(UserInfo, user_pk)])
@@ -9,6 +9,7 @@ from celery import shared_task
 
 from common.celery.decorator import register_as_period_task
 from common.utils import get_logger
+from system.models import DailyStatistics
 from system.utils.ctasks import auto_clean_operation_log, auto_clean_black_token, auto_clean_tmp_file
 
 logger = get_logger(__name__)
@@ -30,3 +31,10 @@ def auto_clean_black_token_job():
 @register_as_period_task(crontab='32 2 * * *')
 def auto_clean_tmp_file_job():
     auto_clean_tmp_file(clean_day=7)
+
+
+@shared_task
+@register_as_period_task(interval=600)
+def auto_rollup_daily_statistics_job():
+    # 汇总今天和昨天的数据，昨天的数据可能存在延迟写入
+    DailyStatistics.rollup(days=2)
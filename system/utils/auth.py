@@ -7,20 +7,26 @@
 import ipaddress
 
 from django.conf import settings
+from django.db import close_old_connections
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import APIException
 from user_agents import parse
 
 from captcha.utils import CaptchaAuth
 from common.base.utils import AESCipherV2
-from common.utils.ip import get_ip_city
-from common.utils.request import get_request_ip, get_browser, get_os, get_request_ident
+from common.core.db.buffer import BulkCreateBuffer
+from common.utils import get_logger
+from common.utils.ip import get_ip_city, get_ip_cities
+from common.utils.request import get_request_ip, get_request_ident
 from common.utils.token import verify_token_cache
 from common.utils.verify_code import TokenTempCache, SendAndVerifyCodeUtil
 from settings.utils.security import LoginIpBlockUtil, LoginBlockUtil
 from system.models import UserLoginLog, UserInfo
 from system.notifications import DifferentCityLoginMessage
-from system.serializers.log import LoginLogSerializer
+
+logger = get_logger(__name__)
+
+CITY_WHITE_LIST = [_('LAN'), 'LAN']
 
 
 def get_token_lifetime(user_obj):
@@ -76,23 +82,78 @@ def check_is_block(username, ipaddr, ip_block=LoginIpBlockUtil, login_block=Logi
                              " again after {} minutes)").format(settings.SECURITY_LOGIN_LIMIT_TIME))
 
 
-def save_login_log(request, login_type=UserLoginLog.LoginTypeChoices.USERNAME, status=True, channel_name=""):
+class LoginLogBuffer(BulkCreateBuffer):
+    """
+    登录日志异步写入，请求中只记录原始数据，后台线程批量解析 user agent、查询 ip 归属地并写入数据库
+    异地登录检测也在写入前批量处理，不影响登录接口响应时间
+    """
+
+    def check_different_city(self, items, cities):
+        # 同一批次中较早的登录记录还未写入数据库，按顺序记录用户最近一次登录的城市，批次中没有时再查询数据库
+        last_cities = {}
+        for item in items:
+            user = item['creator']
+            if not user:
+                continue
+            city = cities.get(item['ipaddress'])
+            if item['check_city']:
+                try:
+                    check_different_city_login_if_need(user, item['ipaddress'], city, last_cities.get(user.pk))
+                except Exception as e:
+                    logger.warning(f"check different city login failed. {e}")
+            if item['status'] and city and city not in CITY_WHITE_LIST:
+                last_cities[user.pk] = city
+
+    def write(self, items):
+        try:
+            close_old_connections()
+            cities = get_ip_cities([item['ipaddress'] for item in items])
+            self.check_different_city(items, cities)
+        except Exception as e:
+            logger.error(f"login log enrich failed. {e}")
+            cities = {}
+        objs = []
+        for item in items:
+            user_agent = parse(item['user_agent'])
+            objs.append(UserLoginLog(
+                creator=item['creator'],
+                modifier=item['creator'],
+                dept_belong_id=item['dept_belong_id'],
+                ipaddress=item['ipaddress'],
+                city=str(cities.get(item['ipaddress']) or _("Unknown"))[:254],
+                browser=user_agent.get_browser()[:64],
+                system=user_agent.get_os()[:64],
+                agent=str(user_agent)[:128],
+                channel_name=item['channel_name'][:128],
+                status=item['status'],
+                login_type=item['login_type'],
+            ))
+        super().write(objs)
+
+
+login_log_buffer = LoginLogBuffer(UserLoginLog, batch_size=getattr(settings, 'LOGIN_LOG_BATCH_SIZE', 100),
+                                  interval=getattr(settings, 'LOGIN_LOG_FLUSH_INTERVAL', 1))
+
+
+def save_login_log(request, login_type=UserLoginLog.LoginTypeChoices.USERNAME, status=True, channel_name="",
+                   check_city=False):
+    """
+    记录登录日志，放入缓冲队列，后台线程批量写入
+    :param check_city: 是否进行异地登录检测
+    """
     login_ip = get_request_ip(request) if request else ''
-    login_ip = login_ip or '0.0.0.0'
-    login_city = get_ip_city(login_ip) or _("Unknown")
-    data = {
-        'ipaddress': login_ip,
-        'city': str(login_city),
-        'browser': get_browser(request),
-        'system': get_os(request),
-        'channel_name': channel_name or getattr(request, "channel_name", ""),
+    user = getattr(request, 'user', None)
+    creator = user if isinstance(user, UserInfo) else None
+    login_log_buffer.put({
+        'creator': creator,
+        'dept_belong_id': creator.dept_id if creator else None,
+        'ipaddress': login_ip or '0.0.0.0',
+        'user_agent': request.META.get('HTTP_USER_AGENT', '') if request else '',
+        'channel_name': channel_name or getattr(request, "channel_name", "") or "",
         'status': status,
-        'agent': str(parse(request.META['HTTP_USER_AGENT'])),
-        'login_type': login_type
-    }
-    serializer = LoginLogSerializer(data=data, ignore_field_permission=True)
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
+        'login_type': login_type,
+        'check_city': check_city,
+    })
 
 
 def verify_sms_email_code(request, block_utils):
@@ -137,22 +198,25 @@ def verify_sms_email_code(request, block_utils):
     return query_key, target, verify_token
 
 
-def check_different_city_login_if_need(user, ipaddr):
+def check_different_city_login_if_need(user, ipaddr, city=None, last_city=None):
+    """
+    :param last_city: 用户上一次登录的城市，未传时从登录日志中查询
+    """
     if not settings.SECURITY_CHECK_DIFFERENT_CITY_LOGIN or ipaddr == 'unknown':
         return
 
-    city_white = [_('LAN'), 'LAN']
     is_private = ipaddress.ip_address(ipaddr).is_private
     if is_private:
         return
-    last_user_login = UserLoginLog.objects.exclude(
-        city__in=city_white
-    ).filter(creator=user, status=True).first()
-    if not last_user_login:
-        return
-
-    city = get_ip_city(ipaddr)
-    last_city = get_ip_city(last_user_login.ipaddress)
+    if last_city is None:
+        last_user_login = UserLoginLog.objects.exclude(
+            city__in=CITY_WHITE_LIST
+        ).filter(creator=user, status=True).first()
+        if not last_user_login:
+            return
+        last_city = get_ip_city(last_user_login.ipaddress)
+
+    city = city or get_ip_city(ipaddr)
     if city == last_city:
         return
 
@@ -12,6 +12,7 @@ from rest_framework.decorators import action
 
 from common.core.filter import BaseFilterSet, PkMultipleFilter
 from common.core.modelset import ListDeleteModelSet, OnlyExportDataAction
+from common.core.pagination import DynamicKeysetPagination, CountStrategy
 from common.core.response import ApiResponse
 from common.swagger.utils import get_default_response_schema
 from message.utils import send_logout_msg
@@ -34,6 +35,8 @@ class LoginLogFilter(BaseFilterSet):
 class LoginLogViewSet(ListDeleteModelSet, OnlyExportDataAction):
     """登录日志"""
     queryset = UserLoginLog.objects.all()
+    # 日志数据量大，使用游标分页和估算总数
+    pagination_class = DynamicKeysetPagination(count_strategy=CountStrategy.ESTIMATED)
     serializer_class = LoginLogSerializer
 
     ordering_fields = ['created_time']
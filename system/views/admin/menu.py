@@ -11,7 +11,7 @@ from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiRequest
 from rest_framework.decorators import action
 
-from common.base.magic import temporary_disable_signal
+from common.base.magic import temporary_disable_signal, MagicCacheTag
 from common.core.filter import BaseFilterSet
 from common.core.modelset import BaseModelSet, RankAction, ImportExportDataAction, ChoicesAction, CacheListResponseMixin
 from common.core.pagination import DynamicPageNumber
@@ -20,7 +20,7 @@ from common.core.utils import get_all_url_dict
 from common.swagger.utils import get_default_response_schema
 from system.models import Menu, ModelLabelField
 from system.serializers.menu import MenuSerializer
-from system.signal_handler import clean_cache_handler
+from system.signal_handler import clean_cache_handler, get_cache_tag
 from system.utils.menu import get_view_permissions
 
 
@@ -42,6 +42,13 @@ class MenuViewSet(BaseModelSet, RankAction, ImportExportDataAction, ChoicesActio
     pagination_class = DynamicPageNumber(1000)
     ordering_fields = ['updated_time', 'name', 'created_time', 'rank']
     filterset_class = MenuFilter
+    # 新建菜单默认排序为 9999，间隔不宜过大
+    rank_gap = 8
+
+    def perform_rank(self, data):
+        super().perform_rank(data)
+        # update 不会触发信号，需要手动失效菜单相关缓存
+        MagicCacheTag.invalid([get_cache_tag(Menu, None)])
 
     # @cache_response(timeout=600, key_func='get_cache_key')
     # def list(self, request, *args, **kwargs):
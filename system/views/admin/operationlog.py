@@ -10,6 +10,7 @@ from django_filters import rest_framework as filters
 
 from common.core.filter import BaseFilterSet, PkMultipleFilter
 from common.core.modelset import ListDeleteModelSet, OnlyExportDataAction
+from common.core.pagination import DynamicKeysetPagination, CountStrategy
 from system.models import OperationLog
 from system.serializers.log import OperationLogSerializer
 
@@ -37,6 +38,8 @@ class OperationLogFilter(BaseFilterSet):
 class OperationLogViewSet(ListDeleteModelSet, OnlyExportDataAction):
     """操作日志"""
     queryset = OperationLog.objects.all()
+    # 日志数据量大，使用游标分页和估算总数
+    pagination_class = DynamicKeysetPagination(count_strategy=CountStrategy.ESTIMATED)
     serializer_class = OperationLogSerializer
 
     ordering_fields = ['created_time', 'updated_time', 'exec_time']
@@ -5,7 +5,6 @@
 # author : ly_13
 # date : 8/8/2024
 import hashlib
-import time
 
 from django.contrib.auth import logout
 from drf_spectacular.plumbing import build_object_type, build_basic_type
@@ -14,7 +13,7 @@ from drf_spectacular.utils import extend_schema, OpenApiRequest
 from rest_framework.generics import GenericAPIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from common.cache.storage import BlackAccessTokenCache
+from common.core.auth import token_revocation_filter
 from common.core.response import ApiResponse
 from common.swagger.utils import get_default_response_schema
 
@@ -33,8 +32,7 @@ class LogoutAPIView(GenericAPIView):
             return ApiResponse()
         exp = auth.payload.get('exp')
         user_id = auth.payload.get('user_id')
-        timeout = exp - time.time()
-        BlackAccessTokenCache(user_id, hashlib.md5(auth.token).hexdigest()).set_storage_cache(1, timeout)
+        token_revocation_filter.revoke(user_id, hashlib.md5(auth.token).hexdigest(), exp)
         if request.data.get('refresh'):
             try:
                 token = RefreshToken(request.data.get('refresh'))
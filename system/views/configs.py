@@ -9,6 +9,7 @@ from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiRequest
 from rest_framework.viewsets import GenericViewSet
 
+from common.base.magic import conditional_response
 from common.core.auth import auth_required
 from common.core.config import UserConfig, SysConfig
 from common.core.filter import OwnerUserFilter
@@ -32,6 +33,7 @@ class ConfigsViewSet(GenericViewSet):
     filter_backends = [OwnerUserFilter]
 
     @extend_schema(responses=config_response_schema())
+    @conditional_response()
     def retrieve(self, request, *args, **kwargs):
         """获取{cls}"""
         value_key = self.kwargs[self.lookup_field]
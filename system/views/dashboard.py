@@ -15,11 +15,23 @@ from drf_spectacular.utils import extend_schema
 from rest_framework.decorators import action
 from rest_framework.viewsets import GenericViewSet
 
+from common.core.db.router import use_analytic_db
 from common.core.response import ApiResponse
 from common.swagger.utils import get_default_response_schema
-from system.models import UserLoginLog, OperationLog, UserInfo
+from system.models import UserLoginLog, OperationLog, UserInfo, DailyStatistics
 from system.serializers.log import LoginLogSerializer
 
+MetricChoices = DailyStatistics.MetricChoices
+
+
+def get_trend_percent(results):
+    if len(results) > 1:
+        y = results[-2].get('count')
+        percent = round(100 * (results[-1].get('count') - y) / 1 if y == 0 else y)
+    else:
+        percent = 0
+    return percent
+
 
 def trend_info(queryset, limit_day=30):
     today = timezone.now()
@@ -33,13 +45,19 @@ def trend_info(queryset, limit_day=30):
     for i in range(limit_day, -1, -1):
         date = (today - datetime.timedelta(days=i)).strftime('%m-%d')
         results.append({'day': date, 'count': dict_count[date] if date in dict_count else 0})
-    if len(results) > 1:
-        y = results[-2].get('count')
-        percent = round(100 * (results[-1].get('count') - y) / 1 if y == 0 else y)
-    else:
-        percent = 0
 
-    return results, percent, queryset.count()
+    return results, get_trend_percent(results), queryset.count()
+
+
+def rollup_trend_info(metric, total_metric, limit_day=30):
+    """从每日汇总数据中获取趋势，与 trend_info 返回格式一致"""
+    today = timezone.localdate()
+    data = DailyStatistics.get_values([metric, total_metric], today - datetime.timedelta(days=limit_day))
+    results = []
+    for i in range(limit_day, -1, -1):
+        date = today - datetime.timedelta(days=i)
+        results.append({'day': date.strftime('%m-%d'), 'count': data[metric].get(date, 0)})
+    return results, get_trend_percent(results), data[total_metric].get(today, 0)
 
 
 def get_schema_response(has_count=True):
@@ -70,37 +88,54 @@ class DashboardViewSet(GenericViewSet):
     serializer_class = LoginLogSerializer
     ordering_fields = ['created_time']
 
+    def dispatch(self, request, *args, **kwargs):
+        with use_analytic_db():
+            return super().dispatch(request, *args, **kwargs)
+
+    def use_rollup(self, queryset, metric, total_metric, limit_day):
+        # 不存在数据权限和过滤条件，并且汇总数据覆盖整个查询区间时，读取汇总数据
+        if queryset.query.where:
+            return False
+        start_date = timezone.localdate() - datetime.timedelta(days=limit_day)
+        return DailyStatistics.has_range(metric, start_date) and DailyStatistics.has_today(total_metric)
+
+    def get_trend_info(self, metric, total_metric, limit_day=30):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.use_rollup(queryset, metric, total_metric, limit_day):
+            return rollup_trend_info(metric, total_metric, limit_day)
+        return trend_info(queryset, limit_day)
+
     @extend_schema(responses=get_schema_response())
     @action(methods=['GET'], detail=False, url_path='user-login-total')
     def user_login_total(self, request, *args, **kwargs):
         """{cls}-用户登录"""
-        results, percent, count = trend_info(self.filter_queryset(self.get_queryset()), 7)
+        results, percent, count = self.get_trend_info(MetricChoices.LOGIN, MetricChoices.LOGIN_TOTAL, 7)
         return ApiResponse(results=results, percent=percent, count=count)
 
     @extend_schema(responses=get_schema_response())
     @action(methods=['GET'], detail=False, queryset=UserInfo.objects.all(), url_path='user-total')
     def user_total(self, request, *args, **kwargs):
         """{cls}-用户数量"""
-        results, percent, count = trend_info(self.filter_queryset(self.get_queryset()), 7)
+        results, percent, count = self.get_trend_info(MetricChoices.REGISTER, MetricChoices.USER_TOTAL, 7)
         return ApiResponse(results=results, percent=percent, count=count)
 
     @extend_schema(responses=get_schema_response(False))
     @action(methods=['GET'], detail=False, queryset=UserInfo.objects.all(), url_path='user-registered-trend')
     def user_registered_trend(self, request, *args, **kwargs):
         """{cls}-注册报表"""
-        return ApiResponse(data=trend_info(self.filter_queryset(self.get_queryset()))[0])
+        return ApiResponse(data=self.get_trend_info(MetricChoices.REGISTER, MetricChoices.USER_TOTAL)[0])
 
     @extend_schema(responses=get_schema_response(False))
     @action(methods=['GET'], detail=False, url_path='user-login-trend')
     def user_login_trend(self, request, *args, **kwargs):
         """{cls}-登录报表"""
-        return ApiResponse(data=trend_info(self.filter_queryset(self.get_queryset()))[0])
+        return ApiResponse(data=self.get_trend_info(MetricChoices.LOGIN, MetricChoices.LOGIN_TOTAL)[0])
 
     @extend_schema(responses=get_schema_response())
     @action(methods=['GET'], detail=False, queryset=OperationLog.objects.all(), url_path='today-operate-total')
     def today_operate_total(self, request, *args, **kwargs):
         """{cls}-最近操作日志"""
-        results, percent, count = trend_info(self.filter_queryset(self.get_queryset()), 7)
+        results, percent, count = self.get_trend_info(MetricChoices.OPERATION, MetricChoices.OPERATION_TOTAL, 7)
         return ApiResponse(results=results, percent=percent, count=count)
 
     @extend_schema(
@@ -117,6 +152,17 @@ class DashboardViewSet(GenericViewSet):
         active_date_list = [1, 3, 7, 30]
         results = []
         queryset = self.filter_queryset(self.get_queryset())
+        if self.use_rollup(queryset, MetricChoices.REGISTER, MetricChoices.ACTIVE_30, max(active_date_list) - 1):
+            local_today = timezone.localdate()
+            active_metrics = {day: metric for metric, day in DailyStatistics.active_metrics.items()}
+            data = DailyStatistics.get_values([MetricChoices.REGISTER, *active_metrics.values()],
+                                              local_today - datetime.timedelta(days=max(active_date_list) - 1))
+            for date in active_date_list:
+                x_day = local_today - datetime.timedelta(days=date - 1)
+                x_day_register_user = sum(v for k, v in data[MetricChoices.REGISTER].items() if k >= x_day)
+                x_day_active_user = data[active_metrics[date]].get(local_today, 0)
+                results.append([date, x_day_register_user, x_day_active_user])
+            return ApiResponse(data=results)
         for date in active_date_list:
             x_day = today - datetime.timedelta(days=date - 1, hours=today.hour, minutes=today.minute,
                                                seconds=today.second, microseconds=today.microsecond)
@@ -10,9 +10,9 @@ from rest_framework.generics import GenericAPIView
 from common.base.magic import cache_response
 from common.base.utils import menu_list_to_tree, format_menu_data
 from common.core.modelset import CacheDetailResponseMixin
-from common.core.permission import get_user_menu_queryset
+from common.core.permission import get_user_menu_queryset, get_user_role_set, get_role_cache_tags
 from common.core.response import ApiResponse
-from system.models import Menu
+from system.models import Menu, UserInfo
 from system.serializers.route import RouteSerializer
 
 
@@ -29,8 +29,31 @@ def get_auths(user):
 class UserRoutesAPIView(GenericAPIView, CacheDetailResponseMixin):
     """获取菜单路由"""
 
+    @staticmethod
+    def get_role_set(user_obj):
+        if user_obj.is_superuser:
+            return 'superuser', ()
+        return get_user_role_set(user_obj)
+
+    def get_cache_key(self, view_instance, view_method, request, args, kwargs):
+        # 路由数据仅与角色集合相关，相同角色组合的用户共享缓存
+        func_name = f'{view_instance.__class__.__name__}_{view_method.__name__}'
+        return f"{func_name}_{self.get_role_set(request.user)[0]}"
+
+    def get_cache_tags(self, view_instance, view_method, request, args, kwargs):
+        role_key, role_pks = self.get_role_set(request.user)
+        func_name = f'{view_instance.__class__.__name__}_{view_method.__name__}'
+        return get_role_cache_tags(role_pks) + [f"{func_name}:{role_key}"]
+
+    @classmethod
+    def invalid_cache(cls, pk, methods=None):
+        # 路由缓存按角色集合共享，通过用户的角色集合失效
+        user_obj = UserInfo.objects.filter(pk=pk).first()
+        if user_obj:
+            super().invalid_cache(cls.get_role_set(user_obj)[0], methods)
+
     @extend_schema(exclude=True)
-    @cache_response(timeout=3600 * 24, key_func='get_cache_key')
+    @cache_response(timeout=3600 * 24, key_func='get_cache_key', tags_func='get_cache_tags')
     def get(self, request):
         route_list = []
         user_obj = request.user